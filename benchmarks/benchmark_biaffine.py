@@ -0,0 +1,143 @@
+import json
+import time
+import platform
+
+import fire
+import torch
+
+from modules.scorers.biaffine import biaffine_score, factorize_biaffine, low_rank_biaffine_score
+
+
+def einsum_biaffine_score(head_repr, U, tail_repr):
+    """einsum_biaffine_score is the three-operand einsum formulation of biaffine scoring, as the baseline
+    """
+
+    return torch.einsum('bxi, oij, byj -> boxy', head_repr, U, tail_repr).permute(0, 2, 3, 1)
+
+
+def time_scorer(scorer, head_repr, tail_repr, backward, repeats, device):
+    """time_scorer times a scorer, the softmax over labels is included as the consumer of the layout
+
+    Args:
+        scorer (function): (head_repr, tail_repr) -> scores
+        head_repr (tensor): head representations
+        tail_repr (tensor): tail representations
+        backward (bool): time forward and backward or forward only
+        repeats (int): number of timed calls
+        device (int): device = -1 if cpu, device >= 0 if gpu
+
+    Returns:
+        float: milliseconds per call
+    """
+
+    def run():
+        if backward:
+            torch.softmax(scorer(head_repr, tail_repr), dim=-1).sum().backward()
+        else:
+            with torch.no_grad():
+                torch.softmax(scorer(head_repr, tail_repr), dim=-1)
+
+    run()
+    if device > -1:
+        torch.cuda.synchronize(device)
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        run()
+    if device > -1:
+        torch.cuda.synchronize(device)
+    return (time.perf_counter() - start_time) / repeats * 1000
+
+
+def run(num_labels=14,
+        hidden_size=150,
+        batch_size=32,
+        seq_lens=(20, 50, 100),
+        ranks=(16, 32, 64),
+        model_path=None,
+        backward=False,
+        repeats=20,
+        device=-1,
+        output_file=None,
+        seed=5216):
+    """run compares the einsum biaffine scoring with the projected scoring of `modules.scorers.biaffine`
+    and its low-rank variants, the default label count is the one of ACE2004/ACE2005/SciERC (14 with `None`)
+
+    Args:
+        num_labels (int, optional): number of joint labels. Defaults to 14.
+        hidden_size (int, optional): mlp hidden size (the biaffine size is hidden_size + 1). Defaults to 150.
+        batch_size (int, optional): batch size. Defaults to 32.
+        seq_lens (tuple, optional): sentence lengths. Defaults to (20, 50, 100).
+        ranks (tuple, optional): ranks of the low-rank factorization. Defaults to (16, 32, 64).
+        model_path (str, optional): trained model whose `U` is factorized instead of a random one,
+            the low-rank error of a random `U` is pessimistic. Defaults to None.
+        backward (bool, optional): time forward and backward or forward only. Defaults to False.
+        repeats (int, optional): number of timed calls. Defaults to 20.
+        device (int, optional): device = -1 if cpu, device >= 0 if gpu. Defaults to -1.
+        output_file (str, optional): json lines file the results are appended to. Defaults to None.
+        seed (int, optional): random seed. Defaults to 5216.
+    """
+
+    # fire parses a single value as a scalar
+    seq_lens = [seq_lens] if isinstance(seq_lens, int) else seq_lens
+    ranks = [ranks] if isinstance(ranks, int) else ranks
+
+    torch.manual_seed(seed)
+    device_name = 'cuda:{}'.format(device) if device > -1 else 'cpu'
+    if model_path is not None:
+        U = torch.load(model_path, map_location='cpu')['U'].to(device_name)
+        num_labels, hidden_size = U.size(0), U.size(1) - 1
+    else:
+        U = torch.randn(num_labels, hidden_size + 1, hidden_size + 1, device=device_name) / (hidden_size + 1)
+    U.requires_grad_(backward)
+
+    scorers = [('einsum', lambda head_repr, tail_repr: einsum_biaffine_score(head_repr, U, tail_repr)),
+               ('projected', lambda head_repr, tail_repr: biaffine_score(head_repr, U, tail_repr))]
+    for rank in ranks:
+        head_U, tail_U = factorize_biaffine(U.detach(), rank)
+        scorers.append(('rank_{}'.format(rank),
+                        lambda head_repr, tail_repr, head_U=head_U, tail_U=tail_U: low_rank_biaffine_score(
+                            head_repr, head_U, tail_U, tail_repr)))
+
+    results = []
+    for seq_len in seq_lens:
+        head_repr = torch.randn(batch_size, seq_len, hidden_size + 1, device=device_name, requires_grad=backward)
+        tail_repr = torch.randn(batch_size, seq_len, hidden_size + 1, device=device_name, requires_grad=backward)
+        with torch.no_grad():
+            reference = einsum_biaffine_score(head_repr, U, tail_repr)
+
+        for name, scorer in scorers:
+            with torch.no_grad():
+                score = scorer(head_repr, tail_repr)
+            result = {
+                'scorer': name,
+                'seq_len': seq_len,
+                'ms_per_call': time_scorer(scorer, head_repr, tail_repr, backward, repeats, device),
+                'max_abs_error': (score - reference).abs().max().item(),
+                'argmax_agreement': (score.argmax(dim=-1) == reference.argmax(dim=-1)).float().mean().item()
+            }
+            results.append(result)
+            print("n={:<5} {:<10} {:9.3f} ms  max abs error {:.2e}  argmax agreement {:.4f}".format(
+                seq_len, name, result['ms_per_call'], result['max_abs_error'], result['argmax_agreement']))
+
+    if output_file is not None:
+        run_results = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': {
+                'torch': torch.__version__,
+                'device': torch.cuda.get_device_name(device) if device > -1 else platform.processor(),
+                'num_threads': torch.get_num_threads()
+            },
+            'settings': {
+                'num_labels': num_labels,
+                'hidden_size': hidden_size,
+                'batch_size': batch_size,
+                'backward': backward,
+                'model_path': model_path
+            },
+            'results': results
+        }
+        with open(output_file, 'a', encoding='utf-8') as fout:
+            print(json.dumps(run_results), file=fout)
+
+if __name__ == '__main__':
+    fire.Fire({"run": run})
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import random
+import logging
+import platform
+import itertools
+import subprocess
+
+import torch
+import numpy as np
+
+from entity_relation_joint_decoder import get_fields, get_bucket_namespace, build_dataset, tensorize_batch, step
+from utils.argparse import ConfigurationParer
+from utils.eval import eval_file, JointEvaluator
+from utils.instrumentation import PhaseTimer
+from utils.prediction_outputs import print_predictions_for_joint_decoding, ColumnarPredictionWriter
+from inputs.dataset_readers.ace_reader_for_joint_decoding import ACEReaderForJointDecoding
+from models.joint_decoding.joint_decoder import EntRelJointDecoder
+
+logger = logging.getLogger(__name__)
+
+
+def timed_batches(timer, name, batches):
+    """timed_batches times collating every batch of a batch generator as a phase
+
+    Args:
+        timer (PhaseTimer): timer
+        name (str): phase name
+        batches (generator): (epoch, batch) generator
+
+    Yields:
+        dict: batch data
+    """
+
+    while True:
+        start_time = time.perf_counter()
+        try:
+            _, batch = next(batches)
+        except StopIteration:
+            return
+        timer.add(name, time.perf_counter() - start_time, len(batch['tokens_lens']))
+        yield batch
+
+
+def benchmark_dataset(cfg, timer, fields, max_len, ent_rel_file):
+    """benchmark_dataset times reading the data files and building the dataset
+
+    Args:
+        cfg (dict): config parameters
+        timer (PhaseTimer): timer
+        fields (list): fields
+        max_len (dict): max length for some namespace
+        ent_rel_file (dict): entity and relation file
+
+    Returns:
+        Dataset: dataset
+    """
+
+    for file_path in [cfg.train_file, cfg.dev_file, cfg.test_file]:
+        reader = ACEReaderForJointDecoding(file_path, False, max_len, not cfg.sparse_joint_label)
+        with timer.time('read'):
+            for _ in reader:
+                pass
+        # items are only known after reading
+        timer.phases['read']['items'] += len(reader.get_seq_lens()['tokens'])
+
+    with timer.time('build_dataset'):
+        dataset = build_dataset(cfg, fields, max_len, ent_rel_file)
+    timer.phases['build_dataset']['items'] += sum(
+        dataset.get_dataset_size(instance_name) for instance_name in ['train', 'dev', 'test'])
+
+    dataset.set_wo_padding_namespace(wo_padding_namespace=["separate_positions", "span2ent", "span2rel"])
+    return dataset
+
+
+def benchmark_train(cfg, timer, dataset, model, num_batches):
+    """benchmark_train times collating, tensorizing, forward and backward of training batches,
+    parameters are not updated
+
+    Args:
+        cfg (dict): config parameters
+        timer (PhaseTimer): timer
+        dataset (Dataset): dataset
+        model (nn.Module): model
+        num_batches (int): number of batches
+    """
+
+    model.train()
+    batches = dataset.get_batch('train', cfg.train_batch_size, None, get_bucket_namespace(cfg), cfg.max_batch_cost)
+    for batch in itertools.islice(timed_batches(timer, 'get_batch', batches), num_batches):
+        batch_size = len(batch['tokens_lens'])
+
+        with timer.time('tensorize', batch_size):
+            tensorize_batch(batch, model.none_idx, cfg.device)
+
+        with timer.time('forward', batch_size):
+            element_loss, symmetric_loss, implication_loss = step(cfg, model, batch, cfg.device)
+            loss = element_loss + symmetric_loss + implication_loss
+
+        with timer.time('backward', batch_size):
+            loss.backward()
+        model.zero_grad()
+
+
+def get_saved_activation_mb(cfg, model, batch):
+    """get_saved_activation_mb runs the forward of one training batch and measures the activations
+    kept for backward: the tensors saved by autograd (pytorch >= 1.10), parameters excluded,
+    otherwise the cuda memory still allocated after forward
+
+    Args:
+        cfg (dict): config parameters
+        model (nn.Module): model
+        batch (dict): batch data
+
+    Returns:
+        float: activation memory in MB, None if it can not be measured
+    """
+
+    saved_tensors_hooks = getattr(getattr(torch.autograd, 'graph', None), 'saved_tensors_hooks', None)
+    if saved_tensors_hooks is not None:
+        param_ptrs = {param.data_ptr() for param in model.parameters()}
+        saved = {}
+
+        def pack(tensor):
+            if tensor.data_ptr() not in param_ptrs:
+                saved[tensor.data_ptr()] = max(saved.get(tensor.data_ptr(), 0), tensor.numel() * tensor.element_size())
+            return tensor
+
+        with saved_tensors_hooks(pack, lambda tensor: tensor):
+            losses = step(cfg, model, batch, cfg.device)
+        del losses
+        return sum(saved.values()) / 2**20
+
+    if cfg.device > -1:
+        allocated = torch.cuda.memory_allocated(cfg.device)
+        losses = step(cfg, model, batch, cfg.device)
+        activation_mb = (torch.cuda.memory_allocated(cfg.device) - allocated) / 2**20
+        del losses
+        return activation_mb
+
+    return None
+
+
+def benchmark_memory(cfg, dataset, model, num_batches):
+    """benchmark_memory measures the activation memory per training step without and with
+    the gradient checkpointing of `cfg.gradient_checkpointing` on the same batches
+
+    Args:
+        cfg (dict): config parameters
+        dataset (Dataset): dataset
+        model (nn.Module): model
+        num_batches (int): number of batches
+
+    Returns:
+        dict: mean activation memory per step of both settings and the memory saved per step
+    """
+
+    model.train()
+    batches = dataset.get_batch('train', cfg.train_batch_size, None, get_bucket_namespace(cfg), cfg.max_batch_cost)
+    activation_mb = {'none': [], 'checkpointing': []}
+    for _, batch in itertools.islice(batches, num_batches):
+        for setting, modules in [('none', None), ('checkpointing', cfg.gradient_checkpointing)]:
+            model.set_gradient_checkpointing(modules)
+            activation_mb[setting].append(get_saved_activation_mb(cfg, model, batch))
+    model.set_gradient_checkpointing(cfg.gradient_checkpointing)
+
+    if None in activation_mb['none']:
+        logger.error("activation memory on cpu can only be measured with pytorch >= 1.10.")
+        return None
+
+    results = {setting: sum(values) / len(values) for setting, values in activation_mb.items()}
+    results['saved_mb_per_step'] = results['none'] - results['checkpointing']
+    logger.info("Activation memory per step: {:.1f} MB, with checkpointing {}: {:.1f} MB, saved {:.1f} MB.".format(
+        results['none'], ' '.join(cfg.gradient_checkpointing), results['checkpointing'],
+        results['saved_mb_per_step']))
+    return results
+
+
+def benchmark_eval(cfg, timer, dataset, model, instance_name):
+    """benchmark_eval times evaluating one instance: collating, tensorizing, forward (including decoding),
+    soft joint decoding alone, in-memory evaluation, prediction writing and `eval_file`
+
+    Args:
+        cfg (dict): config parameters
+        timer (PhaseTimer): timer
+        dataset (Dataset): dataset
+        model (nn.Module): model
+        instance_name (str): instance name
+    """
+
+    model.eval()
+    decoding = 'batched_soft_joint_decoding' if cfg.device_decoding else 'soft_joint_decoding'
+    setattr(model, decoding, timer.wrap('soft_joint_decoding', getattr(model, decoding)))
+
+    eval_metrics = ['joint-label', 'separate-position', 'ent', 'exact-rel']
+    evaluator = JointEvaluator(dataset.vocab, eval_metrics)
+    outputs = []
+    batches = dataset.get_batch(instance_name, cfg.test_batch_size, None, get_bucket_namespace(cfg),
+                                cfg.max_batch_cost)
+    for batch in timed_batches(timer, 'eval_get_batch', batches):
+        batch_size = len(batch['tokens_lens'])
+
+        with timer.time('eval_tensorize', batch_size):
+            tensorize_batch(batch, model.none_idx, cfg.device)
+
+        with timer.time('eval_forward', batch_size), torch.no_grad():
+            batch_outputs = step(cfg, model, batch, cfg.device)
+
+        with timer.time('joint_evaluator', batch_size):
+            evaluator.update(batch_outputs)
+            evaluator.update_joint_label(batch['joint_label_matrix'], batch['joint_label_preds'],
+                                         batch['joint_label_matrix_mask'])
+        outputs.extend(batch_outputs)
+    if 'soft_joint_decoding' in timer.phases:
+        timer.phases['soft_joint_decoding']['items'] = len(outputs)
+    delattr(model, decoding)
+
+    output_file = os.path.join(cfg.save_dir, instance_name + ".output")
+    with timer.time('write_text_predictions', len(outputs)):
+        print_predictions_for_joint_decoding(outputs, output_file, dataset.vocab)
+
+    with timer.time('write_columnar_predictions', len(outputs)):
+        writer = ColumnarPredictionWriter(os.path.join(cfg.save_dir, instance_name + ".predictions"), dataset.vocab)
+        writer.write(outputs)
+        writer.close()
+
+    with timer.time('eval_file', len(outputs)):
+        eval_file(output_file, eval_metrics)
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    # config settings
+    parser = ConfigurationParer()
+    parser.add_save_cfgs()
+    parser.add_data_cfgs()
+    parser.add_model_cfgs()
+    parser.add_optimizer_cfgs()
+    parser.add_run_cfgs()
+    parser.add_benchmark_cfgs()
+
+    cfg = parser.parse_args()
+    logger.info(parser.format_values())
+
+    # predictions are always written in both formats for timing
+    cfg.write_predictions = True
+    cfg.prediction_format = ['text', 'columnar']
+
+    # set random seed
+    random.seed(cfg.seed)
+    torch.manual_seed(cfg.seed)
+    np.random.seed(cfg.seed)
+    if cfg.device > -1 and not torch.cuda.is_available():
+        logger.error('config conflicts: no gpu available, use cpu for benchmark.')
+        cfg.device = -1
+    if cfg.device > -1:
+        torch.cuda.manual_seed(cfg.seed)
+    if cfg.precision == 'fp16' and cfg.device == -1:
+        logger.error('config conflicts: fp16 autocast requires gpu, use bf16 on cpu.')
+        cfg.precision = 'bf16'
+
+    timer = PhaseTimer(cfg.device)
+    fields = get_fields(cfg)
+    max_len = {'tokens': cfg.max_sent_len, 'wordpiece_tokens': cfg.max_wordpiece_len}
+    ent_rel_file = json.load(open(cfg.ent_rel_file, 'r', encoding='utf-8'))
+    dataset = benchmark_dataset(cfg, timer, fields, max_len, ent_rel_file)
+
+    model = EntRelJointDecoder(cfg=cfg, vocab=dataset.vocab, ent_rel_file=ent_rel_file)
+    if cfg.device > -1:
+        model.cuda(device=cfg.device)
+
+    benchmark_train(cfg, PhaseTimer(cfg.device), dataset, model, cfg.benchmark_warmup_batches)
+    benchmark_train(cfg, timer, dataset, model, cfg.benchmark_batches)
+    benchmark_eval(cfg, timer, dataset, model, 'dev')
+    activation_memory = benchmark_memory(cfg, dataset, model,
+                                         cfg.benchmark_batches) if cfg.gradient_checkpointing else None
+
+    results = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': get_git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'device': torch.cuda.get_device_name(cfg.device) if cfg.device > -1 else platform.processor(),
+            'num_threads': torch.get_num_threads()
+        },
+        'settings': {
+            name: getattr(cfg, name)
+            for name in [
+                'data_dir', 'embedding_model', 'bert_model_name', 'mlp_hidden_size', 'train_batch_size',
+                'test_batch_size', 'bucket_batching', 'max_batch_cost', 'sparse_joint_label', 'compact_storage',
+                'device_decoding', 'precision', 'gradient_checkpointing', 'biaffine_rank', 'candidate_scoring_rank',
+                'benchmark_batches', 'benchmark_warmup_batches'
+            ]
+        },
+        'dataset': {
+            instance_name: dataset.get_dataset_size(instance_name)
+            for instance_name in ['train', 'dev', 'test']
+        },
+        'phases': timer.get_results(),
+        'activation_memory': activation_memory
+    }
+
+    with open(os.path.join(cfg.save_dir, cfg.benchmark_file), 'a', encoding='utf-8') as fout:
+        print(json.dumps(results), file=fout)
+
+    for name, phase in results['phases'].items():
+        logger.info("{:<28} {:10.4f}s {:6d} calls {:10.1f} items/s".format(name, phase['seconds'], phase['calls'],
+                                                                             phase.get('items_per_second', 0.0)))
+    logger.info("Save benchmark results into {} successfully.".format(os.path.join(cfg.save_dir,
+                                                                                    cfg.benchmark_file)))
+
+
+if __name__ == '__main__':
+    main()
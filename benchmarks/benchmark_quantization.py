@@ -0,0 +1,200 @@
+import io
+import os
+import json
+import time
+import logging
+import platform
+import itertools
+
+import torch
+
+from entity_relation_joint_decoder import get_fields, get_bucket_namespace, build_test_dataset, step
+from utils.argparse import ConfigurationParer
+from utils.eval import JointEvaluator
+from models.joint_decoding.joint_decoder import EntRelJointDecoder
+from benchmarks.benchmark_pipeline import get_git_commit
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATIONS = ['fp32', 'int8', 'int8_biaffine']
+
+
+def load_model(cfg, vocab, ent_rel_file, quantization):
+    """load_model loads the trained model (`best_model`) and quantizes it
+
+    Args:
+        cfg (dict): config parameters
+        vocab (Vocabulary): vocabulary
+        ent_rel_file (dict): entity and relation file
+        quantization (str): `fp32`, `int8` (encoder and mlps) or `int8_biaffine` (also the biaffine weights)
+
+    Returns:
+        EntRelJointDecoder: model in evaluation mode
+    """
+
+    model = EntRelJointDecoder(cfg=cfg, vocab=vocab, ent_rel_file=ent_rel_file)
+    state_dict = torch.load(open(cfg.best_model_path, 'rb'), map_location=lambda storage, loc: storage)
+    model.load_state_dict(state_dict)
+    if quantization != 'fp32':
+        model.quantize_int8(biaffine=quantization == 'int8_biaffine')
+    model.eval()
+    return model
+
+
+def get_model_size_mb(model):
+    """get_model_size_mb gets the size of the serialized state dict
+
+    Args:
+        model (nn.Module): model
+
+    Returns:
+        float: size in MB
+    """
+
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+
+def benchmark_inference(cfg, dataset, model, instance_name):
+    """benchmark_inference evaluates one instance and times the forward (including decoding),
+    after `benchmark_warmup_batches` untimed batches
+
+    Args:
+        cfg (dict): config parameters
+        dataset (Dataset): dataset
+        model (nn.Module): model
+        instance_name (str): instance name
+
+    Returns:
+        list: sentence outputs ordered by sample id
+        dict: throughput and f1 scores
+    """
+
+    batches = dataset.get_batch(instance_name, cfg.test_batch_size, None, get_bucket_namespace(cfg))
+    for _, batch in itertools.islice(batches, cfg.benchmark_warmup_batches):
+        with torch.no_grad():
+            step(cfg, model, batch, cfg.device)
+
+    eval_metrics = ['joint-label', 'separate-position', 'ent', 'exact-rel']
+    evaluator = JointEvaluator(dataset.vocab, eval_metrics)
+    outputs = []
+    seconds = 0.0
+    for _, batch in dataset.get_batch(instance_name, cfg.test_batch_size, None, get_bucket_namespace(cfg)):
+        start_time = time.perf_counter()
+        with torch.no_grad():
+            batch_outputs = step(cfg, model, batch, cfg.device)
+        seconds += time.perf_counter() - start_time
+
+        evaluator.update(batch_outputs)
+        evaluator.update_joint_label(batch['joint_label_matrix'], batch['joint_label_preds'],
+                                     batch['joint_label_matrix_mask'])
+        outputs.extend(batch_outputs)
+
+    _, separate_position_score, ent_score, exact_rel_score = evaluator.report()
+    results = {
+        'seconds': seconds,
+        'sentences_per_second': len(outputs) / seconds,
+        'separate_position_f1': separate_position_score,
+        'ent_f1': ent_score,
+        'exact_rel_f1': exact_rel_score
+    }
+    return sorted(outputs, key=lambda sent_output: sent_output['sample_id']), results
+
+
+def get_agreement(outputs, reference_outputs):
+    """get_agreement counts the sentences whose predictions are the same as the reference predictions
+
+    Args:
+        outputs (list): sentence outputs
+        reference_outputs (list): reference sentence outputs
+
+    Returns:
+        dict: rate of sentences with the same entities, and with the same entities and relations
+    """
+
+    same_ents = [
+        sent_output['all_ent_preds'] == reference['all_ent_preds']
+        for sent_output, reference in zip(outputs, reference_outputs)
+    ]
+    same_rels = [
+        same_ent and sent_output['all_rel_preds'] == reference['all_rel_preds']
+        for same_ent, sent_output, reference in zip(same_ents, outputs, reference_outputs)
+    ]
+    return {
+        'same_ent_rate': sum(same_ents) / max(len(outputs), 1),
+        'same_ent_rel_rate': sum(same_rels) / max(len(outputs), 1)
+    }
+
+
+def main():
+    # config settings
+    parser = ConfigurationParer()
+    parser.add_save_cfgs()
+    parser.add_data_cfgs()
+    parser.add_model_cfgs()
+    parser.add_optimizer_cfgs()
+    parser.add_run_cfgs()
+    parser.add_benchmark_cfgs()
+
+    cfg = parser.parse_args()
+    logger.info(parser.format_values())
+
+    # dynamic int8 quantization is compared with fp32 on cpu, only dev data is read
+    if cfg.device > -1:
+        logger.error('config conflicts: int8 inference runs on cpu only, use cpu for benchmark.')
+        cfg.device = -1
+    if cfg.precision != 'fp32':
+        logger.error('config conflicts: int8 inference runs without autocast, use fp32.')
+        cfg.precision = 'fp32'
+    cfg.test_instances = ['dev']
+    cfg.write_predictions = False
+
+    fields = get_fields(cfg)
+    max_len = {'tokens': cfg.max_sent_len, 'wordpiece_tokens': cfg.max_wordpiece_len}
+    ent_rel_file = json.load(open(cfg.ent_rel_file, 'r', encoding='utf-8'))
+    dataset = build_test_dataset(cfg, fields, max_len)
+    dataset.set_wo_padding_namespace(wo_padding_namespace=["separate_positions", "span2ent", "span2rel"])
+
+    results = {}
+    reference_outputs = None
+    for quantization in QUANTIZATIONS:
+        model = load_model(cfg, dataset.vocab, ent_rel_file, quantization)
+        outputs, results[quantization] = benchmark_inference(cfg, dataset, model, 'dev')
+        results[quantization]['model_size_mb'] = get_model_size_mb(model)
+        if reference_outputs is None:
+            reference_outputs = outputs
+        results[quantization].update(get_agreement(outputs, reference_outputs))
+
+    with open(os.path.join(cfg.save_dir, cfg.benchmark_file), 'a', encoding='utf-8') as fout:
+        print(json.dumps({
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_commit': get_git_commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'torch': torch.__version__,
+                'device': platform.processor(),
+                'num_threads': torch.get_num_threads(),
+                'quantized_engine': torch.backends.quantized.engine
+            },
+            'settings': {
+                name: getattr(cfg, name)
+                for name in ['data_dir', 'embedding_model', 'bert_model_name', 'mlp_hidden_size', 'test_batch_size']
+            },
+            'quantization': results
+        }),
+              file=fout)
+
+    logger.info("{:<14} {:>10} {:>10} {:>8} {:>8} {:>10} {:>10}".format('quantization', 'sents/s', 'size(MB)',
+                                                                         'ent F1', 'rel F1', 'same ent',
+                                                                         'same rel'))
+    for quantization, result in results.items():
+        logger.info("{:<14} {:10.1f} {:10.1f} {:8.4f} {:8.4f} {:10.4f} {:10.4f}".format(
+            quantization, result['sentences_per_second'], result['model_size_mb'], result['ent_f1'],
+            result['exact_rel_f1'], result['same_ent_rate'], result['same_ent_rel_rate']))
+    logger.info("Save quantization benchmark results into {} successfully.".format(
+        os.path.join(cfg.save_dir, cfg.benchmark_file)))
+
+
+if __name__ == '__main__':
+    main()
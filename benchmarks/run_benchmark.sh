@@ -0,0 +1,10 @@
+#!/bin/bash
+
+if [ ! -d benchmarks/data ]; then
+    python -m benchmarks.synthetic_data generate benchmarks/data
+fi
+
+python -m benchmarks.benchmark_pipeline \
+    --config_file benchmarks/benchmark.yml \
+    --log_file benchmark_$(date +%Y%m%d%H%M%S).log \
+    "$@"
@@ -0,0 +1,293 @@
+import os
+import json
+import random
+
+import fire
+import torch
+from transformers import BertConfig, BertModel
+
+SPECIAL_TOKENS = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]']
+
+
+def get_ent_rel_file(num_ent_labels, num_rel_labels, num_symmetric_rel_labels=1):
+    """get_ent_rel_file defines the synthetic entity and relation labels,
+    in the same format as `ent_rel_file.json` of the processed datasets
+
+    Args:
+        num_ent_labels (int): number of entity labels
+        num_rel_labels (int): number of relation labels
+        num_symmetric_rel_labels (int, optional): number of symmetric relation labels. Defaults to 1.
+
+    Returns:
+        dict: entity and relation file
+    """
+
+    ent_rel_id = {'None': 0}
+    for idx in range(num_ent_labels):
+        ent_rel_id['ENT{}'.format(idx)] = len(ent_rel_id)
+    for idx in range(num_rel_labels):
+        ent_rel_id['REL{}'.format(idx)] = len(ent_rel_id)
+
+    entity = list(range(1, num_ent_labels + 1))
+    relation = list(range(num_ent_labels + 1, num_ent_labels + num_rel_labels + 1))
+    return {
+        'id': ent_rel_id,
+        'entity': entity,
+        'relation': relation,
+        'symmetric': entity + relation[:num_symmetric_rel_labels],
+        'asymmetric': relation[num_symmetric_rel_labels:],
+        'count': [0] * len(ent_rel_id)
+    }
+
+
+def get_words(vocab_size, subword_rate):
+    """get_words defines the synthetic words and their wordpieces,
+    the first `subword_rate` of words are split into two wordpieces
+
+    Args:
+        vocab_size (int): number of words
+        subword_rate (float): rate of words split into two wordpieces
+
+    Returns:
+        list: words
+        dict: word to wordpieces
+        list: wordpiece vocabulary
+    """
+
+    words = ['w{}'.format(idx) for idx in range(vocab_size)]
+    num_split_words = int(vocab_size * subword_rate)
+    word2pieces = {
+        word: [word, '##s'] if idx < num_split_words else [word]
+        for idx, word in enumerate(words)
+    }
+    wordpiece_vocab = SPECIAL_TOKENS + words + ['##s']
+
+    return words, word2pieces, wordpiece_vocab
+
+
+def sample_sent_len(rng, min_len, max_len, mean_len, std_len):
+    """sample_sent_len samples sentence length from a normal distribution clipped to [min_len, max_len]
+    """
+
+    return int(min(max(round(rng.gauss(mean_len, std_len)), min_len), max_len))
+
+
+def generate_sent(rng, article_id, sent_id, tokens, context, word2pieces, ent_rel_file, ent_density, max_ent_len,
+                  rel_density, dense_joint_label):
+    """generate_sent generates one sentence in the processed ACE format (see `data/process.py`),
+    entities never overlap, and symmetric relations are labeled in both directions
+
+    Args:
+        rng (random.Random): random generator
+        article_id (str): article id
+        sent_id (int): sentence id
+        tokens (list): sentence tokens
+        context (list): context tokens in the first wordpiece segment
+        word2pieces (dict): word to wordpieces
+        ent_rel_file (dict): entity and relation file
+        ent_density (float): probability of an entity starting at a free token
+        max_ent_len (int): max entity length
+        rel_density (float): probability of a relation between two entities
+        dense_joint_label (bool): write the dense joint label matrix or not
+
+    Returns:
+        dict: sentence
+    """
+
+    id2label = {idx: label for label, idx in ent_rel_file['id'].items()}
+    symmetric_label = set(ent_rel_file['symmetric'])
+
+    entity_mentions = []
+    pos = 0
+    while pos < len(tokens):
+        if rng.random() < ent_density:
+            ed = min(pos + rng.randint(1, max_ent_len), len(tokens))
+            entity_mentions.append({
+                'emId': '{}-{}-E{}'.format(article_id, sent_id, len(entity_mentions)),
+                'text': ' '.join(tokens[pos:ed]),
+                'offset': [pos, ed],
+                'label': id2label[rng.choice(ent_rel_file['entity'])]
+            })
+            pos = ed + 1
+        else:
+            pos += 1
+
+    relation_mentions = []
+    for idx1, ent1 in enumerate(entity_mentions):
+        for idx2, ent2 in enumerate(entity_mentions):
+            if idx1 >= idx2 or rng.random() >= rel_density:
+                continue
+            label = rng.choice(ent_rel_file['relation'])
+            if label in symmetric_label:
+                pairs = [(ent1, ent2), (ent2, ent1)]
+            else:
+                pairs = [rng.choice([(ent1, ent2), (ent2, ent1)])]
+            for em1, em2 in pairs:
+                relation_mentions.append({
+                    'em1Id': em1['emId'],
+                    'em1Text': em1['text'],
+                    'em2Id': em2['emId'],
+                    'em2Text': em2['text'],
+                    'label': id2label[label]
+                })
+
+    wordpiece_tokens = ['[CLS]']
+    for token in context:
+        wordpiece_tokens.extend(word2pieces[token])
+    wordpiece_tokens.append('[SEP]')
+    context_len = len(wordpiece_tokens)
+
+    wordpiece_tokens_index = []
+    for token in tokens:
+        wordpiece_tokens_index.append([len(wordpiece_tokens), len(wordpiece_tokens) + len(word2pieces[token])])
+        wordpiece_tokens.extend(word2pieces[token])
+    wordpiece_tokens.append('[SEP]')
+
+    sent = {
+        'articleId': article_id,
+        'sentId': sent_id,
+        'sentText': ' '.join(tokens),
+        'entityMentions': entity_mentions,
+        'relationMentions': relation_mentions,
+        'wordpieceSentText': ' '.join(wordpiece_tokens),
+        'wordpieceTokensIndex': wordpiece_tokens_index,
+        'wordpieceSegmentIds': [0] * context_len + [1] * (len(wordpiece_tokens) - context_len)
+    }
+
+    # the same labeling as `add_joint_label` of `data/process.py`
+    ent_rel_id = ent_rel_file['id']
+    label_matrix = [[ent_rel_id['None']] * len(tokens) for _ in range(len(tokens))]
+    ent2offset = {}
+    for ent in entity_mentions:
+        ent2offset[ent['emId']] = ent['offset']
+        for i in range(ent['offset'][0], ent['offset'][1]):
+            for j in range(ent['offset'][0], ent['offset'][1]):
+                label_matrix[i][j] = ent_rel_id[ent['label']]
+    for rel in relation_mentions:
+        for i in range(ent2offset[rel['em1Id']][0], ent2offset[rel['em1Id']][1]):
+            for j in range(ent2offset[rel['em2Id']][0], ent2offset[rel['em2Id']][1]):
+                label_matrix[i][j] = ent_rel_id[rel['label']]
+    for row in label_matrix:
+        for label in row:
+            ent_rel_file['count'][label] += 1
+    if dense_joint_label:
+        sent['jointLabelMatrix'] = label_matrix
+
+    return sent
+
+
+def save_tiny_bert(output_dir, wordpiece_vocab, hidden_size, num_hidden_layers, num_attention_heads,
+                   max_position_embeddings, seed):
+    """save_tiny_bert saves a randomly initialized bert model and its vocabulary,
+    which can be loaded by `BertModel.from_pretrained` and `BertTokenizer.from_pretrained`
+
+    Args:
+        output_dir (str): output directory
+        wordpiece_vocab (list): wordpiece vocabulary
+        hidden_size (int): hidden size
+        num_hidden_layers (int): number of hidden layers
+        num_attention_heads (int): number of attention heads
+        max_position_embeddings (int): max position embeddings
+        seed (int): random seed of weights
+    """
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    torch.manual_seed(seed)
+    config = BertConfig(vocab_size=len(wordpiece_vocab),
+                        hidden_size=hidden_size,
+                        num_hidden_layers=num_hidden_layers,
+                        num_attention_heads=num_attention_heads,
+                        intermediate_size=4 * hidden_size,
+                        max_position_embeddings=max_position_embeddings)
+    BertModel(config).save_pretrained(output_dir)
+
+    with open(os.path.join(output_dir, 'vocab.txt'), 'w', encoding='utf-8') as fout:
+        for wordpiece in wordpiece_vocab:
+            print(wordpiece, file=fout)
+
+
+def generate(output_dir,
+             num_train=2000,
+             num_dev=500,
+             num_test=500,
+             min_len=5,
+             max_len=60,
+             mean_len=25.0,
+             std_len=12.0,
+             context_len=0,
+             ent_density=0.15,
+             max_ent_len=4,
+             rel_density=0.2,
+             num_ent_labels=7,
+             num_rel_labels=6,
+             num_symmetric_rel_labels=1,
+             vocab_size=1000,
+             subword_rate=0.2,
+             dense_joint_label=True,
+             hidden_size=64,
+             num_hidden_layers=2,
+             num_attention_heads=2,
+             sents_per_article=10,
+             seed=5216):
+    """generate writes a synthetic dataset (`train.json`, `dev.json`, `test.json`, `ent_rel_file.json`)
+    in the processed ACE format and a tiny random bert model (`tiny_bert`) into `output_dir`,
+    so the whole pipeline runs offline
+
+    Args:
+        output_dir (str): output directory
+        num_train (int, optional): number of train sentences. Defaults to 2000.
+        num_dev (int, optional): number of dev sentences. Defaults to 500.
+        num_test (int, optional): number of test sentences. Defaults to 500.
+        min_len (int, optional): min sentence length. Defaults to 5.
+        max_len (int, optional): max sentence length. Defaults to 60.
+        mean_len (float, optional): mean of sentence length. Defaults to 25.0.
+        std_len (float, optional): standard deviation of sentence length. Defaults to 12.0.
+        context_len (int, optional): number of context tokens before the sentence. Defaults to 0.
+        ent_density (float, optional): probability of an entity starting at a free token. Defaults to 0.15.
+        max_ent_len (int, optional): max entity length. Defaults to 4.
+        rel_density (float, optional): probability of a relation between two entities. Defaults to 0.2.
+        num_ent_labels (int, optional): number of entity labels. Defaults to 7.
+        num_rel_labels (int, optional): number of relation labels. Defaults to 6.
+        num_symmetric_rel_labels (int, optional): number of symmetric relation labels. Defaults to 1.
+        vocab_size (int, optional): number of words. Defaults to 1000.
+        subword_rate (float, optional): rate of words split into two wordpieces. Defaults to 0.2.
+        dense_joint_label (bool, optional): write the dense joint label matrix or not. Defaults to True.
+        hidden_size (int, optional): hidden size of the tiny bert. Defaults to 64.
+        num_hidden_layers (int, optional): number of hidden layers of the tiny bert. Defaults to 2.
+        num_attention_heads (int, optional): number of attention heads of the tiny bert. Defaults to 2.
+        sents_per_article (int, optional): number of sentences in one article. Defaults to 10.
+        seed (int, optional): random seed. Defaults to 5216.
+    """
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    rng = random.Random(seed)
+    ent_rel_file = get_ent_rel_file(num_ent_labels, num_rel_labels, num_symmetric_rel_labels)
+    words, word2pieces, wordpiece_vocab = get_words(vocab_size, subword_rate)
+
+    max_wordpiece_len = 0
+    for split, num_sents in [('train', num_train), ('dev', num_dev), ('test', num_test)]:
+        with open(os.path.join(output_dir, split + '.json'), 'w', encoding='utf-8') as fout:
+            for idx in range(num_sents):
+                tokens = [rng.choice(words) for _ in range(sample_sent_len(rng, min_len, max_len, mean_len, std_len))]
+                context = [rng.choice(words) for _ in range(context_len)]
+                sent = generate_sent(rng, '{}-{}'.format(split, idx // sents_per_article), idx % sents_per_article,
+                                     tokens, context, word2pieces, ent_rel_file, ent_density, max_ent_len,
+                                     rel_density, dense_joint_label)
+                max_wordpiece_len = max(max_wordpiece_len, len(sent['wordpieceSentText'].split(' ')))
+                print(json.dumps(sent), file=fout)
+        print("Generate {} {} sentences successfully.".format(num_sents, split))
+
+    with open(os.path.join(output_dir, 'ent_rel_file.json'), 'w', encoding='utf-8') as fout:
+        json.dump(ent_rel_file, fout)
+
+    save_tiny_bert(os.path.join(output_dir, 'tiny_bert'), wordpiece_vocab, hidden_size, num_hidden_layers,
+                   num_attention_heads, max(512, max_wordpiece_len), seed)
+    print("Save tiny bert model {} successfully.".format(os.path.join(output_dir, 'tiny_bert')))
+
+
+if __name__ == '__main__':
+    fire.Fire({"generate": generate})
@@ -97,7 +97,7 @@ def add_joint_label(sent, ent_rel_id):
     sent['jointLabelMatrix'] = label_matrix
 
 
-def process(source_file, ent_rel_file, target_file, pretrained_model, max_length=200):
+def process(source_file, ent_rel_file, target_file, pretrained_model, max_length=200, dense_joint_label=True):
     auto_tokenizer = AutoTokenizer.from_pretrained(pretrained_model)
     print("Load {} tokenizer successfully.".format(pretrained_model))
 
@@ -112,12 +112,14 @@ def process(source_file, ent_rel_file, target_file, pretrained_model, max_length
                 sentences.append(sent)
             else:
                 for new_sent in add_cross_sentence(sentences, auto_tokenizer, max_length):
-                    add_joint_label(new_sent, ent_rel_id)
+                    if dense_joint_label:
+                        add_joint_label(new_sent, ent_rel_id)
                     print(json.dumps(new_sent), file=fout)
                 sentences = [sent]
 
         for new_sent in add_cross_sentence(sentences, auto_tokenizer, max_length):
-            add_joint_label(new_sent, ent_rel_id)
+            if dense_joint_label:
+                add_joint_label(new_sent, ent_rel_id)
             print(json.dumps(new_sent), file=fout)
 
 
@@ -0,0 +1,109 @@
+import json
+import logging
+
+import torch
+
+from utils.argparse import ConfigurationParer
+from inputs.vocabulary import Vocabulary
+from models.joint_decoding.joint_decoder import EntRelJointDecoder
+from models.joint_decoding.joint_scorer import (EntRelJointScorer, export_onnx, export_torchscript, get_default_opset_version,
+                                                SCORER_INPUT_NAMES)
+
+logger = logging.getLogger(__name__)
+
+
+def check_exported_scorer(cfg, scorer, export_format, check_inputs):
+    """check_exported_scorer compares the scores of the exported scoring graph with the scores of the scorer
+    on inputs of other sizes than the traced ones, so the dynamic axes are checked too
+
+    Args:
+        cfg (dict): config parameters
+        scorer (EntRelJointScorer): scorer
+        export_format (str): `onnx` or `torchscript`
+        check_inputs (tuple): check inputs
+
+    Returns:
+        float: max abs difference of the normalized joint scores
+    """
+
+    with torch.no_grad():
+        reference_score = scorer(*check_inputs)
+
+        if export_format == 'torchscript':
+            exported_score = torch.jit.load(cfg.torchscript_model_path, map_location='cpu')(*check_inputs)
+        else:
+            import onnxruntime
+            session = onnxruntime.InferenceSession(cfg.onnx_model_path, providers=['CPUExecutionProvider'])
+            exported_score = torch.from_numpy(
+                session.run(None, {name: inputs.numpy()
+                                   for name, inputs in zip(SCORER_INPUT_NAMES, check_inputs)})[0])
+
+    return (exported_score - reference_score).abs().max().item()
+
+
+def main():
+    # config settings
+    parser = ConfigurationParer()
+    parser.add_save_cfgs()
+    parser.add_data_cfgs()
+    parser.add_model_cfgs()
+    parser.add_optimizer_cfgs()
+    parser.add_run_cfgs()
+    parser.add_export_cfgs()
+
+    cfg = parser.parse_args()
+    logger.info(parser.format_values())
+
+    # the scoring graph is traced in fp32 on cpu
+    if cfg.device > -1:
+        logger.error('config conflicts: the scoring graph is exported on cpu, use cpu for exporting.')
+        cfg.device = -1
+    if cfg.precision != 'fp32':
+        logger.error('config conflicts: the scoring graph is exported without autocast, use fp32.')
+        cfg.precision = 'fp32'
+
+    if cfg.onnx_opset_version is None:
+        cfg.onnx_opset_version = get_default_opset_version()
+
+    vocab = Vocabulary.load(cfg.vocabulary_file)
+    ent_rel_file = json.load(open(cfg.ent_rel_file, 'r', encoding='utf-8'))
+    model = EntRelJointDecoder(cfg=cfg, vocab=vocab, ent_rel_file=ent_rel_file)
+    state_dict = torch.load(open(cfg.best_model_path, 'rb'), map_location=lambda storage, loc: storage)
+    model.load_state_dict(state_dict)
+    logger.info("Loading best training model {} successfully for exporting.".format(cfg.best_model_path))
+
+    scorer = EntRelJointScorer(model)
+    example_inputs = scorer.get_example_inputs(batch_size=2, seq_len=8)
+    check_inputs = scorer.get_example_inputs(batch_size=3, seq_len=13)
+    # padded tokens of the last sentence are masked
+    check_inputs[-1][-1, 9:, :] = False
+    check_inputs[-1][-1, :, 9:] = False
+
+    for export_format in cfg.export_formats:
+        # a failed format is logged, the other formats are still exported
+        try:
+            if export_format == 'torchscript':
+                export_torchscript(scorer, example_inputs, cfg.torchscript_model_path)
+                logger.info("Export torchscript scoring graph into {} successfully.".format(
+                    cfg.torchscript_model_path))
+            else:
+                export_onnx(scorer, example_inputs, cfg.onnx_model_path, cfg.onnx_opset_version)
+                logger.info("Export onnx scoring graph (opset {}) into {} successfully.".format(
+                    cfg.onnx_opset_version, cfg.onnx_model_path))
+        except Exception as e:
+            logger.error("Exporting {} scoring graph failed: {}.".format(export_format, e))
+            continue
+
+        try:
+            max_diff = check_exported_scorer(cfg, scorer, export_format, check_inputs)
+        except ImportError:
+            logger.warning("onnxruntime is not installed, skip checking the onnx scoring graph.")
+            continue
+        except Exception as e:
+            logger.error("Checking {} scoring graph failed: {}.".format(export_format, e))
+            continue
+        logger.info("Check {} scoring graph: max abs difference of normalized joint scores: {:.2e}.".format(
+            export_format, max_diff))
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ import os
 import random
 import logging
 import time
+import functools
 
 import torch
 import torch.nn as nn
@@ -11,55 +12,121 @@ import numpy as np
 from transformers import BertTokenizer, AutoTokenizer, AdamW, get_linear_schedule_with_warmup
 
 from utils.argparse import ConfigurationParer
-from utils.prediction_outputs import print_predictions_for_joint_decoding
-from utils.eval import eval_file
+from utils.prediction_outputs import PredictionWriter, ColumnarPredictionWriter
+from utils.eval import JointEvaluator
+from utils.instrumentation import Instrumentation
+from utils.joint_label_matrix import build_joint_label_matrix
 from inputs.vocabulary import Vocabulary
 from inputs.fields.token_field import TokenField
 from inputs.fields.raw_token_field import RawTokenField
 from inputs.fields.map_token_field import MapTokenField
 from inputs.instance import Instance
 from inputs.datasets.dataset import Dataset
+from inputs.datasets.batch_prefetcher import BatchPrefetcher
+from inputs.datasets.dataset_cache import get_dataset_fingerprint, save_dataset_cache, load_dataset_cache
 from inputs.dataset_readers.ace_reader_for_joint_decoding import ACEReaderForJointDecoding
 from models.joint_decoding.joint_decoder import EntRelJointDecoder
-from utils.nn_utils import get_n_trainable_parameters
+from utils.nn_utils import get_n_trainable_parameters, array2tensor
 
 logger = logging.getLogger(__name__)
 
 
+def get_bucket_namespace(cfg):
+    """get_bucket_namespace returns the namespace deciding sample length for bucket batching,
+    sentence length decides the quadratic cost of the joint score
+
+    Args:
+        cfg (dict): config parameters
+
+    Returns:
+        str: bucket namespace, None if bucket batching is off
+    """
+
+    return 'tokens' if cfg.bucket_batching else None
+
+
+def tensorize_batch(batch_inputs, none_idx, device=-1, pin_memory=False):
+    """tensorize_batch builds the joint label matrix if it is not loaded and converts
+    the padded arrays of a batch to tensors, tensors are kept as they are,
+    so a batch tensorized in advance (e.g. prefetched) only gets moved to the device
+
+    Args:
+        batch_inputs (dict): batch data
+        none_idx (int): index of `None` label
+        device (int, optional): device = -1 if cpu, device >= 0 if gpu. Defaults to -1.
+        pin_memory (bool, optional): pin the cpu tensors for asynchronous copy to gpu. Defaults to False.
+
+    Returns:
+        dict: batch data
+    """
+
+    if "joint_label_matrix" not in batch_inputs:
+        batch_inputs["joint_label_matrix"], batch_inputs["joint_label_matrix_mask"] = build_joint_label_matrix(
+            batch_inputs["span2ent"], batch_inputs["span2rel"], batch_inputs["tokens_lens"], none_idx)
+
+    for namespace, dtype in [("tokens", torch.long), ("joint_label_matrix", torch.long),
+                             ("joint_label_matrix_mask", torch.bool), ("wordpiece_tokens", torch.long),
+                             ("wordpiece_tokens_index", torch.long), ("wordpiece_segment_ids", torch.long)]:
+        batch_inputs[namespace] = array2tensor(batch_inputs[namespace], dtype, device)
+        if pin_memory:
+            batch_inputs[namespace] = batch_inputs[namespace].pin_memory()
+
+    return batch_inputs
+
+
+def get_batches(cfg, dataset, model, instance_name, batch_size):
+    """get_batches iterates batches of one instance, batches are collated and tensorized
+    by a background thread if `cfg.prefetch_batches` > 0
+
+    Args:
+        cfg (dict): config parameters
+        dataset (Dataset): dataset
+        model (nn.Module): model
+        instance_name (str): instance name
+        batch_size (int): batch size
+
+    Returns:
+        iterator: (epoch, batch) iterator, call `close` to stop it early
+    """
+
+    batches = dataset.get_batch(instance_name, batch_size, None, get_bucket_namespace(cfg), cfg.max_batch_cost)
+    if cfg.prefetch_batches <= 0:
+        return batches
+
+    return BatchPrefetcher(batches,
+                           num_prefetch=cfg.prefetch_batches,
+                           process_batch=functools.partial(tensorize_batch,
+                                                           none_idx=model.none_idx,
+                                                           pin_memory=cfg.device > -1))
+
+
 def step(cfg, model, batch_inputs, device):
-    batch_inputs["tokens"] = torch.LongTensor(batch_inputs["tokens"])
-    batch_inputs["joint_label_matrix"] = torch.LongTensor(batch_inputs["joint_label_matrix"])
-    batch_inputs["joint_label_matrix_mask"] = torch.BoolTensor(batch_inputs["joint_label_matrix_mask"])
-    batch_inputs["wordpiece_tokens"] = torch.LongTensor(batch_inputs["wordpiece_tokens"])
-    batch_inputs["wordpiece_tokens_index"] = torch.LongTensor(batch_inputs["wordpiece_tokens_index"])
-    batch_inputs["wordpiece_segment_ids"] = torch.LongTensor(batch_inputs["wordpiece_segment_ids"])
-
-    if device > -1:
-        batch_inputs["tokens"] = batch_inputs["tokens"].cuda(device=device, non_blocking=True)
-        batch_inputs["joint_label_matrix"] = batch_inputs["joint_label_matrix"].cuda(device=device, non_blocking=True)
-        batch_inputs["joint_label_matrix_mask"] = batch_inputs["joint_label_matrix_mask"].cuda(device=device,
-                                                                                               non_blocking=True)
-        batch_inputs["wordpiece_tokens"] = batch_inputs["wordpiece_tokens"].cuda(device=device, non_blocking=True)
-        batch_inputs["wordpiece_tokens_index"] = batch_inputs["wordpiece_tokens_index"].cuda(device=device,
-                                                                                             non_blocking=True)
-        batch_inputs["wordpiece_segment_ids"] = batch_inputs["wordpiece_segment_ids"].cuda(device=device,
-                                                                                           non_blocking=True)
+    with model.instrumentation.phase('h2d'):
+        tensorize_batch(batch_inputs, model.none_idx, device)
 
     outputs = model(batch_inputs)
     batch_outputs = []
     if not model.training:
+        # the evaluator counts joint labels from the batch tensors
+        batch_inputs['joint_label_preds'] = outputs['joint_label_preds']
+
         for sent_idx in range(len(batch_inputs['tokens_lens'])):
             sent_output = dict()
             sent_output['tokens'] = batch_inputs['tokens'][sent_idx].cpu().numpy()
             sent_output['span2ent'] = batch_inputs['span2ent'][sent_idx]
             sent_output['span2rel'] = batch_inputs['span2rel'][sent_idx]
             sent_output['seq_len'] = batch_inputs['tokens_lens'][sent_idx]
-            sent_output['joint_label_matrix'] = batch_inputs['joint_label_matrix'][sent_idx].cpu().numpy()
-            sent_output['joint_label_preds'] = outputs['joint_label_preds'][sent_idx].cpu().numpy()
+            # dense label matrices are only kept for printing
+            if cfg.write_predictions and 'text' in cfg.prediction_format and not cfg.streaming_eval:
+                sent_output['joint_label_matrix'] = batch_inputs['joint_label_matrix'][sent_idx].cpu().numpy()
+                sent_output['joint_label_preds'] = outputs['joint_label_preds'][sent_idx].cpu().numpy()
             sent_output['separate_positions'] = batch_inputs['separate_positions'][sent_idx]
             sent_output['all_separate_position_preds'] = outputs['all_separate_position_preds'][sent_idx]
             sent_output['all_ent_preds'] = outputs['all_ent_preds'][sent_idx]
             sent_output['all_rel_preds'] = outputs['all_rel_preds'][sent_idx]
+            sent_output['all_ent_scores'] = outputs['all_ent_scores'][sent_idx]
+            sent_output['all_rel_scores'] = outputs['all_rel_scores'][sent_idx]
+            sent_output['sample_id'] = batch_inputs['sample_ids'][sent_idx]
             batch_outputs.append(sent_output)
         return batch_outputs
 
@@ -107,25 +174,40 @@ def train(cfg, dataset, model):
                       weight_decay=cfg.adam_weight_decay_rate,
                       correct_bias=False)
 
-    total_train_steps = (dataset.get_dataset_size("train") + cfg.train_batch_size * cfg.gradient_accumulation_steps -
-                         1) / (cfg.train_batch_size * cfg.gradient_accumulation_steps) * cfg.epochs
+    if cfg.bucket_batching:
+        train_batch_num = len(dataset.get_bucket_sampler('train', cfg.train_batch_size, 'tokens', cfg.max_batch_cost))
+        total_train_steps = (train_batch_num + cfg.gradient_accumulation_steps -
+                             1) / cfg.gradient_accumulation_steps * cfg.epochs
+    else:
+        total_train_steps = (dataset.get_dataset_size("train") + cfg.train_batch_size *
+                             cfg.gradient_accumulation_steps - 1) / (cfg.train_batch_size *
+                                                                     cfg.gradient_accumulation_steps) * cfg.epochs
     num_warmup_steps = int(cfg.warmup_rate * total_train_steps) + 1
     scheduler = get_linear_schedule_with_warmup(optimizer,
                                                 num_warmup_steps=num_warmup_steps,
                                                 num_training_steps=total_train_steps)
+    # dynamic loss scaling for fp16, a no-op otherwise
+    scaler = torch.cuda.amp.GradScaler(enabled=cfg.precision == 'fp16')
 
     last_epoch = 1
     batch_id = 0
+    last_batch_id = 0
     best_f1 = 0.0
     early_stop_cnt = 0
     accumulation_steps = 0
     model.zero_grad()
 
-    for epoch, batch in dataset.get_batch('train', cfg.train_batch_size, None):
+    instrumentation = model.instrumentation
+    instrumentation.start_loop('train')
+    batches = get_batches(cfg, dataset, model, 'train', cfg.train_batch_size)
+    for epoch, batch in instrumentation.iterate('data_fetch', batches):
 
-        if last_epoch != epoch or (batch_id != 0 and batch_id % cfg.validate_every == 0):
+        # batch sizes may vary with bucket batching, so check whether a multiple has been passed
+        if last_epoch != epoch or (batch_id != 0
+                                   and batch_id // cfg.validate_every != last_batch_id // cfg.validate_every):
             if accumulation_steps != 0:
-                optimizer.step()
+                scaler.step(optimizer)
+                scaler.update()
                 scheduler.step()
                 model.zero_grad()
 
@@ -151,11 +233,12 @@ def train(cfg, dataset, model):
             last_epoch = epoch
 
         model.train()
+        last_batch_id = batch_id
         batch_id += len(batch['tokens_lens'])
         batch['epoch'] = (epoch - 1)
         element_loss, symmetric_loss, implication_loss = step(cfg, model, batch, cfg.device)
         loss = 1.0 * element_loss + 1.0 * symmetric_loss + 1.0 * implication_loss
-        if batch_id % cfg.logging_steps == 0:
+        if batch_id // cfg.logging_steps != last_batch_id // cfg.logging_steps:
             logger.info(
                 "Epoch: {} Batch: {} Loss: {} (Element_loss: {} Symmetric_loss: {} Implication_loss: {})".format(
                     epoch, batch_id, loss.item(), element_loss.item(), symmetric_loss.item(), implication_loss.item()))
@@ -163,38 +246,86 @@ def train(cfg, dataset, model):
         if cfg.gradient_accumulation_steps > 1:
             loss /= cfg.gradient_accumulation_steps
 
-        loss.backward()
+        with instrumentation.phase('backward'):
+            scaler.scale(loss).backward()
 
         accumulation_steps = (accumulation_steps + 1) % cfg.gradient_accumulation_steps
         if accumulation_steps == 0:
-            nn.utils.clip_grad_norm_(parameters=model.parameters(), max_norm=cfg.gradient_clipping)
-            optimizer.step()
-            scheduler.step()
-            model.zero_grad()
+            with instrumentation.phase('optimizer'):
+                scaler.unscale_(optimizer)
+                nn.utils.clip_grad_norm_(parameters=model.parameters(), max_norm=cfg.gradient_clipping)
+                scaler.step(optimizer)
+                scaler.update()
+                scheduler.step()
+                model.zero_grad()
+        instrumentation.step('train', batch)
+
+    batches.close()
+    instrumentation.end_loop('train')
 
     state_dict = torch.load(open(cfg.best_model_path, "rb"), map_location=lambda storage, loc: storage)
     model.load_state_dict(state_dict)
     test(cfg, dataset, model)
 
 
+def get_prediction_writers(cfg, dataset, instance_name):
+    """get_prediction_writers creates the prediction writers of one instance
+    in the formats of `cfg.prediction_format`, if `cfg.write_predictions`
+
+    Args:
+        cfg (dict): config parameters
+        dataset (Dataset): dataset
+        instance_name (str): instance name
+
+    Returns:
+        list: prediction writers
+    """
+
+    writers = []
+    if not cfg.write_predictions:
+        return writers
+
+    if 'text' in cfg.prediction_format:
+        writers.append(PredictionWriter(os.path.join(cfg.save_dir, instance_name + ".output"), dataset.vocab))
+    if 'columnar' in cfg.prediction_format:
+        writers.append(
+            ColumnarPredictionWriter(os.path.join(cfg.save_dir, instance_name + ".predictions"), dataset.vocab))
+    return writers
+
+
 def dev(cfg, dataset, model):
     logger.info("Validate starting...")
     model.zero_grad()
 
-    all_outputs = []
+    eval_metrics = ['joint-label', 'separate-position', 'ent', 'exact-rel']
+    evaluator = JointEvaluator(dataset.vocab, eval_metrics)
+    writers = get_prediction_writers(cfg, dataset, 'dev')
+    instrumentation = model.instrumentation
+    instrumentation.start_loop('dev')
+
     cost_time = 0
-    for _, batch in dataset.get_batch('dev', cfg.test_batch_size, None):
+    for _, batch in instrumentation.iterate('data_fetch', get_batches(cfg, dataset, model, 'dev',
+                                                                      cfg.test_batch_size)):
         model.eval()
         with torch.no_grad():
             cost_time -= time.time()
             batch_outpus = step(cfg, model, batch, cfg.device)
             cost_time += time.time()
-        all_outputs.extend(batch_outpus)
+        with instrumentation.phase('evaluation'):
+            evaluator.update(batch_outpus)
+            evaluator.update_joint_label(batch['joint_label_matrix'], batch['joint_label_preds'],
+                                         batch['joint_label_matrix_mask'])
+        with instrumentation.phase('output_writing'):
+            for writer in writers:
+                writer.write(batch_outpus)
+        instrumentation.step('dev', batch)
     logger.info(f"Cost time: {cost_time}s")
-    dev_output_file = os.path.join(cfg.save_dir, "dev.output")
-    print_predictions_for_joint_decoding(all_outputs, dev_output_file, dataset.vocab)
-    eval_metrics = ['joint-label', 'separate-position', 'ent', 'exact-rel']
-    joint_label_score, separate_position_score, ent_score, exact_rel_score = eval_file(dev_output_file, eval_metrics)
+
+    with instrumentation.phase('output_writing'):
+        for writer in writers:
+            writer.close()
+    instrumentation.end_loop('dev')
+    joint_label_score, separate_position_score, ent_score, exact_rel_score = evaluator.report()
     return ent_score + exact_rel_score
 
 
@@ -202,47 +333,47 @@ def test(cfg, dataset, model):
     logger.info("Testing starting...")
     model.zero_grad()
 
-    all_outputs = []
+    eval_metrics = ['joint-label', 'separate-position', 'ent', 'exact-rel']
+    evaluator = JointEvaluator(dataset.vocab, eval_metrics)
+    writers = get_prediction_writers(cfg, dataset, 'test')
+    instrumentation = model.instrumentation
+    instrumentation.start_loop('test')
 
     cost_time = 0
-    for _, batch in dataset.get_batch('test', cfg.test_batch_size, None):
+    for _, batch in instrumentation.iterate('data_fetch', get_batches(cfg, dataset, model, 'test',
+                                                                      cfg.test_batch_size)):
         model.eval()
         with torch.no_grad():
             cost_time -= time.time()
             batch_outpus = step(cfg, model, batch, cfg.device)
             cost_time += time.time()
-        all_outputs.extend(batch_outpus)
+        with instrumentation.phase('evaluation'):
+            evaluator.update(batch_outpus)
+            evaluator.update_joint_label(batch['joint_label_matrix'], batch['joint_label_preds'],
+                                         batch['joint_label_matrix_mask'])
+        with instrumentation.phase('output_writing'):
+            for writer in writers:
+                writer.write(batch_outpus)
+        instrumentation.step('test', batch)
     logger.info(f"Cost time: {cost_time}s")
 
-    test_output_file = os.path.join(cfg.save_dir, "test.output")
-    print_predictions_for_joint_decoding(all_outputs, test_output_file, dataset.vocab)
-    eval_metrics = ['joint-label', 'separate-position', 'ent', 'exact-rel']
-    eval_file(test_output_file, eval_metrics)
+    with instrumentation.phase('output_writing'):
+        for writer in writers:
+            writer.close()
+    instrumentation.end_loop('test')
+    evaluator.report()
 
 
-def main():
-    # config settings
-    parser = ConfigurationParer()
-    parser.add_save_cfgs()
-    parser.add_data_cfgs()
-    parser.add_model_cfgs()
-    parser.add_optimizer_cfgs()
-    parser.add_run_cfgs()
+def get_fields(cfg):
+    """get_fields defines the fields of the dataset
 
-    cfg = parser.parse_args()
-    logger.info(parser.format_values())
+    Args:
+        cfg (dict): config parameters
 
-    # set random seed
-    random.seed(cfg.seed)
-    torch.manual_seed(cfg.seed)
-    np.random.seed(cfg.seed)
-    if cfg.device > -1 and not torch.cuda.is_available():
-        logger.error('config conflicts: no gpu available, use cpu for training.')
-        cfg.device = -1
-    if cfg.device > -1:
-        torch.cuda.manual_seed(cfg.seed)
+    Returns:
+        list: fields
+    """
 
-    # define fields
     tokens = TokenField("tokens", "tokens", "tokens", True)
     separate_positions = RawTokenField("separate_positions", "separate_positions")
     span2ent = MapTokenField("span2ent", "ent_rel_id", "span2ent", False)
@@ -251,23 +382,41 @@ def main():
     wordpiece_tokens = TokenField("wordpiece_tokens", "wordpiece", "wordpiece_tokens", False)
     wordpiece_tokens_index = RawTokenField("wordpiece_tokens_index", "wordpiece_tokens_index")
     wordpiece_segment_ids = RawTokenField("wordpiece_segment_ids", "wordpiece_segment_ids")
-    fields = [tokens, separate_positions, span2ent, span2rel, joint_label_matrix]
+    fields = [tokens, separate_positions, span2ent, span2rel]
+
+    if not cfg.sparse_joint_label:
+        fields.append(joint_label_matrix)
 
     if cfg.embedding_model in ['bert', 'pretrained']:
         fields.extend([wordpiece_tokens, wordpiece_tokens_index, wordpiece_segment_ids])
 
+    return fields
+
+
+def build_dataset(cfg, fields, max_len, ent_rel_file):
+    """build_dataset reads and indexes train, dev and test data,
+    the vocabulary is built from the counter and pretrained vocabularies
+
+    Args:
+        cfg (dict): config parameters
+        fields (list): fields
+        max_len (dict): max length for some namespace
+        ent_rel_file (dict): entity and relation file
+
+    Returns:
+        Dataset: dataset
+    """
+
     # define counter and vocabulary
     counter = defaultdict(lambda: defaultdict(int))
     vocab = Vocabulary()
 
     # define instance
-    train_instance = Instance(fields)
-    dev_instance = Instance(fields)
-    test_instance = Instance(fields)
+    train_instance = Instance(fields, compact=cfg.compact_storage)
+    dev_instance = Instance(fields, compact=cfg.compact_storage)
+    test_instance = Instance(fields, compact=cfg.compact_storage)
 
     # define dataset reader
-    max_len = {'tokens': cfg.max_sent_len, 'wordpiece_tokens': cfg.max_wordpiece_len}
-    ent_rel_file = json.load(open(cfg.ent_rel_file, 'r', encoding='utf-8'))
     pretrained_vocab = {'ent_rel_id': ent_rel_file["id"]}
     if cfg.embedding_model == 'bert':
         tokenizer = BertTokenizer.from_pretrained(cfg.bert_model_name)
@@ -277,9 +426,9 @@ def main():
         tokenizer = AutoTokenizer.from_pretrained(cfg.pretrained_model_name)
         logger.info("Load {} tokenizer successfully.".format(cfg.pretrained_model_name))
         pretrained_vocab['wordpiece'] = tokenizer.get_vocab()
-    ace_train_reader = ACEReaderForJointDecoding(cfg.train_file, False, max_len)
-    ace_dev_reader = ACEReaderForJointDecoding(cfg.dev_file, False, max_len)
-    ace_test_reader = ACEReaderForJointDecoding(cfg.test_file, False, max_len)
+    ace_train_reader = ACEReaderForJointDecoding(cfg.train_file, False, max_len, not cfg.sparse_joint_label)
+    ace_dev_reader = ACEReaderForJointDecoding(cfg.dev_file, False, max_len, not cfg.sparse_joint_label)
+    ace_test_reader = ACEReaderForJointDecoding(cfg.test_file, False, max_len, not cfg.sparse_joint_label)
 
     # define dataset
     ace_dataset = Dataset("ACE2005")
@@ -292,21 +441,120 @@ def main():
     no_unk_namespace = ["ent_rel_id"]
     contain_pad_namespace = {"wordpiece": tokenizer.pad_token}
     contain_unk_namespace = {"wordpiece": tokenizer.unk_token}
-    ace_dataset.build_dataset(vocab=vocab,
-                              counter=counter,
-                              min_count=min_count,
-                              pretrained_vocab=pretrained_vocab,
-                              no_pad_namespace=no_pad_namespace,
-                              no_unk_namespace=no_unk_namespace,
-                              contain_pad_namespace=contain_pad_namespace,
-                              contain_unk_namespace=contain_unk_namespace)
-    wo_padding_namespace = ["separate_positions", "span2ent", "span2rel"]
-    ace_dataset.set_wo_padding_namespace(wo_padding_namespace=wo_padding_namespace)
 
+    cache_path = None
+    if cfg.dataset_cache_dir is not None:
+        fingerprint = get_dataset_fingerprint(
+            [cfg.train_file, cfg.dev_file, cfg.test_file], {
+                'ent_rel_file': ent_rel_file,
+                'max_len': max_len,
+                'pretrained_vocab': pretrained_vocab,
+                'fields': [field.namespace for field in fields],
+                'min_count': min_count,
+                'no_pad_namespace': no_pad_namespace,
+                'no_unk_namespace': no_unk_namespace,
+                'contain_pad_namespace': contain_pad_namespace,
+                'contain_unk_namespace': contain_unk_namespace
+            })
+        cache_path = os.path.join(cfg.dataset_cache_dir, fingerprint)
+
+    if cache_path is not None and os.path.exists(cache_path):
+        load_dataset_cache(ace_dataset, cache_path)
+    else:
+        ace_dataset.build_dataset(vocab=vocab,
+                                  counter=counter,
+                                  min_count=min_count,
+                                  pretrained_vocab=pretrained_vocab,
+                                  no_pad_namespace=no_pad_namespace,
+                                  no_unk_namespace=no_unk_namespace,
+                                  contain_pad_namespace=contain_pad_namespace,
+                                  contain_unk_namespace=contain_unk_namespace)
+        if cache_path is not None:
+            os.makedirs(cfg.dataset_cache_dir, exist_ok=True)
+            save_dataset_cache(ace_dataset, cache_path)
+
+    return ace_dataset
+
+
+def build_test_dataset(cfg, fields, max_len):
+    """build_test_dataset only reads and indexes the evaluated splits (`cfg.test_instances`)
+    with the saved vocabulary, the training data is not read and no token is counted
+
+    Args:
+        cfg (dict): config parameters
+        fields (list): fields
+        max_len (dict): max length for some namespace
+
+    Returns:
+        Dataset: dataset
+    """
+
+    vocab = Vocabulary.load(cfg.vocabulary_file)
+
+    ace_dataset = Dataset("ACE2005")
+    for instance_name in cfg.test_instances:
+        reader = ACEReaderForJointDecoding(getattr(cfg, instance_name + '_file'), False, max_len,
+                                           not cfg.sparse_joint_label)
+        ace_dataset.add_instance(instance_name,
+                                 Instance(fields, compact=cfg.compact_storage),
+                                 reader,
+                                 is_count=False,
+                                 is_train=False)
+
+    ace_dataset.build_dataset(vocab=vocab)
+    return ace_dataset
+
+
+def main():
+    # config settings
+    parser = ConfigurationParer()
+    parser.add_save_cfgs()
+    parser.add_data_cfgs()
+    parser.add_model_cfgs()
+    parser.add_optimizer_cfgs()
+    parser.add_run_cfgs()
+
+    cfg = parser.parse_args()
+    logger.info(parser.format_values())
+    start_time = time.time()
+
+    # set random seed
+    random.seed(cfg.seed)
+    torch.manual_seed(cfg.seed)
+    np.random.seed(cfg.seed)
+    if cfg.device > -1 and not torch.cuda.is_available():
+        logger.error('config conflicts: no gpu available, use cpu for training.')
+        cfg.device = -1
+    if cfg.int8_inference and not cfg.test:
+        logger.error('config conflicts: int8 inference only works with testing, ignore it.')
+        cfg.int8_inference = False
+    if cfg.int8_biaffine and not cfg.int8_inference:
+        logger.error('config conflicts: int8 biaffine only works with int8 inference, ignore it.')
+        cfg.int8_biaffine = False
+    if cfg.int8_inference and cfg.device > -1:
+        logger.error('config conflicts: int8 inference runs on cpu only, use cpu for testing.')
+        cfg.device = -1
+    if cfg.int8_inference and cfg.precision != 'fp32':
+        logger.error('config conflicts: int8 inference runs without autocast, use fp32.')
+        cfg.precision = 'fp32'
+    if cfg.device > -1:
+        torch.cuda.manual_seed(cfg.seed)
+    if cfg.precision == 'fp16' and cfg.device == -1:
+        logger.error('config conflicts: fp16 autocast requires gpu, use bf16 on cpu.')
+        cfg.precision = 'bf16'
+
+    fields = get_fields(cfg)
+    max_len = {'tokens': cfg.max_sent_len, 'wordpiece_tokens': cfg.max_wordpiece_len}
+    ent_rel_file = json.load(open(cfg.ent_rel_file, 'r', encoding='utf-8'))
     if cfg.test:
-        vocab = Vocabulary.load(cfg.vocabulary_file)
+        ace_dataset = build_test_dataset(cfg, fields, max_len)
     else:
-        vocab.save(cfg.vocabulary_file)
+        ace_dataset = build_dataset(cfg, fields, max_len, ent_rel_file)
+        ace_dataset.vocab.save(cfg.vocabulary_file)
+    vocab = ace_dataset.vocab
+
+    wo_padding_namespace = ["separate_positions", "span2ent", "span2rel"]
+    ace_dataset.set_wo_padding_namespace(wo_padding_namespace=wo_padding_namespace)
 
     # joint model
     model = EntRelJointDecoder(cfg=cfg, vocab=vocab, ent_rel_file=ent_rel_file)
@@ -316,12 +564,29 @@ def main():
         model.load_state_dict(state_dict)
         logger.info("Loading best training model {} successfully for testing.".format(cfg.best_model_path))
 
+    if cfg.int8_inference:
+        model.quantize_int8(biaffine=cfg.int8_biaffine)
+        logger.info("Quantize model to dynamic int8 successfully.")
+
     if cfg.device > -1:
         model.cuda(device=cfg.device)
 
+    model.instrumentation = Instrumentation(cfg.device,
+                                            enabled=cfg.instrument,
+                                            metrics_file=os.path.join(cfg.save_dir, cfg.metrics_file),
+                                            window_steps=cfg.metrics_steps,
+                                            profile_loops=cfg.profile_loops,
+                                            profile_dir=os.path.join(cfg.save_dir, 'profile'),
+                                            profile_schedule=(cfg.profile_wait, cfg.profile_warmup,
+                                                              cfg.profile_steps))
+
+    logger.info("Startup cost time: {:.2f}s".format(time.time() - start_time))
+
     if cfg.test:
-        dev(cfg, ace_dataset, model)
-        test(cfg, ace_dataset, model)
+        if 'dev' in cfg.test_instances:
+            dev(cfg, ace_dataset, model)
+        if 'test' in cfg.test_instances:
+            test(cfg, ace_dataset, model)
     else:
         train(cfg, ace_dataset, model)
 
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import logging
+
+import torch
+
+from utils.argparse import ConfigurationParer
+from inputs.vocabulary import Vocabulary
+from inputs.instance import Instance
+from inputs.datasets.dataset import Dataset
+from inputs.dataset_readers.ace_reader_for_joint_decoding import ACEReaderForJointDecoding
+from models.joint_decoding.joint_decoder import EntRelJointDecoder
+from models.joint_decoding.exported_joint_decoder import ExportedEntRelJointDecoder
+from entity_relation_joint_decoder import get_fields, get_batches, step
+
+logger = logging.getLogger(__name__)
+
+
+class ACEReaderForPrediction(ACEReaderForJointDecoding):
+    """This class reads processed sentences for prediction, all sentences are kept whatever their lengths,
+    entity and relation mentions are optional, and the input lines of the kept sentences are recorded
+    """
+    def __init__(self, file_path):
+        """This function defines file path
+
+        Arguments:
+            file_path {str} -- file path
+        """
+
+        super().__init__(file_path, is_test=True, with_joint_label_matrix=False)
+        self.lines = []
+
+    def __iter__(self):
+        # the reader is iterated once per field, the lines of the last pass are kept
+        self.lines = []
+        yield from super().__iter__()
+
+    def get_entity_relation_label(self, line, sentence_length):
+        line.setdefault('entityMentions', [])
+        line.setdefault('relationMentions', [])
+        state, results = super().get_entity_relation_label(line, sentence_length)
+        if state:
+            self.lines.append(line)
+        return state, results
+
+
+class EntRelJointPredictor():
+    """This class predicts entities and relations of processed sentences by a trained model
+    (`best_model` and `vocabulary.pickle` of `save_dir`) without the training stack,
+    the model is quantized to dynamic int8 with `int8_inference`,
+    or its exported scoring graph is run by onnxruntime or torchscript with `runtime`
+    """
+    def __init__(self, cfg):
+        """This function loads the vocabulary and the trained model
+
+        Arguments:
+            cfg {dict} -- config parameters
+        """
+
+        self.cfg = cfg
+        self.fields = get_fields(cfg)
+        self.vocab = Vocabulary.load(cfg.vocabulary_file)
+        ent_rel_file = json.load(open(cfg.ent_rel_file, 'r', encoding='utf-8'))
+
+        if cfg.runtime != 'torch':
+            self.model = ExportedEntRelJointDecoder(cfg=cfg, vocab=self.vocab, ent_rel_file=ent_rel_file)
+            return
+
+        self.model = EntRelJointDecoder(cfg=cfg, vocab=self.vocab, ent_rel_file=ent_rel_file)
+        state_dict = torch.load(open(cfg.best_model_path, 'rb'), map_location=lambda storage, loc: storage)
+        self.model.load_state_dict(state_dict)
+        logger.info("Loading best training model {} successfully for prediction.".format(cfg.best_model_path))
+
+        if cfg.int8_inference:
+            self.model.quantize_int8(biaffine=cfg.int8_biaffine)
+            logger.info("Quantize model to dynamic int8 successfully.")
+        if cfg.device > -1:
+            self.model.cuda(device=cfg.device)
+        self.model.eval()
+
+    def predict(self, input_file):
+        """This function predicts the sentences of the input file
+
+        Arguments:
+            input_file {str} -- input file in the processed format
+
+        Returns:
+            list -- sentences with predicted entity and relation mentions, in the input order
+        """
+
+        reader = ACEReaderForPrediction(input_file)
+        dataset = Dataset("Predict")
+        dataset.add_instance('predict',
+                             Instance(self.fields, compact=self.cfg.compact_storage),
+                             reader,
+                             is_count=False,
+                             is_train=False)
+        dataset.build_dataset(vocab=self.vocab)
+        dataset.set_wo_padding_namespace(wo_padding_namespace=["separate_positions", "span2ent", "span2rel"])
+
+        predictions = [None] * len(reader.lines)
+        for _, batch in get_batches(self.cfg, dataset, self.model, 'predict', self.cfg.test_batch_size):
+            with torch.no_grad():
+                batch_outputs = step(self.cfg, self.model, batch, self.cfg.device)
+            for sent_output in batch_outputs:
+                sample_id = sent_output['sample_id']
+                predictions[sample_id] = get_predicted_mentions(reader.lines[sample_id], sent_output)
+        return predictions
+
+
+def get_predicted_mentions(line, sent_output):
+    """get_predicted_mentions converts the predictions of one sentence into
+    entity and relation mentions in the processed format
+
+    Args:
+        line (dict): input line
+        sent_output (dict): sentence output
+
+    Returns:
+        dict: sentence with predicted entity and relation mentions
+    """
+
+    tokens = line['tokens'] if 'tokens' in line else line['sentText'].strip().split(' ')
+    prefix = '{}-{}'.format(line.get('articleId'), line.get('sentId'))
+
+    entity_mentions = []
+    span2ent = {}
+    for (st, ed), label in sent_output['all_ent_preds'].items():
+        span2ent[(st, ed)] = {
+            'emId': '{}-E{}'.format(prefix, len(entity_mentions)),
+            'text': ' '.join(tokens[st:ed]),
+            'offset': [st, ed],
+            'label': label,
+            'score': sent_output['all_ent_scores'][(st, ed)]
+        }
+        entity_mentions.append(span2ent[(st, ed)])
+
+    relation_mentions = []
+    for (span1, span2), label in sent_output['all_rel_preds'].items():
+        relation_mentions.append({
+            'em1Id': span2ent[span1]['emId'],
+            'em1Text': span2ent[span1]['text'],
+            'em2Id': span2ent[span2]['emId'],
+            'em2Text': span2ent[span2]['text'],
+            'label': label,
+            'score': sent_output['all_rel_scores'][(span1, span2)]
+        })
+
+    return {
+        'articleId': line.get('articleId'),
+        'sentId': line.get('sentId'),
+        'sentText': line['sentText'],
+        'entityMentions': entity_mentions,
+        'relationMentions': relation_mentions
+    }
+
+
+def main():
+    # config settings
+    parser = ConfigurationParer()
+    parser.add_save_cfgs()
+    parser.add_data_cfgs()
+    parser.add_model_cfgs()
+    parser.add_optimizer_cfgs()
+    parser.add_run_cfgs()
+    parser.add_predict_cfgs()
+
+    cfg = parser.parse_args()
+    logger.info(parser.format_values())
+    start_time = time.time()
+
+    # the input is not labeled, the joint label matrix is rebuilt from the (empty) span maps
+    cfg.sparse_joint_label = True
+    cfg.write_predictions = False
+
+    if cfg.device > -1 and not torch.cuda.is_available():
+        logger.error('config conflicts: no gpu available, use cpu for prediction.')
+        cfg.device = -1
+    if cfg.runtime != 'torch' and cfg.int8_inference:
+        logger.error('config conflicts: the exported scoring graph is fp32, ignore int8 inference.')
+        cfg.int8_inference = False
+    if cfg.int8_biaffine and not cfg.int8_inference:
+        logger.error('config conflicts: int8 biaffine only works with int8 inference, ignore it.')
+        cfg.int8_biaffine = False
+    if cfg.runtime != 'torch' and cfg.device > -1:
+        logger.error('config conflicts: the exported scoring graph runs on cpu only, use cpu for prediction.')
+        cfg.device = -1
+    if cfg.runtime != 'torch' and cfg.precision != 'fp32':
+        logger.error('config conflicts: the exported scoring graph runs without autocast, use fp32.')
+        cfg.precision = 'fp32'
+    if cfg.int8_inference and cfg.device > -1:
+        logger.error('config conflicts: int8 inference runs on cpu only, use cpu for prediction.')
+        cfg.device = -1
+    if cfg.int8_inference and cfg.precision != 'fp32':
+        logger.error('config conflicts: int8 inference runs without autocast, use fp32.')
+        cfg.precision = 'fp32'
+    if cfg.precision == 'fp16' and cfg.device == -1:
+        logger.error('config conflicts: fp16 autocast requires gpu, use bf16 on cpu.')
+        cfg.precision = 'bf16'
+
+    predictor = EntRelJointPredictor(cfg)
+    logger.info("Startup cost time: {:.2f}s".format(time.time() - start_time))
+
+    start_time = time.time()
+    predictions = predictor.predict(cfg.input_file)
+    output_file = os.path.join(cfg.save_dir, cfg.output_file)
+    with open(output_file, 'w', encoding='utf-8') as fout:
+        for sent in predictions:
+            print(json.dumps(sent), file=fout)
+    logger.info("Predict {} sentences into {} successfully, cost time: {:.2f}s.".format(
+        len(predictions), output_file,
+        time.time() - start_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SPAN_MAP_FIELDS = {3: ['st', 'ed', 'label'], 5: ['st1', 'ed1', 'st2', 'ed2', 'label']}
+
+
+class CompactNamespace():
+    """This class stores one namespace of an instance as one contiguous typed array plus an offsets array,
+    instead of a list of python lists (or dicts), three kinds of items are supported:
+    `seq` (list of int), `matrix` (rectangular list of list of int, e.g. joint label matrix)
+    and `map` (dict from span tuple to int, e.g. span2ent, span2rel) stored as structured array rows
+    `(st, ed, label)` or `(st1, ed1, st2, ed2, label)`
+    """
+    def __init__(self, kind=None, arrays=None, key_shape=None):
+        """This function initializes an empty namespace, or a namespace from its arrays
+
+        Keyword Arguments:
+            kind {str} -- `seq`, `matrix` or `map`, decided by the first appended item if None (default: {None})
+            arrays {dict} -- `offsets` and `data` arrays, plus `cols` for `matrix` (default: {None})
+            key_shape {list} -- shape of the span tuple keys for `map` (default: {None})
+        """
+
+        self.kind = kind
+        self.arrays = dict(arrays) if arrays is not None else {'offsets': np.zeros(1, dtype=np.int64)}
+        self.key_shape = key_shape
+        self.pending = []
+
+    @classmethod
+    def from_items(cls, items):
+        """This function builds a namespace from a list of items
+
+        Arguments:
+            items {list} -- items of one namespace
+
+        Returns:
+            CompactNamespace -- namespace
+        """
+
+        namespace = cls()
+        for item in items:
+            namespace.append(item)
+        namespace.flush()
+        return namespace
+
+    def __len__(self):
+        return len(self.arrays['offsets']) - 1 + len(self.pending)
+
+    def __getitem__(self, idx):
+        """This function gets one item as a read-only array view
+
+        Arguments:
+            idx {int} -- item index
+
+        Returns:
+            numpy.array -- 1D array (`seq`), 2D array (`matrix`) or structured array (`map`)
+        """
+
+        self.flush()
+        st, ed = self.get_range(idx)
+        if self.kind == 'matrix':
+            return self.arrays['data'][st:ed].reshape(-1, self.arrays['cols'][idx])
+        return self.arrays['data'][st:ed]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def get_range(self, idx):
+        """This function gets the data range of one item
+
+        Arguments:
+            idx {int} -- item index
+
+        Returns:
+            tuple -- start, end
+        """
+
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("compact namespace index out of range.")
+
+        return self.arrays['offsets'][idx], self.arrays['offsets'][idx + 1]
+
+    def get_object(self, idx):
+        """This function gets one item as python list (or dict), the same as the item appended
+
+        Arguments:
+            idx {int} -- item index
+
+        Returns:
+            list or dict -- item
+        """
+
+        item = self[idx]
+        if self.kind != 'map':
+            return item.tolist()
+
+        return {to_tuple(np.reshape(row[:-1], self.key_shape).tolist()): row[-1] for row in item.tolist()}
+
+    def get_lens(self):
+        """This function gets the length of all items
+
+        Returns:
+            numpy.array -- item lengths
+        """
+
+        self.flush()
+        lens = np.diff(self.arrays['offsets'])
+        if self.kind == 'matrix':
+            lens = lens // np.maximum(self.arrays['cols'], 1)
+        return lens
+
+    def append(self, item):
+        """This function appends one item, items are buffered as small arrays and
+        concatenated into the contiguous array on `flush`
+
+        Arguments:
+            item {list or dict} -- item
+        """
+
+        if self.kind is None:
+            if isinstance(item, dict):
+                self.kind = 'map'
+            elif len(item) > 0 and isinstance(item[0], list):
+                self.kind = 'matrix'
+            else:
+                self.kind = 'seq'
+
+        if self.kind == 'map':
+            if self.key_shape is None and len(item) > 0:
+                self.key_shape = list(np.shape(next(iter(item))))
+            rows = [list(np.ravel(key)) + [value] for key, value in item.items()]
+            self.pending.append(np.array(rows, dtype=np.int64) if len(rows) > 0 else np.zeros((0, 0), dtype=np.int64))
+        elif self.kind == 'matrix':
+            if len(set(len(row) for row in item)) > 1:
+                logger.error("compact namespace only supports rectangular matrix items.")
+                raise RuntimeError("compact namespace only supports rectangular matrix items.")
+            self.pending.append(
+                np.array(item, dtype=np.int64) if len(item) > 0 else np.zeros((0, 0), dtype=np.int64))
+        else:
+            self.pending.append(np.array(item, dtype=np.int64).reshape(-1))
+
+    def flush(self):
+        """This function concatenates the buffered items into the contiguous array
+        """
+
+        if len(self.pending) == 0:
+            return
+
+        lens = [item.size if self.kind == 'matrix' else len(item) for item in self.pending]
+        offsets = np.concatenate([self.arrays['offsets'], self.arrays['offsets'][-1] + np.cumsum(lens)])
+
+        if self.kind == 'map':
+            width = 1 + (int(np.prod(self.key_shape)) if self.key_shape is not None else 0)
+            data = np.concatenate([item.reshape(-1, width) for item in self.pending])
+            info = np.iinfo(np.int32)
+            if data.size > 0 and (data.min() < info.min or data.max() > info.max):
+                logger.error("compact namespace only supports span maps of int32 values.")
+                raise RuntimeError("compact namespace only supports span maps of int32 values.")
+            names = SPAN_MAP_FIELDS.get(width, ['k{}'.format(idx) for idx in range(width - 1)] + ['label'])
+            data = np.ascontiguousarray(data, dtype=np.int32).view([(name, np.int32) for name in names]).reshape(-1)
+        else:
+            data = compact_int_array(np.concatenate([item.reshape(-1) for item in self.pending]))
+
+        # items appended after the last flush
+        if 'data' in self.arrays and len(self.arrays['data']) > 0:
+            data = np.concatenate([self.arrays['data'], data]) if len(data) > 0 else self.arrays['data']
+        self.arrays['data'] = data
+        self.arrays['offsets'] = offsets
+
+        if self.kind == 'matrix':
+            cols = np.array([item.shape[1] if item.shape[0] > 0 else 0 for item in self.pending], dtype=np.int64)
+            self.arrays['cols'] = np.concatenate([self.arrays.get('cols', np.zeros(0, dtype=np.int64)), cols])
+
+        self.pending = []
+
+
+def to_tuple(key):
+    """This function converts a nested list key into a nested tuple
+
+    Arguments:
+        key {list} -- nested list
+
+    Returns:
+        tuple -- nested tuple
+    """
+
+    if isinstance(key, list):
+        return tuple(to_tuple(item) for item in key)
+    return key
+
+
+def compact_int_array(array):
+    """This function stores int arrays in int32 if the values fit
+
+    Arguments:
+        array {numpy.array} -- int64 array
+
+    Returns:
+        numpy.array -- int32 or int64 array
+    """
+
+    info = np.iinfo(np.int32)
+    if array.size == 0 or (array.min() >= info.min and array.max() <= info.max):
+        return np.ascontiguousarray(array, dtype=np.int32)
+    return np.ascontiguousarray(array)
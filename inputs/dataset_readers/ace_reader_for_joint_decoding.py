@@ -9,7 +9,7 @@ class ACEReaderForJointDecoding():
     """Define text data reader and preprocess data for entity relation
     joint decoding on ACE dataset.
     """
-    def __init__(self, file_path, is_test=False, max_len=dict()):
+    def __init__(self, file_path, is_test=False, max_len=dict(), with_joint_label_matrix=True):
         """This function defines file path and some settings
         
         Arguments:
@@ -18,11 +18,14 @@ class ACEReaderForJointDecoding():
         Keyword Arguments:
             is_test {bool} -- indicate training or testing (default: {False})
             max_len {dict} -- max length for some namespace (default: {dict()})
+            with_joint_label_matrix {bool} -- load the dense joint label matrix or not,
+            it can be rebuilt from `span2ent` and `span2rel` (default: {True})
         """
 
         self.file_path = file_path
         self.is_test = is_test
         self.max_len = dict(max_len)
+        self.with_joint_label_matrix = with_joint_label_matrix
         self.seq_lens = defaultdict(list)
 
     def __iter__(self):
@@ -202,6 +205,9 @@ class ACEReaderForJointDecoding():
 
         results['span2rel'] = span2rel
 
+        if not self.with_joint_label_matrix:
+            return True, results
+
         if 'jointLabelMatrix' not in line:
             logger.error("article id: {} sentence id: {} doesn't contain 'jointLabelMatrix'.".format(
                 line['articleId'], line['sentId']))
@@ -0,0 +1,93 @@
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPrefetcher():
+    """This class consumes a `(epoch, batch)` generator in a background thread
+    and keeps a bounded number of ready batches queued ahead of the consumer
+    """
+
+    END = object()
+
+    def __init__(self, batch_generator, num_prefetch=2, process_batch=None):
+        """This function starts the background thread
+
+        Arguments:
+            batch_generator {generator} -- batch generator, e.g. `Dataset.get_batch`
+
+        Keyword Arguments:
+            num_prefetch {int} -- max number of ready batches in the queue (default: {2})
+            process_batch {function} -- function applied to every batch in the background,
+            e.g. tensor conversion (default: {None})
+        """
+
+        self.batch_generator = batch_generator
+        self.process_batch = process_batch
+        self.queue = queue.Queue(maxsize=max(num_prefetch, 1))
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.prefetch, daemon=True)
+        self.thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.queue.get()
+        if item is BatchPrefetcher.END:
+            raise StopIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def prefetch(self):
+        """This function runs in the background thread, batches (or the raised exception)
+        are put into the queue in generator order
+        """
+
+        try:
+            for epoch, batch in self.batch_generator:
+                if self.process_batch is not None:
+                    batch = self.process_batch(batch)
+                if not self.put((epoch, batch)):
+                    return
+        except Exception as e:
+            logger.error("Prefetching batches failed: {}.".format(e))
+            self.put(e)
+            return
+
+        self.put(BatchPrefetcher.END)
+
+    def put(self, item):
+        """This function puts an item into the queue unless the prefetcher is closed
+
+        Arguments:
+            item {object} -- item
+
+        Returns:
+            bool -- the item is put or not
+        """
+
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def close(self):
+        """This function stops the background thread and drops the queued batches,
+        same as `close` of a generator
+        """
+
+        self.stop_event.set()
+        while self.thread.is_alive():
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        self.thread.join()
@@ -0,0 +1,101 @@
+import random
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BucketBatchSampler():
+    """This class groups samples of similar length into batches, the batch size is capped by
+    the number of samples and by the quadratic cost of the padded batch (batch size x max length^2)
+    """
+    def __init__(self, seq_lens, batch_size, max_batch_cost=0, shuffle=False):
+        """This function sets sample lengths and batching settings
+
+        Arguments:
+            seq_lens {list} -- sequence length of each sample
+            batch_size {int} -- max number of samples in a batch
+
+        Keyword Arguments:
+            max_batch_cost {int} -- max quadratic cost of a batch, 0 means no limit (default: {0})
+            shuffle {bool} -- shuffle samples of the same length and the batch order every epoch (default: {False})
+        """
+
+        self.seq_lens = list(seq_lens)
+        self.batch_size = batch_size
+        self.max_batch_cost = max_batch_cost
+        self.shuffle = shuffle
+        self.padding_ratio = 0.0
+
+    def __iter__(self):
+        """This function packs one epoch of batches
+
+        Yields:
+            list -- sample ids of a batch
+        """
+
+        ids = list(range(len(self.seq_lens)))
+        if self.shuffle:
+            random.shuffle(ids)
+        # stable sort keeps the shuffled order among samples of the same length
+        ids = sorted(ids, key=lambda idx: self.seq_lens[idx], reverse=True)
+
+        batches = self.pack(ids)
+        self.padding_ratio = self.get_padding_ratio(batches)
+        if self.shuffle:
+            random.shuffle(batches)
+
+        return iter(batches)
+
+    def __len__(self):
+        """The number of batches only depends on the sorted lengths, so it is the same every epoch
+
+        Returns:
+            int -- the number of batches in an epoch
+        """
+
+        return len(self.pack(sorted(range(len(self.seq_lens)), key=lambda idx: self.seq_lens[idx], reverse=True)))
+
+    def pack(self, sorted_ids):
+        """This function greedily packs samples sorted by length (descending) into batches
+
+        Arguments:
+            sorted_ids {list} -- sample ids sorted by length
+
+        Returns:
+            list -- batches
+        """
+
+        batches = []
+        batch = []
+        for idx in sorted_ids:
+            if len(batch) > 0:
+                max_len = self.seq_lens[batch[0]]
+                if len(batch) >= self.batch_size or (self.max_batch_cost > 0 and
+                                                     (len(batch) + 1) * max_len * max_len > self.max_batch_cost):
+                    batches.append(batch)
+                    batch = []
+            batch.append(idx)
+
+        if len(batch) > 0:
+            batches.append(batch)
+
+        return batches
+
+    def get_padding_ratio(self, batches):
+        """This function calculates the ratio of padding cells in the quadratic (n x n) cost
+
+        Arguments:
+            batches {list} -- batches
+
+        Returns:
+            float -- padding ratio
+        """
+
+        total_cost = 0
+        real_cost = 0
+        for batch in batches:
+            max_len = max(self.seq_lens[idx] for idx in batch)
+            total_cost += len(batch) * max_len * max_len
+            real_cost += sum(self.seq_lens[idx] * self.seq_lens[idx] for idx in batch)
+
+        return 0.0 if total_cost == 0 else 1.0 - real_cost / total_cost
@@ -1,6 +1,11 @@
 import random
 import logging
 
+import numpy as np
+
+from inputs.compact_namespace import CompactNamespace
+from inputs.datasets.bucket_sampler import BucketBatchSampler
+
 logger = logging.getLogger(__name__)
 
 
@@ -108,7 +113,7 @@ class Dataset():
                 logger.info("{} dataset's {}: max_len={}, min_len={}.".format(
                     instance_name, key, max(seq_len), min(seq_len)))
 
-    def get_batch(self, instance_name, batch_size, sort_namespace=None):
+    def get_batch(self, instance_name, batch_size, sort_namespace=None, bucket_namespace=None, max_batch_cost=0):
         """get_batch gets batch data and padding
 
         Arguments:
@@ -117,6 +122,8 @@ class Dataset():
 
         Keyword Arguments:
             sort_namespace {str} -- sort samples key, meanwhile calculate sequence length if not None, while keep None means that no sorting (default: {None})
+            bucket_namespace {str} -- group samples of similar length in this namespace into batches if not None (default: {None})
+            max_batch_cost {int} -- max quadratic cost (batch size x max length^2) of a bucketed batch, 0 means no limit (default: {0})
 
         Yields:
             int -- epoch
@@ -133,10 +140,52 @@ class Dataset():
             logger.error('can not find sort namespace {} in datasets instance {}.'.format(
                 sort_namespace, instance_name))
 
+        for epoch, sample_ids in self.get_batch_ids(instance_name, batch_size, bucket_namespace, max_batch_cost):
+            if sort_namespace is not None:
+                sample_ids = [(idx, len(dataset[sort_namespace][idx])) for idx in sample_ids]
+                sample_ids = sorted(sample_ids, key=lambda x: x[1], reverse=True)
+                sorted_ids = [idx for idx, _ in sample_ids]
+            else:
+                sorted_ids = sample_ids
+
+            yield epoch, self.collate(instance_name, sorted_ids)
+
+    def get_batch_ids(self, instance_name, batch_size, bucket_namespace=None, max_batch_cost=0):
+        """get_batch_ids gets the sample ids of batches, training data is reshuffled and
+        repeated every epoch, other data are iterated once in a fixed order
+
+        Arguments:
+            instance_name {str} -- instance name
+            batch_size {int} -- batch size
+
+        Keyword Arguments:
+            bucket_namespace {str} -- group samples of similar length in this namespace into batches if not None (default: {None})
+            max_batch_cost {int} -- max quadratic cost (batch size x max length^2) of a bucketed batch, 0 means no limit (default: {0})
+
+        Yields:
+            int -- epoch
+            list -- sample ids
+        """
+
+        is_train = self.instance_dict[instance_name]['is_train']
+
+        if bucket_namespace is not None:
+            bucket_sampler = self.get_bucket_sampler(instance_name, batch_size, bucket_namespace, max_batch_cost)
+            epoch = 1
+            while True:
+                for sample_ids in bucket_sampler:
+                    yield epoch, sample_ids
+
+                logger.info("{} bucket batching epoch {}: {} batches, padding ratio: {:6.2f}%.".format(
+                    instance_name, epoch, len(bucket_sampler), 100 * bucket_sampler.padding_ratio))
+                epoch += 1
+                if not is_train:
+                    break
+            return
+
         size = self.instance_dict[instance_name]['size']
-        vocab_dict = self.instance_dict[instance_name]['vocab_dict']
         ids = list(range(size))
-        if self.instance_dict[instance_name]['is_train']:
+        if is_train:
             random.shuffle(ids)
         epoch = 1
         cur = 0
@@ -144,7 +193,7 @@ class Dataset():
         while True:
             if cur >= size:
                 epoch += 1
-                if not self.instance_dict[instance_name]['is_train'] and epoch > 1:
+                if not is_train and epoch > 1:
                     break
                 random.shuffle(ids)
                 cur = 0
@@ -152,60 +201,99 @@ class Dataset():
             sample_ids = ids[cur:cur + batch_size]
             cur += batch_size
 
-            if sort_namespace is not None:
-                sample_ids = [(idx, len(dataset[sort_namespace][idx])) for idx in sample_ids]
-                sample_ids = sorted(sample_ids, key=lambda x: x[1], reverse=True)
-                sorted_ids = [idx for idx, _ in sample_ids]
-            else:
-                sorted_ids = sample_ids
+            yield epoch, sample_ids
 
-            batch = {}
+    def get_bucket_sampler(self, instance_name, batch_size, bucket_namespace, max_batch_cost=0):
+        """get_bucket_sampler builds a length bucketing batch sampler over one namespace,
+        samples are shuffled for training data only
 
-            for namespace in dataset:
-                batch[namespace] = []
+        Arguments:
+            instance_name {str} -- instance name
+            batch_size {int} -- max batch size
+            bucket_namespace {str} -- namespace which decides the sample length
+
+        Keyword Arguments:
+            max_batch_cost {int} -- max quadratic cost (batch size x max length^2) of a batch, 0 means no limit (default: {0})
 
-                if namespace in self.wo_padding_namespace:
-                    for id in sorted_ids:
-                        batch[namespace].append(dataset[namespace][id])
+        Returns:
+            BucketBatchSampler -- batch sampler
+        """
+
+        dataset = self.datasets[instance_name]
+        if isinstance(dataset[bucket_namespace], CompactNamespace):
+            seq_lens = dataset[bucket_namespace].get_lens().tolist()
+        else:
+            seq_lens = [len(item) for item in dataset[bucket_namespace]]
+        return BucketBatchSampler(seq_lens,
+                                  batch_size,
+                                  max_batch_cost=max_batch_cost,
+                                  shuffle=self.instance_dict[instance_name]['is_train'])
+
+    def collate(self, instance_name, sorted_ids):
+        """collate pads the samples of one batch into preallocated arrays,
+        padded namespaces are filled by slice assignment into `np.int64` arrays
+        with `np.bool_` masks (directly from the arrays of compact namespaces),
+        namespaces without padding are kept as python lists/dicts,
+        `sample_ids` keeps the index of every sample in the instance
+
+        Arguments:
+            instance_name {str} -- instance name
+            sorted_ids {list} -- sample ids of the batch
+
+        Returns:
+            dict -- batch data
+        """
+
+        dataset = self.datasets[instance_name]
+        vocab_dict = self.instance_dict[instance_name]['vocab_dict']
+        batch_size = len(sorted_ids)
+        batch = {'sample_ids': list(sorted_ids)}
+
+        for namespace in dataset:
+            if namespace in self.wo_padding_namespace:
+                if isinstance(dataset[namespace], CompactNamespace):
+                    batch[namespace] = [dataset[namespace].get_object(id) for id in sorted_ids]
                 else:
-                    if namespace in vocab_dict:
-                        padding_idx = self.vocab.get_padding_index(vocab_dict[namespace])
-                    else:
-                        padding_idx = 0
-
-                    batch_namespace_len = [len(dataset[namespace][id]) for id in sorted_ids]
-                    max_namespace_len = max(batch_namespace_len)
-                    batch[namespace + '_lens'] = batch_namespace_len
-                    batch[namespace + '_mask'] = []
-
-                    if isinstance(dataset[namespace][0][0], list):
-                        max_char_len = 0
-                        for id in sorted_ids:
-                            max_char_len = max(max_char_len,
-                                               max(len(item) for item in dataset[namespace][id]))
-                        for id in sorted_ids:
-                            padding_sent = []
-                            mask = []
-                            for item in dataset[namespace][id]:
-                                padding_sent.append(item + [padding_idx] *
-                                                    (max_char_len - len(item)))
-                                mask.append([1] * len(item) + [0] * (max_char_len - len(item)))
-                            padding_sent = padding_sent + [[padding_idx] * max_char_len] * (
-                                max_namespace_len - len(dataset[namespace][id]))
-                            mask = mask + [[0] * max_char_len
-                                           ] * (max_namespace_len - len(dataset[namespace][id]))
-                            batch[namespace].append(padding_sent)
-                            batch[namespace + '_mask'].append(mask)
+                    batch[namespace] = [dataset[namespace][id] for id in sorted_ids]
+                continue
+
+            if namespace in vocab_dict:
+                padding_idx = self.vocab.get_padding_index(vocab_dict[namespace])
+            else:
+                padding_idx = 0
+
+            # fetch every sample once, samples of compact namespaces are array views
+            items = [dataset[namespace][id] for id in sorted_ids]
+            batch_namespace_len = [len(item) for item in items]
+            max_namespace_len = max(batch_namespace_len)
+            batch[namespace + '_lens'] = batch_namespace_len
+
+            if isinstance(items[0][0], (list, np.ndarray)):
+                max_char_len = max(
+                    max((len(item) for item in sent), default=0) for sent in items)
+                batch_array = np.full((batch_size, max_namespace_len, max_char_len), padding_idx, dtype=np.int64)
+                batch_mask = np.zeros((batch_size, max_namespace_len, max_char_len), dtype=np.bool_)
+                for batch_idx, sent in enumerate(items):
+                    item_lens = {sent.shape[1]} if isinstance(sent, np.ndarray) else set(len(item) for item in sent)
+                    if len(item_lens) == 1:
+                        item_len = item_lens.pop()
+                        batch_array[batch_idx, :len(sent), :item_len] = sent
+                        batch_mask[batch_idx, :len(sent), :item_len] = True
                     else:
-                        for id in sorted_ids:
-                            batch[namespace].append(
-                                dataset[namespace][id] + [padding_idx] *
-                                (max_namespace_len - len(dataset[namespace][id])))
-                            batch[namespace +
-                                  '_mask'].append([1] * len(dataset[namespace][id]) + [0] *
-                                                  (max_namespace_len - len(dataset[namespace][id])))
-
-            yield epoch, batch
+                        for item_idx, item in enumerate(sent):
+                            batch_array[batch_idx, item_idx, :len(item)] = item
+                            batch_mask[batch_idx, item_idx, :len(item)] = True
+            else:
+                batch_array = np.full((batch_size, max_namespace_len), padding_idx, dtype=np.int64)
+                batch_mask = np.zeros((batch_size, max_namespace_len), dtype=np.bool_)
+                for batch_idx, (item, seq_len) in enumerate(zip(items, batch_namespace_len)):
+                    batch_array[batch_idx, :seq_len] = item
+                    batch_mask[batch_idx, :seq_len] = True
+
+            batch[namespace] = batch_array
+            batch[namespace + '_mask'] = batch_mask
+
+        return batch
 
     def get_dataset_size(self, instance_name):
         """This function gets dataset size
@@ -0,0 +1,128 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+
+import numpy as np
+
+from inputs.vocabulary import Vocabulary
+from inputs.compact_namespace import CompactNamespace
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+
+
+def get_dataset_fingerprint(file_paths, settings):
+    """This function computes the fingerprint of a compiled dataset,
+    it changes once any data file content or dataset setting changes
+
+    Arguments:
+        file_paths {list} -- data file paths
+        settings {dict} -- json serializable settings, e.g. ent_rel_file, max_len, tokenizer vocab
+
+    Returns:
+        str -- fingerprint
+    """
+
+    sha1 = hashlib.sha1()
+    sha1.update(str(CACHE_VERSION).encode('utf-8'))
+    for file_path in file_paths:
+        if file_path is None:
+            sha1.update(b'None')
+            continue
+        with open(file_path, 'rb') as fin:
+            for chunk in iter(lambda: fin.read(1 << 20), b''):
+                sha1.update(chunk)
+        sha1.update(b'\0')
+    sha1.update(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+
+    return sha1.hexdigest()
+
+
+def save_dataset_cache(dataset, cache_path):
+    """This function saves the indexed instances and vocabulary of a built dataset,
+    files are written into a temporary directory which is renamed at last,
+    so concurrent runs never see a partially written cache
+
+    Arguments:
+        dataset {Dataset} -- built dataset
+        cache_path {str} -- cache directory
+    """
+
+    tmp_path = "{}.tmp-{}".format(cache_path, os.getpid())
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    meta = {'version': CACHE_VERSION, 'instances': {}}
+    for instance_name, instance in dataset.datasets.items():
+        os.makedirs(os.path.join(tmp_path, instance_name))
+        namespaces = {}
+        for namespace, items in instance.items():
+            if not isinstance(items, CompactNamespace):
+                items = CompactNamespace.from_items(items)
+            items.flush()
+            for array_name, array in items.arrays.items():
+                np.save(os.path.join(tmp_path, instance_name, "{}.{}.npy".format(namespace, array_name)), array)
+            namespaces[namespace] = {'kind': items.kind, 'arrays': list(items.arrays), 'key_shape': items.key_shape}
+
+        meta['instances'][instance_name] = {
+            'size': dataset.instance_dict[instance_name]['size'],
+            'vocab_dict': dataset.instance_dict[instance_name]['vocab_dict'],
+            'namespaces': namespaces
+        }
+
+    dataset.vocab.save(os.path.join(tmp_path, 'vocabulary.pickle'))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as fout:
+        json.dump(meta, fout)
+
+    try:
+        os.rename(tmp_path, cache_path)
+        logger.info("Save compiled dataset {} successfully.".format(cache_path))
+    except OSError:
+        # another run has saved the same cache
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_dataset_cache(dataset, cache_path):
+    """This function loads the compiled instances and vocabulary into a dataset,
+    arrays are memory-mapped, so concurrent runs share the page cache
+
+    Arguments:
+        dataset {Dataset} -- dataset with instances added
+        cache_path {str} -- cache directory
+    """
+
+    with open(os.path.join(cache_path, 'meta.json'), 'r', encoding='utf-8') as fin:
+        meta = json.load(fin)
+
+    if meta['version'] != CACHE_VERSION:
+        logger.error("compiled dataset {} version {} is not supported.".format(cache_path, meta['version']))
+        raise RuntimeError("compiled dataset {} version {} is not supported.".format(cache_path, meta['version']))
+
+    dataset.vocab = Vocabulary.load(os.path.join(cache_path, 'vocabulary.pickle'))
+    for instance_name in dataset.instance_dict:
+        if instance_name not in meta['instances']:
+            logger.error("can not find instance name {} in compiled dataset {}.".format(instance_name, cache_path))
+            raise RuntimeError("can not find instance name {} in compiled dataset {}.".format(
+                instance_name, cache_path))
+
+        instance_meta = meta['instances'][instance_name]
+        dataset.datasets[instance_name] = {
+            namespace: CompactNamespace(
+                namespace_meta['kind'], {
+                    array_name: np.load(os.path.join(cache_path, instance_name, "{}.{}.npy".format(
+                        namespace, array_name)),
+                                        mmap_mode='r')
+                    for array_name in namespace_meta['arrays']
+                }, namespace_meta['key_shape'])
+            for namespace, namespace_meta in instance_meta['namespaces'].items()
+        }
+        dataset.instance_dict[instance_name]['size'] = instance_meta['size']
+        dataset.instance_dict[instance_name]['vocab_dict'] = instance_meta['vocab_dict']
+
+        logger.info("{} dataset size: {}.".format(instance_name, instance_meta['size']))
+
+    logger.info("Load compiled dataset {} successfully.".format(cache_path))
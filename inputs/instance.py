@@ -1,22 +1,29 @@
 import logging
 
+from inputs.compact_namespace import CompactNamespace
+
 logger = logging.getLogger(__name__)
 
 
 class Instance():
     """ `Instance` is the collection of multiple `Field`
     """
-    def __init__(self, fields):
+    def __init__(self, fields, compact=False):
         """This function initializes instance
 
         Arguments:
             fields {list} -- field list
+
+        Keyword Arguments:
+            compact {bool} -- store each namespace as one contiguous typed array plus offsets
+            (`CompactNamespace`) instead of a list of python lists (default: {False})
         """
 
         self.fields = list(fields)
+        self.compact = compact
         self.instance = {}
         for field in self.fields:
-            self.instance[field.namespace] = []
+            self.instance[field.namespace] = CompactNamespace() if self.compact else []
         self.vocab_dict = {}
         self.vocab_index()
 
@@ -43,7 +50,7 @@ class Instance():
         for field in fields:
             if field.namesapce not in self.instance:
                 self.fields.append(field)
-                self.instance[field.namesapce] = []
+                self.instance[field.namesapce] = CompactNamespace() if self.compact else []
             else:
                 logger.warning('Field {} has been added before.'.format(field.name))
 
@@ -71,6 +78,8 @@ class Instance():
 
         for field in self.fields:
             field.index(self.instance, vocab, sentences)
+            if self.compact:
+                self.instance[field.namespace].flush()
 
     def get_instance(self):
         """This function get instance
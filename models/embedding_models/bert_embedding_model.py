@@ -45,6 +45,15 @@ class BertEmbedModel(nn.Module):
         batch_inputs['seq_encoder_reprs'] = batch_seq_tokens_encoder_repr
         batch_inputs['seq_cls_repr'] = batch_cls_repr
 
+    def set_gradient_checkpointing(self, enabled):
+        """This function turns on/off the activation checkpointing of the encoder layers
+
+        Arguments:
+            enabled {bool} -- checkpoint layers or not
+        """
+
+        self.bert_encoder.set_gradient_checkpointing(enabled)
+
     def get_hidden_size(self):
         """This function returns embedding dimensions
         
@@ -0,0 +1,118 @@
+import logging
+
+import torch
+
+from models.joint_decoding.joint_decoder import EntRelJointDecoder
+from models.joint_decoding.joint_scorer import SCORER_INPUT_NAMES
+from utils.instrumentation import Instrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class ExportedEntRelJointDecoder():
+    """This class runs the exported scoring graph (see `EntRelJointScorer`) by onnxruntime or torchscript on cpu,
+    and decodes its normalized joint score by the decoding of `EntRelJointDecoder`,
+    so neither the bert model nor the training stack is built for inference.
+    It is called like `EntRelJointDecoder` in evaluation mode.
+    """
+
+    # the decoding only reads the labels, `none_idx`, `separate_threshold` and `vocab` set in `__init__`
+    soft_joint_decoding = EntRelJointDecoder.soft_joint_decoding
+    batched_soft_joint_decoding = EntRelJointDecoder.batched_soft_joint_decoding
+    get_separate_positions = EntRelJointDecoder.get_separate_positions
+    get_spans = EntRelJointDecoder.get_spans
+    get_entities = EntRelJointDecoder.get_entities
+    get_relations = EntRelJointDecoder.get_relations
+
+    def __init__(self, cfg, vocab, ent_rel_file):
+        """This function loads the exported scoring graph of `cfg.runtime`
+
+        Arguments:
+            cfg {dict} -- config parameters
+            vocab {Vocabulary} -- vocabulary
+            ent_rel_file {dict} -- entity and relation file
+        """
+
+        self.vocab = vocab
+        self.runtime = cfg.runtime
+        self.separate_threshold = cfg.separate_threshold
+        self.device_decoding = cfg.device_decoding
+        self.none_idx = self.vocab.get_token_index('None', 'ent_rel_id')
+        self.symmetric_label = torch.LongTensor(ent_rel_file["symmetric"])
+        self.ent_label = torch.LongTensor(ent_rel_file["entity"])
+        self.rel_label = torch.LongTensor(ent_rel_file["relation"])
+        self.training = False
+        self.instrumentation = Instrumentation(enabled=False)
+
+        if self.runtime == 'onnxruntime':
+            try:
+                import onnxruntime
+            except ImportError:
+                logger.error("onnxruntime is not installed, install it by `pip install onnxruntime`.")
+                raise RuntimeError("onnxruntime is not installed, install it by `pip install onnxruntime`.")
+            session_options = onnxruntime.SessionOptions()
+            session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            self.session = onnxruntime.InferenceSession(cfg.onnx_model_path,
+                                                        sess_options=session_options,
+                                                        providers=['CPUExecutionProvider'])
+            logger.info("Load onnx scoring graph {} successfully.".format(cfg.onnx_model_path))
+        elif self.runtime == 'torchscript':
+            self.scorer = torch.jit.load(cfg.torchscript_model_path, map_location='cpu')
+            self.scorer.eval()
+            logger.info("Load torchscript scoring graph {} successfully.".format(cfg.torchscript_model_path))
+        else:
+            logger.error("Runtime {} has no exported scoring graph.".format(self.runtime))
+            raise RuntimeError("Runtime {} has no exported scoring graph.".format(self.runtime))
+
+    def get_normalized_joint_score(self, batch_inputs):
+        """This function runs the exported scoring graph
+
+        Arguments:
+            batch_inputs {dict} -- batch input data (cpu tensors)
+
+        Returns:
+            tensor -- batch normalized joint score
+        """
+
+        scorer_inputs = [batch_inputs[name] for name in SCORER_INPUT_NAMES]
+        if self.runtime == 'torchscript':
+            with torch.no_grad():
+                return self.scorer(*scorer_inputs)
+
+        outputs = self.session.run(None,
+                                   {name: inputs.numpy()
+                                    for name, inputs in zip(SCORER_INPUT_NAMES, scorer_inputs)})
+        return torch.from_numpy(outputs[0])
+
+    def __call__(self, batch_inputs):
+        """This function scores and decodes a batch as `EntRelJointDecoder.forward` in evaluation mode
+
+        Arguments:
+            batch_inputs {dict} -- batch input data
+
+        Returns:
+            dict -- results: joint label, separate position, entity and relation predictions, and their scores
+        """
+
+        results = {}
+
+        with self.instrumentation.phase('biaffine'):
+            batch_normalized_joint_score = self.get_normalized_joint_score(batch_inputs)
+
+        with self.instrumentation.phase('decoding'):
+            results['joint_label_preds'] = torch.argmax(batch_normalized_joint_score, dim=-1)
+
+            if self.device_decoding:
+                decoding_results = self.batched_soft_joint_decoding(batch_normalized_joint_score,
+                                                                    batch_inputs['tokens_lens'])
+            else:
+                decoding_results = self.soft_joint_decoding(batch_normalized_joint_score, batch_inputs['tokens_lens'])
+            separate_position_preds, ent_preds, rel_preds, ent_scores, rel_scores = decoding_results
+
+        results['all_separate_position_preds'] = separate_position_preds
+        results['all_ent_preds'] = ent_preds
+        results['all_rel_preds'] = rel_preds
+        results['all_ent_scores'] = ent_scores
+        results['all_rel_scores'] = rel_scores
+
+        return results
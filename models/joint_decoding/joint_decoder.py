@@ -1,12 +1,19 @@
 import logging
+import functools
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import numpy as np
 
 from models.embedding_models.bert_embedding_model import BertEmbedModel
 from models.embedding_models.pretrained_embedding_model import PretrainedEmbedModel
 from modules.token_embedders.bert_encoder import BertLinear
+from modules.losses.joint_constraint_loss import JointConstraintLoss
+from modules.scorers.biaffine import score_projected_head, project_head, factorize_biaffine, low_rank_biaffine_score
+from utils.nn_utils import (summed_area_table, block_sum, batched_summed_area_table, batched_block_sum, get_autocast,
+                            checkpoint, quantize_linear_int8)
+from utils.instrumentation import Instrumentation
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +37,11 @@ class EntRelJointDecoder(nn.Module):
         self.activation = nn.GELU()
         self.device = cfg.device
         self.separate_threshold = cfg.separate_threshold
+        self.device_decoding = cfg.device_decoding
+        self.precision = cfg.precision
+        self.score_block_size = cfg.score_block_size
+        self.biaffine_rank = cfg.biaffine_rank
+        self.candidate_scoring_rank = cfg.candidate_scoring_rank
 
         if cfg.embedding_model == 'bert':
             self.embedding_model = BertEmbedModel(cfg, vocab)
@@ -50,6 +62,10 @@ class EntRelJointDecoder(nn.Module):
             torch.FloatTensor(self.vocab.get_vocab_size('ent_rel_id'), cfg.mlp_hidden_size + 1,
                               cfg.mlp_hidden_size + 1))
         self.U.data.zero_()
+        # truncated SVD factors of `U` per rank for inference, computed lazily in eval mode
+        self.low_rank_U = {}
+        # int8 head projection through `U` for cpu inference, see `quantize_int8`
+        self.head_projection = None
 
         if cfg.logit_dropout > 0:
             self.logit_dropout = nn.Dropout(p=cfg.logit_dropout)
@@ -69,6 +85,26 @@ class EntRelJointDecoder(nn.Module):
             self.rel_label = self.rel_label.cuda(device=self.device, non_blocking=True)
 
         self.element_loss = nn.CrossEntropyLoss()
+        self.constraint_loss = JointConstraintLoss(self.ent_label,
+                                                   self.rel_label,
+                                                   self.symmetric_label,
+                                                   block_size=cfg.loss_block_size)
+
+        self.set_gradient_checkpointing(cfg.gradient_checkpointing)
+
+        # replaced by the instrumentation of the running loops
+        self.instrumentation = Instrumentation(enabled=False)
+
+    def set_gradient_checkpointing(self, modules):
+        """set_gradient_checkpointing sets the blocks whose activations are recomputed in backward
+        instead of being stored during training
+
+        Args:
+            modules (list): checkpointed blocks, `encoder`, `scoring` or `losses`
+        """
+
+        self.gradient_checkpointing = set(modules or [])
+        self.embedding_model.set_gradient_checkpointing('encoder' in self.gradient_checkpointing)
 
     def forward(self, batch_inputs):
         """forward
@@ -84,57 +120,397 @@ class EntRelJointDecoder(nn.Module):
 
         batch_seq_tokens_lens = batch_inputs['tokens_lens']
 
-        self.embedding_model(batch_inputs)
-        batch_seq_tokens_encoder_repr = batch_inputs['seq_encoder_reprs']
-
-        batch_seq_tokens_head_repr = self.head_mlp(batch_seq_tokens_encoder_repr)
-        batch_seq_tokens_head_repr = torch.cat(
-            [batch_seq_tokens_head_repr,
-             torch.ones_like(batch_seq_tokens_head_repr[..., :1])], dim=-1)
-        batch_seq_tokens_tail_repr = self.tail_mlp(batch_seq_tokens_encoder_repr)
-        batch_seq_tokens_tail_repr = torch.cat(
-            [batch_seq_tokens_tail_repr,
-             torch.ones_like(batch_seq_tokens_tail_repr[..., :1])], dim=-1)
-
-        batch_joint_score = torch.einsum('bxi, oij, byj -> boxy', batch_seq_tokens_head_repr, self.U,
-                                         batch_seq_tokens_tail_repr).permute(0, 2, 3, 1)
+        with get_autocast(self.precision, self.device):
+            with self.instrumentation.phase('encoder'):
+                self.embedding_model(batch_inputs)
+                batch_seq_tokens_encoder_repr = batch_inputs['seq_encoder_reprs']
 
-        batch_normalized_joint_score = torch.softmax(
-            batch_joint_score, dim=-1) * batch_inputs['joint_label_matrix_mask'].unsqueeze(-1).float()
+        with self.instrumentation.phase('biaffine'):
+            if not self.training and self.candidate_scoring_rank > 0:
+                (batch_normalized_joint_score, batch_seq_tokens_head_proj,
+                 batch_seq_tokens_tail_repr) = self.get_candidate_joint_score(batch_seq_tokens_encoder_repr,
+                                                                              batch_inputs['joint_label_matrix_mask'])
+            elif self.score_block_size > 0 and not self.training:
+                # scored block by block together with the decoding, see `streaming_joint_decoding`
+                batch_normalized_joint_score = None
+            elif self.score_block_size > 0:
+                batch_normalized_joint_score, batch_element_loss = self.get_blockwise_joint_score(
+                    batch_seq_tokens_encoder_repr, batch_inputs['joint_label_matrix'],
+                    batch_inputs['joint_label_matrix_mask'])
+            elif self.training and 'scoring' in self.gradient_checkpointing:
+                # the checkpointed block needs an input requiring grad to backpropagate into its parameters,
+                # which is not the case for a fixed encoder
+                if not batch_seq_tokens_encoder_repr.requires_grad:
+                    batch_seq_tokens_encoder_repr = batch_seq_tokens_encoder_repr.detach().requires_grad_()
+                batch_joint_score, batch_normalized_joint_score = checkpoint(
+                    self.get_joint_score, batch_seq_tokens_encoder_repr, batch_inputs['joint_label_matrix_mask'])
+            else:
+                batch_joint_score, batch_normalized_joint_score = self.get_joint_score(
+                    batch_seq_tokens_encoder_repr, batch_inputs['joint_label_matrix_mask'])
 
         if not self.training:
-            results['joint_label_preds'] = torch.argmax(batch_normalized_joint_score, dim=-1)
+            with self.instrumentation.phase('decoding'):
+                if batch_normalized_joint_score is None:
+                    results['joint_label_preds'], decoding_results = self.streaming_joint_decoding(
+                        batch_seq_tokens_encoder_repr, batch_inputs['joint_label_matrix_mask'], batch_seq_tokens_lens)
+                else:
+                    results['joint_label_preds'] = torch.argmax(batch_normalized_joint_score, dim=-1)
 
-            separate_position_preds, ent_preds, rel_preds = self.soft_joint_decoding(
-                batch_normalized_joint_score, batch_seq_tokens_lens)
+                    if self.candidate_scoring_rank > 0:
+                        decoding_results = self.candidate_joint_decoding(batch_normalized_joint_score,
+                                                                         batch_seq_tokens_head_proj,
+                                                                         batch_seq_tokens_tail_repr,
+                                                                         batch_seq_tokens_lens)
+                    elif self.device_decoding:
+                        decoding_results = self.batched_soft_joint_decoding(batch_normalized_joint_score,
+                                                                            batch_seq_tokens_lens)
+                    else:
+                        decoding_results = self.soft_joint_decoding(batch_normalized_joint_score,
+                                                                    batch_seq_tokens_lens)
+                separate_position_preds, ent_preds, rel_preds, ent_scores, rel_scores = decoding_results
 
             results['all_separate_position_preds'] = separate_position_preds
             results['all_ent_preds'] = ent_preds
             results['all_rel_preds'] = rel_preds
+            results['all_ent_scores'] = ent_scores
+            results['all_rel_scores'] = rel_scores
 
             return results
 
-        results['element_loss'] = self.element_loss(
-            self.logit_dropout(batch_joint_score[batch_inputs['joint_label_matrix_mask']]),
-            batch_inputs['joint_label_matrix'][batch_inputs['joint_label_matrix_mask']])
+        with self.instrumentation.phase('losses'):
+            if self.score_block_size > 0:
+                # the element loss is summed up block by block during scoring
+                results['element_loss'] = batch_element_loss
+                results['implication_loss'], results['symmetric_loss'] = self.constraint_loss(
+                    batch_normalized_joint_score, batch_inputs['joint_label_matrix_mask'])
+                return results
+
+            loss_inputs = (batch_joint_score, batch_normalized_joint_score, batch_inputs['joint_label_matrix'],
+                           batch_inputs['joint_label_matrix_mask'])
+            if 'losses' in self.gradient_checkpointing:
+                losses = checkpoint(self.get_losses, *loss_inputs)
+            else:
+                losses = self.get_losses(*loss_inputs)
+            results['element_loss'], results['implication_loss'], results['symmetric_loss'] = losses
 
-        batch_rel_normalized_joint_score = torch.max(batch_normalized_joint_score[..., self.rel_label], dim=-1).values
-        batch_diag_ent_normalized_joint_score = torch.max(
-            batch_normalized_joint_score[..., self.ent_label].diagonal(0, 1, 2),
-            dim=1).values.unsqueeze(-1).expand_as(batch_rel_normalized_joint_score)
+        return results
 
-        results['implication_loss'] = (
-            torch.relu(batch_rel_normalized_joint_score - batch_diag_ent_normalized_joint_score).sum(dim=2) +
-            torch.relu(batch_rel_normalized_joint_score.transpose(1, 2) - batch_diag_ent_normalized_joint_score).sum(
-                dim=2))[batch_inputs['joint_label_matrix_mask'][..., 0]].mean()
+    def get_joint_score(self, batch_seq_tokens_encoder_repr, batch_joint_label_matrix_mask):
+        """get_joint_score scores all token pairs by the biaffine classifier
 
-        batch_symmetric_normalized_joint_score = batch_normalized_joint_score[..., self.symmetric_label]
+        Args:
+            batch_seq_tokens_encoder_repr (tensor): batch token representations
+            batch_joint_label_matrix_mask (tensor): batch joint label matrix mask
 
-        results['symmetric_loss'] = torch.abs(batch_symmetric_normalized_joint_score -
-                                              batch_symmetric_normalized_joint_score.transpose(1, 2)).sum(
-                                                  dim=-1)[batch_inputs['joint_label_matrix_mask']].mean()
+        Returns:
+            tensor: batch joint score (logits)
+            tensor: batch normalized joint score (probabilities, 0 outside the mask)
+        """
 
-        return results
+        # autocast is entered here, so the recomputation of a checkpoint runs in the same precision
+        with get_autocast(self.precision, self.device):
+            batch_seq_tokens_head_repr, batch_seq_tokens_tail_repr = self.get_head_tail_repr(
+                batch_seq_tokens_encoder_repr)
+
+            with self.instrumentation.record_function('biaffine_score'):
+                batch_joint_score = self.get_biaffine_score(batch_seq_tokens_head_repr, batch_seq_tokens_tail_repr)
+
+            with self.instrumentation.record_function('softmax'):
+                # softmax is kept in fp32, so are the losses and decoding on top of it
+                batch_normalized_joint_score = torch.softmax(
+                    batch_joint_score, dim=-1,
+                    dtype=torch.float32) * batch_joint_label_matrix_mask.unsqueeze(-1).float()
+
+        return batch_joint_score, batch_normalized_joint_score
+
+    def get_head_tail_repr(self, batch_seq_tokens_encoder_repr):
+        """get_head_tail_repr computes the head and tail representations of tokens,
+        with an appended constant feature for the bias terms of the biaffine classifier
+
+        Args:
+            batch_seq_tokens_encoder_repr (tensor): batch token representations
+
+        Returns:
+            tensor: batch head representations
+            tensor: batch tail representations
+        """
+
+        with self.instrumentation.record_function('head_mlp'):
+            batch_seq_tokens_head_repr = self.head_mlp(batch_seq_tokens_encoder_repr)
+            batch_seq_tokens_head_repr = torch.cat(
+                [batch_seq_tokens_head_repr,
+                 torch.ones_like(batch_seq_tokens_head_repr[..., :1])], dim=-1)
+        with self.instrumentation.record_function('tail_mlp'):
+            batch_seq_tokens_tail_repr = self.tail_mlp(batch_seq_tokens_encoder_repr)
+            batch_seq_tokens_tail_repr = torch.cat(
+                [batch_seq_tokens_tail_repr,
+                 torch.ones_like(batch_seq_tokens_tail_repr[..., :1])], dim=-1)
+
+        return batch_seq_tokens_head_repr, batch_seq_tokens_tail_repr
+
+    def get_biaffine_score(self, batch_seq_tokens_head_repr, batch_seq_tokens_tail_repr):
+        """get_biaffine_score computes the biaffine logits of all head and tail token pairs,
+        with the truncated SVD factors of `U` at inference if `biaffine_rank` > 0
+
+        Args:
+            batch_seq_tokens_head_repr (tensor): batch head representations
+            batch_seq_tokens_tail_repr (tensor): batch tail representations
+
+        Returns:
+            tensor: batch joint score (logits)
+        """
+
+        if self.training or self.biaffine_rank <= 0:
+            return score_projected_head(self.get_head_proj(batch_seq_tokens_head_repr), batch_seq_tokens_tail_repr)
+
+        head_U, tail_U = self.get_low_rank_U(self.biaffine_rank)
+        return low_rank_biaffine_score(batch_seq_tokens_head_repr, head_U, tail_U, batch_seq_tokens_tail_repr)
+
+    def get_head_proj(self, batch_seq_tokens_head_repr):
+        """get_head_proj projects the head representations through `U`,
+        by the int8 head projection if the biaffine weights are quantized
+
+        Args:
+            batch_seq_tokens_head_repr (tensor): batch head representations
+
+        Returns:
+            tensor: batch projected head representations
+        """
+
+        if self.head_projection is None:
+            return project_head(batch_seq_tokens_head_repr, self.U)
+
+        batch_size, seq_len, hidden_size = batch_seq_tokens_head_repr.size()
+        return self.head_projection(batch_seq_tokens_head_repr).view(batch_size, seq_len, -1, hidden_size)
+
+    def quantize_int8(self, biaffine=False):
+        """quantize_int8 applies dynamic int8 quantization for cpu inference after the trained weights are loaded,
+        the linear layers of the encoder and the head/tail mlps get int8 weights and quantize their inputs on the fly.
+        The head projection through `U` is a linear map too, with `biaffine` it is quantized as one linear layer,
+        while the scoring of the projected heads against the tails stays in fp32.
+
+        Args:
+            biaffine (bool, optional): quantize the biaffine weights or not. Defaults to False.
+        """
+
+        if biaffine:
+            num_labels, hidden_size = self.U.size()[:2]
+            self.head_projection = nn.Linear(hidden_size, num_labels * hidden_size, bias=False)
+            # weight[o * h + j, i] = U[o, i, j]
+            self.head_projection.weight.data.copy_(self.U.data.transpose(1, 2).reshape(
+                num_labels * hidden_size, hidden_size))
+        quantize_linear_int8(self)
+        self.eval()
+
+    def get_low_rank_U(self, rank):
+        """get_low_rank_U gets the truncated SVD factors of `U`, which are cached until training
+
+        Args:
+            rank (int): rank
+
+        Returns:
+            tuple: head factors and tail factors
+        """
+
+        if rank not in self.low_rank_U:
+            self.low_rank_U[rank] = factorize_biaffine(self.U.detach(), rank)
+        return self.low_rank_U[rank]
+
+    def train(self, mode=True):
+        """train sets the training mode, the factors of `U` are dropped,
+        since `U` may be updated or reloaded before the next inference
+
+        Args:
+            mode (bool, optional): training mode or evaluation mode. Defaults to True.
+
+        Returns:
+            EntRelJointDecoder: self
+        """
+
+        self.low_rank_U = {}
+        return super().train(mode)
+
+    def get_blockwise_joint_score(self, batch_seq_tokens_encoder_repr, batch_joint_label_matrix,
+                                  batch_joint_label_matrix_mask):
+        """get_blockwise_joint_score scores token pairs block by block of `score_block_size` head tokens,
+        the logits, softmax and element loss of a block are computed together, only the normalized score
+        is written into the output, so the scoring temporaries are bounded by the block size.
+        In training, every block is checkpointed, its logits are recomputed in backward.
+        At inference, `forward` decodes the blocks as they are scored by `streaming_joint_decoding` instead.
+
+        Args:
+            batch_seq_tokens_encoder_repr (tensor): batch token representations
+            batch_joint_label_matrix (tensor): batch gold joint label matrix
+            batch_joint_label_matrix_mask (tensor): batch joint label matrix mask
+
+        Returns:
+            tensor: batch normalized joint score (probabilities, 0 outside the mask)
+            tensor: element loss in training, otherwise None
+        """
+
+        with get_autocast(self.precision, self.device):
+            batch_seq_tokens_head_repr, batch_seq_tokens_tail_repr = self.get_head_tail_repr(
+                batch_seq_tokens_encoder_repr)
+
+        batch_size, seq_len = batch_joint_label_matrix_mask.size()[:2]
+        batch_normalized_joint_score = batch_seq_tokens_head_repr.new_zeros(
+            (batch_size, seq_len, seq_len, self.U.size(0)), dtype=torch.float32)
+        element_losses = []
+        for st in range(0, seq_len, self.score_block_size):
+            ed = min(st + self.score_block_size, seq_len)
+            block_inputs = (batch_seq_tokens_head_repr[:, st:ed], batch_seq_tokens_tail_repr,
+                            batch_joint_label_matrix[:, st:ed], batch_joint_label_matrix_mask[:, st:ed])
+            if self.training:
+                block_element_loss, block_normalized_joint_score = checkpoint(self.get_joint_score_block,
+                                                                              *block_inputs)
+                element_losses.append(block_element_loss)
+            else:
+                _, block_normalized_joint_score = self.get_joint_score_block(*block_inputs)
+            batch_normalized_joint_score[:, st:ed] = block_normalized_joint_score
+
+        if not self.training:
+            return batch_normalized_joint_score, None
+        return batch_normalized_joint_score, torch.stack(element_losses).sum() / batch_joint_label_matrix_mask.sum()
+
+    def get_joint_score_block(self, block_head_repr, batch_seq_tokens_tail_repr, block_joint_label_matrix,
+                              block_joint_label_matrix_mask):
+        """get_joint_score_block scores the token pairs of a block of head tokens
+
+        Args:
+            block_head_repr (tensor): head representations of the block
+            batch_seq_tokens_tail_repr (tensor): batch tail representations
+            block_joint_label_matrix (tensor): gold joint label matrix of the block
+            block_joint_label_matrix_mask (tensor): joint label matrix mask of the block
+
+        Returns:
+            tensor: summed element loss of the block in training, otherwise None
+            tensor: normalized joint score of the block
+        """
+
+        with get_autocast(self.precision, self.device):
+            with self.instrumentation.record_function('biaffine_score'):
+                block_joint_score = self.get_biaffine_score(block_head_repr, batch_seq_tokens_tail_repr)
+
+            with self.instrumentation.record_function('softmax'):
+                block_normalized_joint_score = torch.softmax(
+                    block_joint_score, dim=-1,
+                    dtype=torch.float32) * block_joint_label_matrix_mask.unsqueeze(-1).float()
+
+        if not self.training:
+            return None, block_normalized_joint_score
+
+        with self.instrumentation.record_function('element_loss'):
+            block_element_loss = F.cross_entropy(
+                self.logit_dropout(block_joint_score[block_joint_label_matrix_mask]).float(),
+                block_joint_label_matrix[block_joint_label_matrix_mask],
+                reduction='sum')
+
+        return block_element_loss, block_normalized_joint_score
+
+    def get_symmetric_score_block(self, head_repr, head_proj, tail_repr, joint_label_matrix_mask, st, ed):
+        """get_symmetric_score_block scores the rows `[st, ed)` of one sentence, and the columns `[st, ed)`
+        to average the symmetric labels of the rows as `soft_joint_decoding` does
+
+        Args:
+            head_repr (tensor): head representations of the sentence, (1, n, h)
+            head_proj (tensor): projected head representations of the sentence, (1, n, L, h),
+                None if scored by the truncated SVD factors (`biaffine_rank` > 0)
+            tail_repr (tensor): tail representations of the sentence, (1, n, h)
+            joint_label_matrix_mask (tensor): joint label matrix mask of the sentence, (1, n, n)
+            st (int): first row
+            ed (int): end row
+
+        Returns:
+            tensor: normalized joint score of the rows, (ed - st, n, L)
+            tensor: normalized joint score of the rows with the symmetric labels averaged, (ed - st, n, L)
+        """
+
+        with get_autocast(self.precision, self.device):
+            with self.instrumentation.record_function('biaffine_score'):
+                if head_proj is None:
+                    head_U, tail_U = self.get_low_rank_U(self.biaffine_rank)
+                    row_score = low_rank_biaffine_score(head_repr[:, st:ed], head_U, tail_U, tail_repr)
+                    column_score = low_rank_biaffine_score(head_repr, head_U, tail_U, tail_repr[:, st:ed])
+                else:
+                    row_score = score_projected_head(head_proj[:, st:ed], tail_repr)
+                    column_score = score_projected_head(head_proj, tail_repr[:, st:ed])
+
+            with self.instrumentation.record_function('softmax'):
+                row_normalized_score = torch.softmax(
+                    row_score, dim=-1, dtype=torch.float32) * joint_label_matrix_mask[:, st:ed].unsqueeze(-1).float()
+                column_normalized_score = torch.softmax(
+                    column_score, dim=-1,
+                    dtype=torch.float32) * joint_label_matrix_mask[:, :, st:ed].unsqueeze(-1).float()
+
+        row_normalized_score = row_normalized_score[0]
+        column_normalized_score = column_normalized_score[0].transpose(0, 1)
+        symmetric_score = row_normalized_score.clone()
+        symmetric_score[..., self.symmetric_label] = (row_normalized_score[..., self.symmetric_label] +
+                                                      column_normalized_score[..., self.symmetric_label]) / 2
+        return row_normalized_score, symmetric_score
+
+    def get_candidate_joint_score(self, batch_seq_tokens_encoder_repr, batch_joint_label_matrix_mask):
+        """get_candidate_joint_score is the first stage of the two-stage inference,
+        it scores all token pairs by the rank `candidate_scoring_rank` factors of `U`,
+        and keeps the projected head representations for scoring the candidate blocks exactly
+
+        Args:
+            batch_seq_tokens_encoder_repr (tensor): batch token representations
+            batch_joint_label_matrix_mask (tensor): batch joint label matrix mask
+
+        Returns:
+            tensor: batch approximate normalized joint score (probabilities, 0 outside the mask)
+            tensor: batch projected head representations
+            tensor: batch tail representations
+        """
+
+        with get_autocast(self.precision, self.device):
+            batch_seq_tokens_head_repr, batch_seq_tokens_tail_repr = self.get_head_tail_repr(
+                batch_seq_tokens_encoder_repr)
+
+            with self.instrumentation.record_function('biaffine_score'):
+                head_U, tail_U = self.get_low_rank_U(self.candidate_scoring_rank)
+                batch_joint_score = low_rank_biaffine_score(batch_seq_tokens_head_repr, head_U, tail_U,
+                                                            batch_seq_tokens_tail_repr)
+                batch_seq_tokens_head_proj = self.get_head_proj(batch_seq_tokens_head_repr)
+
+            with self.instrumentation.record_function('softmax'):
+                # the logits are a view of label-major scores, normalizing along the label dimension of
+                # the contiguous layout is much faster than along the strided last dimension of the view
+                batch_normalized_joint_score = torch.softmax(
+                    batch_joint_score.permute(0, 3, 1, 2), dim=1, dtype=torch.float32).permute(
+                        0, 2, 3, 1) * batch_joint_label_matrix_mask.unsqueeze(-1).float()
+
+        return batch_normalized_joint_score, batch_seq_tokens_head_proj, batch_seq_tokens_tail_repr
+
+    def get_losses(self, batch_joint_score, batch_normalized_joint_score, batch_joint_label_matrix,
+                   batch_joint_label_matrix_mask):
+        """get_losses computes the element loss, the implication loss and the symmetric loss
+
+        Args:
+            batch_joint_score (tensor): batch joint score (logits)
+            batch_normalized_joint_score (tensor): batch normalized joint score
+            batch_joint_label_matrix (tensor): batch gold joint label matrix
+            batch_joint_label_matrix_mask (tensor): batch joint label matrix mask
+
+        Returns:
+            tuple: element loss, implication loss, symmetric loss
+        """
+
+        with self.instrumentation.record_function('element_loss'):
+            element_loss = self.element_loss(
+                self.logit_dropout(batch_joint_score[batch_joint_label_matrix_mask]).float(),
+                batch_joint_label_matrix[batch_joint_label_matrix_mask])
+
+        with self.instrumentation.record_function('implication_loss'):
+            implication_loss = self.constraint_loss.get_implication_loss(batch_normalized_joint_score,
+                                                                         batch_joint_label_matrix_mask)
+
+        with self.instrumentation.record_function('symmetric_loss'):
+            symmetric_loss = self.constraint_loss.get_symmetric_loss(batch_normalized_joint_score,
+                                                                     batch_joint_label_matrix_mask)
+
+        return element_loss, implication_loss, symmetric_loss
 
     def hard_joint_decoding(self, batch_normalized_joint_score, batch_seq_tokens_lens):
         """hard_joint_decoding extracts entity and relaition at the same time,
@@ -162,42 +538,30 @@ class EntRelJointDecoder(nn.Module):
             ent_pred = {}
             rel_pred = {}
             ents = []
-            joint_pred = batch_joint_pred[idx]
-            ent_pos = [0] * seq_len
-            for l in range(self.max_span_length, 0, -1):
-                for st in range(0, seq_len - l + 1):
-                    pred_cnt = np.array([0] * joint_label_n)
-                    if any(ent_pos[st:st + l]):
+            # per-label counts of any block are read off the one-hot prefix counts
+            joint_pred = batch_joint_pred[idx][:seq_len, :seq_len]
+            joint_pred_sat = summed_area_table(np.eye(joint_label_n, dtype=np.int64)[joint_pred], dtype=np.int64)
+            ent_pos = np.zeros(seq_len + 1, dtype=np.int64)
+            for l in range(min(self.max_span_length, seq_len), 0, -1):
+                span_st = np.arange(0, seq_len - l + 1)
+                pred_cnt = block_sum(joint_pred_sat, span_st, span_st + l, span_st, span_st + l)
+                preds = ent_label[np.argmax(pred_cnt[:, ent_label], axis=1)]
+                for st in (preds != self.none_idx).nonzero()[0]:
+                    if ent_pos[st:st + l].any():
                         continue
-                    for i in range(st, st + l):
-                        for j in range(st, st + l):
-                            pred_cnt[joint_pred[i][j]] += 1
-                    pred = int(ent_label[np.argmax(pred_cnt[ent_label])])
-                    pred_label = self.vocab.get_token_from_index(pred, 'ent_rel_id')
 
-                    if pred_label == 'None':
-                        continue
-
-                    ents.append((st, st + l))
-                    for i in range(st, st + l):
-                        ent_pos[i] = 1
-                    ent_pred[(st, st + l)] = pred_label
+                    ents.append((st.item(), st.item() + l))
+                    ent_pos[st:st + l] = 1
+                    ent_pred[ents[-1]] = self.vocab.get_token_from_index(preds[st].item(), 'ent_rel_id')
 
-            for idx1 in range(len(ents)):
-                for idx2 in range(len(ents)):
-                    if idx1 == idx2:
-                        continue
-                    pred_cnt = np.array([0] * joint_label_n)
-                    for i in range(ents[idx1][0], ents[idx1][1]):
-                        for j in range(ents[idx2][0], ents[idx2][1]):
-                            pred_cnt[joint_pred[i][j]] += 1
-                    pred = int(rel_label[np.argmax(pred_cnt[rel_label])])
-                    pred_label = self.vocab.get_token_from_index(pred, 'ent_rel_id')
-                    h = ents[idx1][1] - ents[idx1][0]
-                    w = ents[idx2][1] - ents[idx2][0]
-                    if pred_label == 'None':
-                        continue
-                    rel_pred[(ents[idx1], ents[idx2])] = pred_label
+            ent_st = np.array([ent[0] for ent in ents], dtype=np.int64)
+            ent_ed = np.array([ent[1] for ent in ents], dtype=np.int64)
+            pred_cnt = block_sum(joint_pred_sat, ent_st[:, None], ent_ed[:, None], ent_st[None, :], ent_ed[None, :])
+            preds = rel_label[np.argmax(pred_cnt[..., rel_label], axis=-1)]
+            np.fill_diagonal(preds, self.none_idx)
+            for idx1, idx2 in zip(*(preds != self.none_idx).nonzero()):
+                rel_pred[(ents[idx1], ents[idx2])] = self.vocab.get_token_from_index(preds[idx1, idx2].item(),
+                                                                                     'ent_rel_id')
 
             ent_preds.append(ent_pred)
             rel_preds.append(rel_pred)
@@ -213,12 +577,14 @@ class EntRelJointDecoder(nn.Module):
             batch_seq_tokens_lens (list): batch sequence length
 
         Returns:
-            tuple: predicted entity and relation
+            tuple: predicted entity and relation, and their scores (mean probability of the predicted label)
         """
 
         separate_position_preds = []
         ent_preds = []
         rel_preds = []
+        ent_scores = []
+        rel_scores = []
 
         batch_normalized_joint_score = batch_normalized_joint_score.cpu().numpy()
         symmetric_label = self.symmetric_label.cpu().numpy()
@@ -228,45 +594,509 @@ class EntRelJointDecoder(nn.Module):
         for idx, seq_len in enumerate(batch_seq_tokens_lens):
             ent_pred = {}
             rel_pred = {}
+            ent_score = {}
+            rel_score = {}
             joint_score = batch_normalized_joint_score[idx][:seq_len, :seq_len, :]
             joint_score[..., symmetric_label] = (joint_score[..., symmetric_label] +
                                                  joint_score[..., symmetric_label].transpose((1, 0, 2))) / 2
 
-            joint_score_feature = joint_score.reshape(seq_len, -1)
-            transposed_joint_score_feature = joint_score.transpose((1, 0, 2)).reshape(seq_len, -1)
-            separate_pos = (
-                (np.linalg.norm(joint_score_feature[0:seq_len - 1] - joint_score_feature[1:seq_len], axis=1) +
-                 np.linalg.norm(
-                     transposed_joint_score_feature[0:seq_len - 1] - transposed_joint_score_feature[1:seq_len], axis=1))
-                * 0.5 > self.separate_threshold).nonzero()[0]
+            separate_pos, spans = self.get_separate_positions(joint_score)
             separate_position_preds.append([pos.item() for pos in separate_pos])
-            if len(separate_pos) > 0:
-                spans = [(0, separate_pos[0].item() + 1), (separate_pos[-1].item() + 1, seq_len)
-                         ] + [(separate_pos[idx].item() + 1, separate_pos[idx + 1].item() + 1)
-                              for idx in range(len(separate_pos) - 1)]
-            else:
-                spans = [(0, seq_len)]
 
-            ents = []
-            for span in spans:
-                score = np.mean(joint_score[span[0]:span[1], span[0]:span[1], :], axis=(0, 1))
-                if not (np.max(score[ent_label]) < score[self.none_idx]):
-                    pred = ent_label[np.argmax(score[ent_label])].item()
-                    pred_label = self.vocab.get_token_from_index(pred, 'ent_rel_id')
-                    ents.append(span)
-                    ent_pred[span] = pred_label
-
-            for ent1 in ents:
-                for ent2 in ents:
-                    if ent1 == ent2:
-                        continue
-                    score = np.mean(joint_score[ent1[0]:ent1[1], ent2[0]:ent2[1], :], axis=(0, 1))
-                    if not (np.max(score[rel_label]) < score[self.none_idx]):
-                        pred = rel_label[np.argmax(score[rel_label])].item()
-                        pred_label = self.vocab.get_token_from_index(pred, 'ent_rel_id')
-                        rel_pred[(ent1, ent2)] = pred_label
+            # the spans partition the sentence, so every block mean is read off
+            # one summed-area table with O(1) lookups per span (pair)
+            span_st = np.array([span[0] for span in spans])
+            span_ed = np.array([span[1] for span in spans])
+            joint_score_sat = summed_area_table(joint_score)
+
+            span_area = (span_ed - span_st)[:, None]
+            span_score = block_sum(joint_score_sat, span_st, span_ed, span_st, span_ed) / (span_area * span_area)
+            ent_ids = self.get_entities(spans, span_score, ent_label, ent_pred, ent_score)
+            ents = [spans[ent_id] for ent_id in ent_ids]
+            ent_st, ent_ed = span_st[ent_ids], span_ed[ent_ids]
+
+            pair_area = ((ent_ed - ent_st)[:, None] * (ent_ed - ent_st)[None, :])[..., None]
+            pair_score = block_sum(joint_score_sat, ent_st[:, None], ent_ed[:, None], ent_st[None, :],
+                                   ent_ed[None, :]) / pair_area
+            self.get_relations(ents, pair_score, rel_label, rel_pred, rel_score)
 
             ent_preds.append(ent_pred)
             rel_preds.append(rel_pred)
+            ent_scores.append(ent_score)
+            rel_scores.append(rel_score)
 
-        return separate_position_preds, ent_preds, rel_preds
+        return separate_position_preds, ent_preds, rel_preds, ent_scores, rel_scores
+
+    def get_separate_positions(self, joint_score):
+        """get_separate_positions finds the positions between two adjacent rows (columns)
+        whose scores differ by more than `separate_threshold`, which split the sentence into spans
+
+        Args:
+            joint_score (np.array): normalized joint score of one sentence (symmetric labels averaged)
+
+        Returns:
+            np.array: separate positions
+            list: spans, the first span, the last span, then the middle ones
+        """
+
+        seq_len = joint_score.shape[0]
+        joint_score_feature = joint_score.reshape(seq_len, -1)
+        transposed_joint_score_feature = joint_score.transpose((1, 0, 2)).reshape(seq_len, -1)
+        separate_pos = ((np.linalg.norm(
+            (joint_score_feature[0:seq_len - 1] - joint_score_feature[1:seq_len]).astype(np.float64), axis=1) +
+                         np.linalg.norm((transposed_joint_score_feature[0:seq_len - 1] -
+                                         transposed_joint_score_feature[1:seq_len]).astype(np.float64),
+                                        axis=1)) * 0.5 > self.separate_threshold).nonzero()[0]
+
+        return separate_pos, self.get_spans(separate_pos, seq_len)
+
+    def get_spans(self, separate_pos, seq_len):
+        """get_spans splits the sentence into spans at the separate positions
+
+        Args:
+            separate_pos (np.array): separate positions
+            seq_len (int): sequence length
+
+        Returns:
+            list: spans, the first span, the last span, then the middle ones
+        """
+
+        if len(separate_pos) > 0:
+            spans = [(0, separate_pos[0].item() + 1), (separate_pos[-1].item() + 1, seq_len)
+                     ] + [(separate_pos[idx].item() + 1, separate_pos[idx + 1].item() + 1)
+                          for idx in range(len(separate_pos) - 1)]
+        else:
+            spans = [(0, seq_len)]
+
+        return spans
+
+    def get_entities(self, spans, span_score, ent_label, ent_pred, ent_score):
+        """get_entities decides the spans whose best entity label outscores the `None` label as entities
+
+        Args:
+            spans (list): spans
+            span_score (np.array): mean probabilities of the span blocks, (span num, label num)
+            ent_label (np.array): entity labels
+            ent_pred (dict): span to predicted entity label, filled in place
+            ent_score (dict): span to entity score, filled in place
+
+        Returns:
+            np.array: ids of the entity spans
+        """
+
+        is_ent = ~(np.max(span_score[:, ent_label], axis=1) < span_score[:, self.none_idx])
+        ent_ids = is_ent.nonzero()[0]
+        for ent_id, pred in zip(ent_ids, ent_label[np.argmax(span_score[ent_ids][:, ent_label], axis=1)]):
+            ent_pred[spans[ent_id]] = self.vocab.get_token_from_index(pred.item(), 'ent_rel_id')
+            ent_score[spans[ent_id]] = span_score[ent_id, pred].item()
+
+        return ent_ids
+
+    def get_relations(self, ents, pair_score, rel_label, rel_pred, rel_score):
+        """get_relations decides the entity pairs whose best relation label outscores the `None` label as relations
+
+        Args:
+            ents (list): entity spans
+            pair_score (np.array): mean probabilities of the entity pair blocks, (entity num, entity num, label num)
+            rel_label (np.array): relation labels
+            rel_pred (dict): entity pair to predicted relation label, filled in place
+            rel_score (dict): entity pair to relation score, filled in place
+        """
+
+        is_rel = ~(np.max(pair_score[..., rel_label], axis=-1) < pair_score[..., self.none_idx])
+        np.fill_diagonal(is_rel, False)
+        for idx1, idx2 in zip(*is_rel.nonzero()):
+            pred = rel_label[np.argmax(pair_score[idx1, idx2, rel_label])].item()
+            rel_pred[(ents[idx1], ents[idx2])] = self.vocab.get_token_from_index(pred, 'ent_rel_id')
+            rel_score[(ents[idx1], ents[idx2])] = pair_score[idx1, idx2, pred].item()
+
+    def batched_soft_joint_decoding(self, batch_normalized_joint_score, batch_seq_tokens_lens):
+        """batched_soft_joint_decoding is the tensor form of `soft_joint_decoding`,
+        it decodes the whole batch on the device of the score tensor and only copies
+        the compact span and label results back to the host.
+        Note that the symmetric labels of `batch_normalized_joint_score` are averaged in place.
+
+        Args:
+            batch_normalized_joint_score (tensor): batch normalized joint score (padding cells are zero)
+            batch_seq_tokens_lens (list): batch sequence length
+
+        Returns:
+            tuple: predicted entity and relation, and their scores (mean probability of the predicted label)
+        """
+
+        batch_size, max_seq_len = batch_normalized_joint_score.size()[:2]
+        device = batch_normalized_joint_score.device
+        seq_lens = torch.as_tensor(batch_seq_tokens_lens, dtype=torch.long, device=device)
+        symmetric_label = self.symmetric_label.to(device)
+        ent_label = self.ent_label.to(device)
+        rel_label = self.rel_label.to(device)
+
+        # padding cells are zero, so averaging the whole batch equals averaging each sentence
+        joint_score = batch_normalized_joint_score
+        joint_score[..., symmetric_label] = (joint_score[..., symmetric_label] +
+                                             joint_score[..., symmetric_label].transpose(1, 2)) / 2
+
+        separate_score = (torch.norm(joint_score[:, :-1] - joint_score[:, 1:], dim=(2, 3), dtype=torch.float64) +
+                          torch.norm(joint_score[:, :, :-1] - joint_score[:, :, 1:], dim=(1, 3),
+                                     dtype=torch.float64)) * 0.5
+        positions = torch.arange(max_seq_len, device=device)
+        batch_separate_pos = (separate_score > self.separate_threshold) & (positions[:-1].unsqueeze(0) <
+                                                                           (seq_lens - 1).unsqueeze(1))
+
+        # a span ends after every separate position and at the last token
+        span_end_flag = torch.cat([batch_separate_pos, batch_separate_pos.new_zeros(batch_size, 1)], dim=1)
+        span_end_flag |= positions.unsqueeze(0) == (seq_lens - 1).unsqueeze(1)
+        span_cnt = span_end_flag.sum(dim=1)
+        max_span_cnt = max(span_cnt.max().item(), 1)
+        span_batch_idx, span_end_pos = span_end_flag.nonzero(as_tuple=True)
+        span_rank = span_end_flag.long().cumsum(dim=1)[span_batch_idx, span_end_pos] - 1
+        span_ed = seq_lens.new_zeros(batch_size, max_span_cnt)
+        span_ed[span_batch_idx, span_rank] = span_end_pos + 1
+        span_st = torch.cat([span_ed.new_zeros(batch_size, 1), span_ed[:, :-1]], dim=1)
+        span_valid = torch.arange(max_span_cnt, device=device).unsqueeze(0) < span_cnt.unsqueeze(1)
+        span_st = span_st * span_valid
+        span_size = span_ed - span_st
+
+        joint_score_sat = batched_summed_area_table(joint_score)
+        span_area = span_size.clamp(min=1).double().unsqueeze(-1)
+        span_score = batched_block_sum(joint_score_sat, span_st, span_ed, span_st, span_ed) / (span_area * span_area)
+        ent_max_score, ent_pred_idx = torch.max(span_score[..., ent_label], dim=-1)
+        is_ent = ~(ent_max_score < span_score[..., self.none_idx]) & span_valid
+        ent_pred = ent_label[ent_pred_idx]
+
+        pair_area = (span_area.unsqueeze(2) * span_area.unsqueeze(1))
+        pair_score = batched_block_sum(joint_score_sat, span_st.unsqueeze(2), span_ed.unsqueeze(2),
+                                       span_st.unsqueeze(1), span_ed.unsqueeze(1)) / pair_area
+        rel_max_score, rel_pred_idx = torch.max(pair_score[..., rel_label], dim=-1)
+        is_rel = ~(rel_max_score < pair_score[..., self.none_idx]) & is_ent.unsqueeze(2) & is_ent.unsqueeze(1)
+        is_rel &= ~torch.eye(max_span_cnt, dtype=torch.bool, device=device).unsqueeze(0)
+        rel_pred = rel_label[rel_pred_idx]
+
+        batch_separate_pos = batch_separate_pos.cpu().numpy()
+        span_cnt = span_cnt.tolist()
+        batch_spans = torch.stack([span_st, span_ed], dim=-1).tolist()
+        batch_is_ent, batch_ent_pred = is_ent.cpu().numpy(), ent_pred.cpu().numpy()
+        batch_is_rel, batch_rel_pred = is_rel.cpu().numpy(), rel_pred.cpu().numpy()
+        batch_ent_score, batch_rel_score = ent_max_score.cpu().numpy(), rel_max_score.cpu().numpy()
+
+        separate_position_preds = []
+        ent_preds = []
+        rel_preds = []
+        ent_scores = []
+        rel_scores = []
+        for idx in range(batch_size):
+            ent_pred = {}
+            rel_pred = {}
+            ent_score = {}
+            rel_score = {}
+            separate_position_preds.append(batch_separate_pos[idx].nonzero()[0].tolist())
+            spans = [tuple(span) for span in batch_spans[idx]]
+
+            # same span order as `soft_joint_decoding`: first span, last span, then the middle ones
+            span_order = [0] + list(range(1, span_cnt[idx]))[-1:] + list(range(1, span_cnt[idx] - 1))
+            ent_ids = [span_id for span_id in span_order if batch_is_ent[idx, span_id]]
+            for span_id in ent_ids:
+                ent_pred[spans[span_id]] = self.vocab.get_token_from_index(batch_ent_pred[idx, span_id].item(),
+                                                                           'ent_rel_id')
+                ent_score[spans[span_id]] = batch_ent_score[idx, span_id].item()
+
+            ent_ids = np.array(ent_ids, dtype=np.int64)
+            for idx1, idx2 in zip(*batch_is_rel[idx][np.ix_(ent_ids, ent_ids)].nonzero()):
+                span_id1, span_id2 = ent_ids[idx1], ent_ids[idx2]
+                rel_pred[(spans[span_id1], spans[span_id2])] = self.vocab.get_token_from_index(
+                    batch_rel_pred[idx, span_id1, span_id2].item(), 'ent_rel_id')
+                rel_score[(spans[span_id1], spans[span_id2])] = batch_rel_score[idx, span_id1, span_id2].item()
+
+            ent_preds.append(ent_pred)
+            rel_preds.append(rel_pred)
+            ent_scores.append(ent_score)
+            rel_scores.append(rel_score)
+
+        return separate_position_preds, ent_preds, rel_preds, ent_scores, rel_scores
+
+    def streaming_joint_decoding(self, batch_seq_tokens_encoder_repr, batch_joint_label_matrix_mask,
+                                 batch_seq_tokens_lens):
+        """streaming_joint_decoding is `soft_joint_decoding` on scores computed block by block of `score_block_size`
+        rows, the normalized joint score of a sentence is never kept, so the memory of inference on long inputs
+        is bounded by the block size (and the (n, n) joint label preds).
+        The rows of a sentence are scored twice: the first pass accumulates the distances between adjacent rows
+        (columns) for the separate positions, the second one accumulates the sums of the span blocks
+        and of the blocks of the entity spans against all spans.
+        Every block also scores its columns for the symmetric labels, so the scoring costs four full scorings.
+
+        Args:
+            batch_seq_tokens_encoder_repr (tensor): batch token representations
+            batch_joint_label_matrix_mask (tensor): batch joint label matrix mask
+            batch_seq_tokens_lens (list): batch sequence length
+
+        Returns:
+            tensor: batch joint label preds
+            tuple: predicted entity and relation, and their scores (mean probability of the predicted label)
+        """
+
+        with get_autocast(self.precision, self.device):
+            batch_seq_tokens_head_repr, batch_seq_tokens_tail_repr = self.get_head_tail_repr(
+                batch_seq_tokens_encoder_repr)
+            # the heads are projected once for all row and column blocks
+            batch_seq_tokens_head_proj = None
+            if self.biaffine_rank <= 0:
+                batch_seq_tokens_head_proj = self.get_head_proj(batch_seq_tokens_head_repr)
+
+        batch_size, max_seq_len = batch_joint_label_matrix_mask.size()[:2]
+        batch_joint_label_preds = batch_joint_label_matrix_mask.new_zeros((batch_size, max_seq_len, max_seq_len),
+                                                                          dtype=torch.long)
+
+        separate_position_preds = []
+        ent_preds = []
+        rel_preds = []
+        ent_scores = []
+        rel_scores = []
+
+        ent_label = self.ent_label.cpu().numpy()
+        rel_label = self.rel_label.cpu().numpy()
+
+        for idx, seq_len in enumerate(batch_seq_tokens_lens):
+            ent_pred = {}
+            rel_pred = {}
+            ent_score = {}
+            rel_score = {}
+            get_score_block = functools.partial(
+                self.get_symmetric_score_block, batch_seq_tokens_head_repr[idx:idx + 1, :seq_len],
+                None if batch_seq_tokens_head_proj is None else batch_seq_tokens_head_proj[idx:idx + 1, :seq_len],
+                batch_seq_tokens_tail_repr[idx:idx + 1, :seq_len],
+                batch_joint_label_matrix_mask[idx:idx + 1, :seq_len, :seq_len])
+
+            # squared distances between adjacent rows and adjacent columns
+            row_distance = torch.zeros(max(seq_len - 1, 0),
+                                       dtype=torch.float64,
+                                       device=batch_seq_tokens_head_repr.device)
+            column_distance = torch.zeros_like(row_distance)
+            last_row = None
+            for st in range(0, seq_len, self.score_block_size):
+                ed = min(st + self.score_block_size, seq_len)
+                normalized_score, symmetric_score = get_score_block(st, ed)
+                batch_joint_label_preds[idx, st:ed, :seq_len] = torch.argmax(normalized_score, dim=-1)
+
+                if last_row is not None:
+                    row_distance[st - 1] = (symmetric_score[0] - last_row).double().pow(2).sum()
+                row_distance[st:ed - 1] = (symmetric_score[1:] - symmetric_score[:-1]).double().pow(2).sum((1, 2))
+                column_distance += (symmetric_score[:, 1:] - symmetric_score[:, :-1]).double().pow(2).sum((0, 2))
+                last_row = symmetric_score[-1]
+
+            separate_pos = (((row_distance.sqrt() + column_distance.sqrt()) * 0.5).cpu().numpy() >
+                            self.separate_threshold).nonzero()[0]
+            separate_position_preds.append([pos.item() for pos in separate_pos])
+            spans = self.get_spans(separate_pos, seq_len)
+            span_st = np.array([span[0] for span in spans])
+            span_ed = np.array([span[1] for span in spans])
+
+            span_score = np.zeros((len(spans), self.U.size(0)))
+            # sums of the spans against all spans, accumulated block by block until the span ends,
+            # only the ones of the entity spans are kept for the relations
+            open_span_sum = {}
+            ent_span_sum = {}
+            token_span_ids = np.zeros(seq_len, dtype=np.int64)
+            for span_id, span in enumerate(spans):
+                token_span_ids[span[0]:span[1]] = span_id
+            token_span_ids_tensor = torch.as_tensor(token_span_ids, device=batch_seq_tokens_head_repr.device)
+            for st in range(0, seq_len, self.score_block_size):
+                ed = min(st + self.score_block_size, seq_len)
+                _, symmetric_score = get_score_block(st, ed)
+
+                # row sums of the spans overlapping the block, then their column sums
+                # (summed directly, prefix sums would turn exact zeros into rounding noise)
+                block_span_ids, row_span_ids = np.unique(token_span_ids[st:ed], return_inverse=True)
+                row_span_ids = torch.as_tensor(row_span_ids, device=symmetric_score.device)
+                span_row_sum = symmetric_score.new_zeros((len(block_span_ids), seq_len, symmetric_score.size(-1)),
+                                                         dtype=torch.float64).index_add_(0, row_span_ids,
+                                                                                         symmetric_score.double())
+                block_span_sum = span_row_sum.new_zeros(
+                    (len(block_span_ids), len(spans), span_row_sum.size(-1))).index_add_(1, token_span_ids_tensor,
+                                                                                         span_row_sum).cpu().numpy()
+                for span_id, span_sum in zip(block_span_ids, block_span_sum):
+                    open_span_sum[span_id] = open_span_sum.get(span_id, 0.0) + span_sum
+
+                end_span_ids = block_span_ids[span_ed[block_span_ids] <= ed]
+                if len(end_span_ids) == 0:
+                    continue
+                end_span_sum = np.stack([open_span_sum.pop(span_id) for span_id in end_span_ids])
+                span_area = (span_ed[end_span_ids] - span_st[end_span_ids])[:, None]
+                span_score[end_span_ids] = end_span_sum[np.arange(len(end_span_ids)),
+                                                        end_span_ids] / (span_area * span_area)
+                for block_ent_id in self.get_entities([spans[span_id] for span_id in end_span_ids],
+                                                      span_score[end_span_ids], ent_label, {}, {}):
+                    ent_span_sum[end_span_ids[block_ent_id]] = end_span_sum[block_ent_id]
+
+            ent_ids = self.get_entities(spans, span_score, ent_label, ent_pred, ent_score)
+            ents = [spans[ent_id] for ent_id in ent_ids]
+            ent_st, ent_ed = span_st[ent_ids], span_ed[ent_ids]
+
+            pair_sum = np.array([ent_span_sum[ent_id][ent_ids] for ent_id in ent_ids]).reshape(
+                len(ent_ids), len(ent_ids), span_score.shape[-1])
+            pair_area = ((ent_ed - ent_st)[:, None] * (ent_ed - ent_st)[None, :])[..., None]
+            self.get_relations(ents, pair_sum / pair_area, rel_label, rel_pred, rel_score)
+
+            ent_preds.append(ent_pred)
+            rel_preds.append(rel_pred)
+            ent_scores.append(ent_score)
+            rel_scores.append(rel_score)
+
+        return batch_joint_label_preds, (separate_position_preds, ent_preds, rel_preds, ent_scores, rel_scores)
+
+    def candidate_joint_decoding(self, batch_normalized_joint_score, batch_seq_tokens_head_proj,
+                                 batch_seq_tokens_tail_repr, batch_seq_tokens_lens):
+        """candidate_joint_decoding is the second stage of the two-stage inference,
+        the spans are found on the approximate scores of the first stage, then the exact biaffine scores
+        are only computed for the diagonal span blocks and the blocks of the entity pairs.
+        The predictions equal `soft_joint_decoding` on the exact scores whenever the spans are the same.
+
+        Args:
+            batch_normalized_joint_score (tensor): batch approximate normalized joint score
+            batch_seq_tokens_head_proj (tensor): batch projected head representations
+            batch_seq_tokens_tail_repr (tensor): batch tail representations
+            batch_seq_tokens_lens (list): batch sequence length
+
+        Returns:
+            tuple: predicted entity and relation, and their scores (mean probability of the predicted label)
+        """
+
+        separate_position_preds = []
+        ent_preds = [{} for _ in batch_seq_tokens_lens]
+        rel_preds = [{} for _ in batch_seq_tokens_lens]
+        ent_scores = [{} for _ in batch_seq_tokens_lens]
+        rel_scores = [{} for _ in batch_seq_tokens_lens]
+
+        batch_normalized_joint_score = batch_normalized_joint_score.cpu().numpy()
+        symmetric_label = self.symmetric_label.cpu().numpy()
+        ent_label = self.ent_label.cpu().numpy()
+        rel_label = self.rel_label.cpu().numpy()
+
+        batch_spans = []
+        for idx, seq_len in enumerate(batch_seq_tokens_lens):
+            joint_score = batch_normalized_joint_score[idx][:seq_len, :seq_len, :]
+            joint_score[..., symmetric_label] = (joint_score[..., symmetric_label] +
+                                                 joint_score[..., symmetric_label].transpose((1, 0, 2))) / 2
+            separate_pos, spans = self.get_separate_positions(joint_score)
+            separate_position_preds.append([pos.item() for pos in separate_pos])
+            batch_spans.append(spans)
+
+        # every token is scored against the tokens of its own span
+        batch_span_score = self.get_candidate_span_score(batch_seq_tokens_head_proj, batch_seq_tokens_tail_repr,
+                                                         batch_spans)
+        batch_ents = []
+        for idx, spans in enumerate(batch_spans):
+            ent_ids = self.get_entities(spans, batch_span_score[idx], ent_label, ent_preds[idx], ent_scores[idx])
+            batch_ents.append([spans[ent_id] for ent_id in ent_ids])
+
+        # the tokens of all entities are scored against each other
+        batch_pair_score = self.get_candidate_pair_score(batch_seq_tokens_head_proj, batch_seq_tokens_tail_repr,
+                                                         batch_ents)
+        for idx, ents in enumerate(batch_ents):
+            if len(ents) == 0:
+                continue
+            pair_score = batch_pair_score[idx]
+            pair_score[..., symmetric_label] = (pair_score[..., symmetric_label] +
+                                                pair_score[..., symmetric_label].transpose((1, 0, 2))) / 2
+            self.get_relations(ents, pair_score, rel_label, rel_preds[idx], rel_scores[idx])
+
+        return separate_position_preds, ent_preds, rel_preds, ent_scores, rel_scores
+
+    def get_candidate_span_score(self, batch_seq_tokens_head_proj, batch_seq_tokens_tail_repr, batch_spans):
+        """get_candidate_span_score computes the mean probabilities of the diagonal span blocks,
+        the spans of the same length in the batch are scored by one batched matmul
+
+        Args:
+            batch_seq_tokens_head_proj (tensor): batch projected head representations
+            batch_seq_tokens_tail_repr (tensor): batch tail representations
+            batch_spans (list): batch spans
+
+        Returns:
+            list: batch mean probabilities of the span blocks, (span num, label num) for each sentence
+        """
+
+        num_labels, hidden_size = batch_seq_tokens_head_proj.size()[2:]
+        device = batch_seq_tokens_tail_repr.device
+        batch_span_score = [np.empty((len(spans), num_labels)) for spans in batch_spans]
+
+        len2spans = {}
+        for idx, spans in enumerate(batch_spans):
+            for span_id, (st, ed) in enumerate(spans):
+                len2spans.setdefault(ed - st, []).append((idx, span_id, st))
+
+        for span_len, len_spans in len2spans.items():
+            batch_idx = torch.as_tensor([idx for idx, _, _ in len_spans], device=device).unsqueeze(-1)
+            span_st = torch.as_tensor([st for _, _, st in len_spans], device=device).unsqueeze(-1)
+            positions = span_st + torch.arange(span_len, device=device)
+            block_head_proj = batch_seq_tokens_head_proj[batch_idx, positions]
+            block_tail_repr = batch_seq_tokens_tail_repr[batch_idx, positions]
+
+            with get_autocast(self.precision, self.device):
+                with self.instrumentation.record_function('biaffine_score'):
+                    # (N, l * L, h) x (N, h, l) -> (N, l, L, l)
+                    block_score = torch.bmm(block_head_proj.reshape(-1, span_len * num_labels, hidden_size),
+                                            block_tail_repr.transpose(1, 2)).view(-1, span_len, num_labels, span_len)
+                block_score = torch.softmax(block_score, dim=2, dtype=torch.float32)
+            # summed in float64 as the summed-area tables
+            block_score = (block_score.double().sum(dim=(1, 3)) / (span_len * span_len)).cpu().numpy()
+
+            for (idx, span_id, _), span_score in zip(len_spans, block_score):
+                batch_span_score[idx][span_id] = span_score
+
+        return batch_span_score
+
+    def get_candidate_pair_score(self, batch_seq_tokens_head_proj, batch_seq_tokens_tail_repr, batch_ents):
+        """get_candidate_pair_score computes the mean probabilities of the entity pair blocks,
+        only the concatenated tokens of the entities are scored
+
+        Args:
+            batch_seq_tokens_head_proj (tensor): batch projected head representations
+            batch_seq_tokens_tail_repr (tensor): batch tail representations
+            batch_ents (list): batch entity spans
+
+        Returns:
+            list: batch mean probabilities of the entity pair blocks, (entity num, entity num, label num)
+            for each sentence with entities, None otherwise
+        """
+
+        batch_size = len(batch_ents)
+        max_ent_tokens = max([sum(ed - st for st, ed in ents) for ents in batch_ents] + [0])
+        if max_ent_tokens == 0:
+            return [None] * batch_size
+
+        ent_token_idx = np.zeros((batch_size, max_ent_tokens), dtype=np.int64)
+        for idx, ents in enumerate(batch_ents):
+            ent_tokens = [pos for st, ed in ents for pos in range(st, ed)]
+            ent_token_idx[idx, :len(ent_tokens)] = ent_tokens
+
+        device = batch_seq_tokens_tail_repr.device
+        ent_token_idx = torch.from_numpy(ent_token_idx).to(device)
+        batch_idx = torch.arange(batch_size, device=device).unsqueeze(-1)
+        ent_head_proj = batch_seq_tokens_head_proj[batch_idx, ent_token_idx]
+        ent_tail_repr = batch_seq_tokens_tail_repr[batch_idx, ent_token_idx]
+        num_labels, hidden_size = ent_head_proj.size()[2:]
+
+        with get_autocast(self.precision, self.device):
+            with self.instrumentation.record_function('biaffine_score'):
+                # (B, E * L, h) x (B, h, E) -> (B, E, L, E)
+                ent_score = torch.bmm(ent_head_proj.reshape(batch_size, max_ent_tokens * num_labels, hidden_size),
+                                      ent_tail_repr.transpose(1, 2)).view(batch_size, max_ent_tokens, num_labels,
+                                                                         max_ent_tokens)
+            ent_score = torch.softmax(ent_score, dim=2, dtype=torch.float32).transpose(2, 3)
+        batch_ent_score = ent_score.double().cpu().numpy()
+
+        batch_pair_score = []
+        for idx, ents in enumerate(batch_ents):
+            if len(ents) == 0:
+                batch_pair_score.append(None)
+                continue
+            ent_len = np.array([ed - st for st, ed in ents])
+            ent_st = np.concatenate([[0], np.cumsum(ent_len)[:-1]])
+            num_ent_tokens = ent_len.sum()
+            pair_score = np.add.reduceat(np.add.reduceat(batch_ent_score[idx][:num_ent_tokens, :num_ent_tokens],
+                                                         ent_st,
+                                                         axis=0),
+                                         ent_st,
+                                         axis=1)
+            batch_pair_score.append(pair_score / (ent_len[:, None] * ent_len[None, :])[..., None])
+
+        return batch_pair_score
@@ -0,0 +1,161 @@
+import importlib.util
+import inspect
+import logging
+
+import torch
+import torch.nn as nn
+
+from models.embedding_models.bert_embedding_model import BertEmbedModel
+
+logger = logging.getLogger(__name__)
+
+SCORER_INPUT_NAMES = ['wordpiece_tokens', 'wordpiece_segment_ids', 'wordpiece_tokens_index', 'joint_label_matrix_mask']
+SCORER_OUTPUT_NAMES = ['normalized_joint_score']
+SCORER_DYNAMIC_AXES = {
+    'wordpiece_tokens': {
+        0: 'batch_size',
+        1: 'wordpiece_len'
+    },
+    'wordpiece_segment_ids': {
+        0: 'batch_size',
+        1: 'wordpiece_len'
+    },
+    'wordpiece_tokens_index': {
+        0: 'batch_size',
+        1: 'seq_len'
+    },
+    'joint_label_matrix_mask': {
+        0: 'batch_size',
+        1: 'seq_len',
+        2: 'seq_len'
+    },
+    'normalized_joint_score': {
+        0: 'batch_size',
+        1: 'seq_len',
+        2: 'seq_len'
+    }
+}
+
+
+class EntRelJointScorer(nn.Module):
+    """This class is the pure tensor scoring graph of a trained `EntRelJointDecoder`:
+    wordpiece ids, segment ids, token index map and joint label matrix mask in, normalized joint score out.
+    Unlike `EntRelJointDecoder.forward`, it neither reads nor writes a batch dict, has no training branch
+    and no numpy decoding, so it can be traced into TorchScript and exported to ONNX with dynamic batch
+    and sequence axes, its output is decoded by `soft_joint_decoding`
+    """
+    def __init__(self, model):
+        """This function wraps the trained model, which is switched to evaluation mode
+
+        Arguments:
+            model {EntRelJointDecoder} -- trained model (bert embedding model, fp32, not quantized)
+        """
+
+        super().__init__()
+        if not isinstance(model.embedding_model, BertEmbedModel):
+            logger.error("Only the bert embedding model can be exported.")
+            raise RuntimeError("Only the bert embedding model can be exported.")
+        if model.head_projection is not None:
+            logger.error("The dynamic int8 model can not be exported, export the fp32 model instead.")
+            raise RuntimeError("The dynamic int8 model can not be exported, export the fp32 model instead.")
+
+        self.model = model
+        self.eval()
+
+    def forward(self, wordpiece_tokens, wordpiece_segment_ids, wordpiece_tokens_index, joint_label_matrix_mask):
+        """This function scores all token pairs
+
+        Arguments:
+            wordpiece_tokens {tensor} -- wordpiece ids, (batch size, wordpiece len)
+            wordpiece_segment_ids {tensor} -- segment ids, (batch size, wordpiece len)
+            wordpiece_tokens_index {tensor} -- wordpiece index of every token, (batch size, seq len)
+            joint_label_matrix_mask {tensor} -- joint label matrix mask, (batch size, seq len, seq len)
+
+        Returns:
+            tensor -- normalized joint score, (batch size, seq len, seq len, label num)
+        """
+
+        batch_seq_bert_encoder_repr, _ = self.model.embedding_model.bert_encoder(wordpiece_tokens,
+                                                                                 wordpiece_segment_ids)
+
+        # a gather instead of `batched_index_select`, whose range check is not traceable
+        batch_seq_tokens_encoder_repr = torch.gather(
+            batch_seq_bert_encoder_repr, 1,
+            wordpiece_tokens_index.unsqueeze(-1).expand(-1, -1, batch_seq_bert_encoder_repr.size(-1)))
+
+        _, batch_normalized_joint_score = self.model.get_joint_score(batch_seq_tokens_encoder_repr,
+                                                                     joint_label_matrix_mask)
+        return batch_normalized_joint_score
+
+    def get_example_inputs(self, batch_size=2, seq_len=8):
+        """This function builds random inputs for tracing and checking the exported graph
+
+        Keyword Arguments:
+            batch_size {int} -- batch size (default: {2})
+            seq_len {int} -- sequence length, one wordpiece per token plus `[CLS]` and `[SEP]` (default: {8})
+
+        Returns:
+            tuple -- wordpiece ids, segment ids, token index map and joint label matrix mask
+        """
+
+        vocab_size = self.model.embedding_model.bert_encoder.bert_model.config.vocab_size
+        wordpiece_tokens = torch.randint(1, vocab_size, (batch_size, seq_len + 2), dtype=torch.long)
+        wordpiece_segment_ids = torch.zeros_like(wordpiece_tokens)
+        wordpiece_tokens_index = torch.arange(1, seq_len + 1, dtype=torch.long).unsqueeze(0).repeat(batch_size, 1)
+        joint_label_matrix_mask = torch.ones(batch_size, seq_len, seq_len, dtype=torch.bool)
+        return wordpiece_tokens, wordpiece_segment_ids, wordpiece_tokens_index, joint_label_matrix_mask
+
+
+def export_torchscript(scorer, example_inputs, file_path):
+    """export_torchscript traces the scorer into TorchScript, sizes are traced as operators,
+    so the batch and sequence axes stay dynamic
+
+    Args:
+        scorer (EntRelJointScorer): scorer
+        example_inputs (tuple): example inputs
+        file_path (str): TorchScript file path
+    """
+
+    with torch.no_grad():
+        traced_scorer = torch.jit.trace(scorer, example_inputs, check_trace=False)
+    traced_scorer.save(file_path)
+
+
+def get_default_opset_version():
+    """get_default_opset_version picks the ONNX opset version of the export,
+    the scaled dot product attention of newer transformers is only exported since opset 14
+
+    Returns:
+        int: 14 if the installed pytorch exports it (pytorch >= 1.10), else 13 (the highest one of pytorch 1.8)
+    """
+
+    if importlib.util.find_spec('torch.onnx.symbolic_opset14') is not None:
+        return 14
+    return 13
+
+
+def export_onnx(scorer, example_inputs, file_path, opset_version):
+    """export_onnx exports the scorer to ONNX with dynamic batch and sequence axes
+
+    Args:
+        scorer (EntRelJointScorer): scorer
+        example_inputs (tuple): example inputs
+        file_path (str): ONNX file path
+        opset_version (int): ONNX opset version
+    """
+
+    export_kwargs = {}
+    # the dynamo exporter is the default since pytorch 2.9, the traced graph is exported as before
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs['dynamo'] = False
+
+    with torch.no_grad():
+        torch.onnx.export(scorer,
+                          example_inputs,
+                          file_path,
+                          input_names=SCORER_INPUT_NAMES,
+                          output_names=SCORER_OUTPUT_NAMES,
+                          dynamic_axes=SCORER_DYNAMIC_AXES,
+                          opset_version=opset_version,
+                          do_constant_folding=True,
+                          **export_kwargs)
@@ -0,0 +1,143 @@
+import torch
+import torch.nn as nn
+
+
+class SymmetricDifference(torch.autograd.Function):
+    """This function computes `|s[b, x, y, k] - s[b, y, x, k]|` summed over symmetric labels `k` for all pairs,
+    row block by row block, the differences are not saved for backward but recomputed per block,
+    forward and backward results are identical to the composition of pytorch operations
+    """
+    @staticmethod
+    def forward(ctx, batch_normalized_joint_score, symmetric_label, block_size):
+        """This function computes the symmetric differences
+
+        Arguments:
+            batch_normalized_joint_score {tensor} -- batch normalized joint score (B, n, n, L)
+            symmetric_label {tensor} -- symmetric label ids
+            block_size {int} -- number of rows of one block
+
+        Returns:
+            tensor -- symmetric differences (B, n, n)
+        """
+
+        ctx.save_for_backward(batch_normalized_joint_score, symmetric_label)
+        ctx.block_size = block_size
+
+        seq_len = batch_normalized_joint_score.size(1)
+        blocks = []
+        for st in range(0, seq_len, block_size):
+            ed = min(st + block_size, seq_len)
+            blocks.append(
+                torch.abs(batch_normalized_joint_score[:, st:ed][..., symmetric_label] -
+                          batch_normalized_joint_score[:, :, st:ed][..., symmetric_label].transpose(1, 2)).sum(dim=-1))
+        return torch.cat(blocks, dim=1)
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        """This function propagates backwardly,
+        d(s[x, y] - s[y, x]) = -d(s[y, x] - s[x, y]), so both terms of a pair share the sign
+
+        Arguments:
+            grad_output {tensor} -- gradient of symmetric differences (B, n, n)
+
+        Returns:
+            tensor -- gradient of batch normalized joint score (B, n, n, L)
+        """
+
+        batch_normalized_joint_score, symmetric_label = ctx.saved_tensors
+        block_size = ctx.block_size
+
+        grad_score = torch.zeros_like(batch_normalized_joint_score)
+        seq_len = batch_normalized_joint_score.size(1)
+        for st in range(0, seq_len, block_size):
+            ed = min(st + block_size, seq_len)
+            sign = torch.sign(batch_normalized_joint_score[:, st:ed][..., symmetric_label] -
+                              batch_normalized_joint_score[:, :, st:ed][..., symmetric_label].transpose(1, 2))
+            grad_pair = grad_output[:, st:ed] + grad_output[:, :, st:ed].transpose(1, 2)
+            grad_score[:, st:ed, :, symmetric_label] = sign * grad_pair.unsqueeze(-1)
+        return grad_score, None, None
+
+
+class JointConstraintLoss(nn.Module):
+    """This class computes the implication loss and the symmetric loss of the normalized joint score
+    without the n*n*L sized temporaries: label slices are gathered row block by row block and
+    reduced at once, the implication loss only keeps n*n sized maxima,
+    the symmetric differences are recomputed per block in backward.
+    Both losses are numerically identical to the plain computation.
+    """
+    def __init__(self, ent_label, rel_label, symmetric_label, block_size=32):
+        """This function sets `JointConstraintLoss` parameters
+
+        Arguments:
+            ent_label {tensor} -- entity label ids
+            rel_label {tensor} -- relation label ids
+            symmetric_label {tensor} -- symmetric label ids
+
+        Keyword Arguments:
+            block_size {int} -- number of rows of one block (default: {32})
+        """
+
+        super().__init__()
+        self.ent_label = ent_label
+        self.rel_label = rel_label
+        self.symmetric_label = symmetric_label
+        self.block_size = block_size
+
+    def forward(self, batch_normalized_joint_score, batch_joint_label_matrix_mask):
+        """This function propagates forwardly
+
+        Arguments:
+            batch_normalized_joint_score {tensor} -- batch normalized joint score (B, n, n, L)
+            batch_joint_label_matrix_mask {tensor} -- batch joint label matrix mask (B, n, n)
+
+        Returns:
+            tensor -- implication loss
+            tensor -- symmetric loss
+        """
+
+        return (self.get_implication_loss(batch_normalized_joint_score, batch_joint_label_matrix_mask),
+                self.get_symmetric_loss(batch_normalized_joint_score, batch_joint_label_matrix_mask))
+
+    def get_implication_loss(self, batch_normalized_joint_score, batch_joint_label_matrix_mask):
+        """This function computes the implication loss: the relation score of a pair
+        should not exceed the entity scores of its two tokens
+
+        Arguments:
+            batch_normalized_joint_score {tensor} -- batch normalized joint score (B, n, n, L)
+            batch_joint_label_matrix_mask {tensor} -- batch joint label matrix mask (B, n, n)
+
+        Returns:
+            tensor -- implication loss
+        """
+
+        seq_len = batch_normalized_joint_score.size(1)
+        blocks = []
+        for st in range(0, seq_len, self.block_size):
+            blocks.append(
+                torch.max(batch_normalized_joint_score[:, st:st + self.block_size][..., self.rel_label], dim=-1).values)
+        batch_rel_normalized_joint_score = torch.cat(blocks, dim=1)
+        # the diagonal is taken before gathering entity labels, only n*L scores are gathered
+        batch_diag_ent_normalized_joint_score = torch.max(
+            batch_normalized_joint_score.diagonal(0, 1, 2)[:, self.ent_label],
+            dim=1).values.unsqueeze(-1).expand_as(batch_rel_normalized_joint_score)
+
+        batch_implication_loss = (
+            torch.relu(batch_rel_normalized_joint_score - batch_diag_ent_normalized_joint_score).sum(dim=2) +
+            torch.relu(batch_rel_normalized_joint_score.transpose(1, 2) -
+                       batch_diag_ent_normalized_joint_score).sum(dim=2))
+        return batch_implication_loss[batch_joint_label_matrix_mask[..., 0]].mean()
+
+    def get_symmetric_loss(self, batch_normalized_joint_score, batch_joint_label_matrix_mask):
+        """This function computes the symmetric loss: the scores of symmetric labels
+        should be the same for a pair and its transpose
+
+        Arguments:
+            batch_normalized_joint_score {tensor} -- batch normalized joint score (B, n, n, L)
+            batch_joint_label_matrix_mask {tensor} -- batch joint label matrix mask (B, n, n)
+
+        Returns:
+            tensor -- symmetric loss
+        """
+
+        return SymmetricDifference.apply(batch_normalized_joint_score, self.symmetric_label,
+                                         self.block_size)[batch_joint_label_matrix_mask].mean()
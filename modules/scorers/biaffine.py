@@ -0,0 +1,103 @@
+import torch
+
+
+def biaffine_score(head_repr, U, tail_repr):
+    """This function computes the biaffine scores `head_repr[b, x] U[o] tail_repr[b, y]` of all token pairs,
+    the head representations are projected through `U` by one GEMM, then scored against
+    the tail representations by one batched matmul in label-major (B, x, L, y) layout
+
+    Arguments:
+        head_repr {tensor} -- head representations (B, n, h)
+        U {tensor} -- biaffine weights (L, h, h)
+        tail_repr {tensor} -- tail representations (B, n, h)
+
+    Returns:
+        tensor -- scores (B, n, n, L), a transposed view of the label-major scores, not a copy
+    """
+
+    return score_projected_head(project_head(head_repr, U), tail_repr)
+
+
+def score_projected_head(head_proj, tail_repr):
+    """This function scores the projected head representations against the tail representations by one batched matmul
+
+    Arguments:
+        head_proj {tensor} -- projected head representations (B, n, L, h)
+        tail_repr {tensor} -- tail representations (B, m, h)
+
+    Returns:
+        tensor -- scores (B, n, m, L), a transposed view of the label-major scores, not a copy
+    """
+
+    batch_size, seq_len, num_labels, hidden_size = head_proj.size()
+
+    # (B, n * L, h) x (B, h, m) -> (B, n, L, m)
+    score = torch.bmm(head_proj.reshape(batch_size, seq_len * num_labels, hidden_size), tail_repr.transpose(1, 2))
+    return score.view(batch_size, seq_len, num_labels, tail_repr.size(1)).transpose(2, 3)
+
+
+def project_head(head_repr, U):
+    """This function projects the head representations through the biaffine weights by one GEMM,
+    `head_proj[b, x, o] = head_repr[b, x] U[o]`
+
+    Arguments:
+        head_repr {tensor} -- head representations (B, n, h)
+        U {tensor} -- biaffine weights (L, h, h)
+
+    Returns:
+        tensor -- projected head representations (B, n, L, h)
+    """
+
+    batch_size, seq_len, hidden_size = head_repr.size()
+    num_labels = U.size(0)
+
+    # (B, n, h) x (h, L * h) -> (B, n, L, h)
+    return torch.matmul(head_repr, U.transpose(0, 1).reshape(hidden_size, num_labels * hidden_size)).view(
+        batch_size, seq_len, num_labels, hidden_size)
+
+
+def factorize_biaffine(U, rank):
+    """This function factorizes every label slice of the biaffine weights by truncated SVD,
+    `U[o] ~= head_U[o] tail_U[o]^T`
+
+    Arguments:
+        U {tensor} -- biaffine weights (L, h, h)
+        rank {int} -- rank
+
+    Returns:
+        tensor -- head factors (L, h, rank)
+        tensor -- tail factors (L, h, rank)
+    """
+
+    u, s, vh = torch.linalg.svd(U.double(), full_matrices=False)
+    sqrt_s = s[:, :rank].sqrt().unsqueeze(1)
+    head_U = u[:, :, :rank] * sqrt_s
+    tail_U = vh[:, :rank, :].transpose(1, 2) * sqrt_s
+    return head_U.to(U.dtype), tail_U.to(U.dtype)
+
+
+def low_rank_biaffine_score(head_repr, head_U, tail_U, tail_repr):
+    """This function computes the biaffine scores of all token pairs with factorized weights,
+    the cost of scoring drops from O(n^2 L h) to O(n^2 L rank)
+
+    Arguments:
+        head_repr {tensor} -- head representations (B, n, h)
+        head_U {tensor} -- head factors (L, h, rank)
+        tail_U {tensor} -- tail factors (L, h, rank)
+        tail_repr {tensor} -- tail representations (B, n, h)
+
+    Returns:
+        tensor -- scores (B, n, n, L), a permuted view of the label-major scores, not a copy
+    """
+
+    batch_size, head_len, hidden_size = head_repr.size()
+    tail_len = tail_repr.size(1)
+    num_labels, _, rank = head_U.size()
+
+    # (B, n, h) x (h, L * rank) -> (B, L, n, rank)
+    head_proj = torch.matmul(head_repr, head_U.transpose(0, 1).reshape(hidden_size, num_labels * rank)).view(
+        batch_size, head_len, num_labels, rank).transpose(1, 2)
+    tail_proj = torch.matmul(tail_repr, tail_U.transpose(0, 1).reshape(hidden_size, num_labels * rank)).view(
+        batch_size, tail_len, num_labels, rank).permute(0, 2, 3, 1)
+    # (B, L, n, rank) x (B, L, rank, n) -> (B, L, n, n)
+    return torch.matmul(head_proj, tail_proj).permute(0, 2, 3, 1)
@@ -5,7 +5,7 @@ import torch.nn as nn
 
 from transformers import BertModel
 
-from utils.nn_utils import gelu
+from utils.nn_utils import gelu, set_gradient_checkpointing
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +31,7 @@ class BertEncoder(nn.Module):
         logger.info("Load bert model {} successfully.".format(bert_model_name))
 
         self.output_size = output_size
+        self.trainable = trainable
 
         if trainable:
             logger.info("Start fine-tuning bert model {}.".format(bert_model_name))
@@ -56,6 +57,16 @@ class BertEncoder(nn.Module):
     def get_output_dims(self):
         return self.output_size
 
+    def set_gradient_checkpointing(self, enabled):
+        """This function turns on/off the activation checkpointing of the bert model layers,
+        a fixed bert model stores no activations for backward, so it is never checkpointed
+
+        Arguments:
+            enabled {bool} -- checkpoint layers or not
+        """
+
+        set_gradient_checkpointing(self.bert_model, enabled and self.trainable)
+
     def forward(self, seq_inputs, token_type_inputs=None):
         """forward calculates forward propagation results, get token embedding
 
@@ -5,7 +5,7 @@ import torch.nn as nn
 
 from transformers import AutoModel
 
-from utils.nn_utils import gelu
+from utils.nn_utils import gelu, set_gradient_checkpointing
 from modules.token_embedders.bert_encoder import BertLinear
 
 logger = logging.getLogger(__name__)
@@ -32,6 +32,7 @@ class PretrainedEncoder(nn.Module):
         logger.info("Load pre-trained model {} successfully.".format(pretrained_model_name))
 
         self.output_size = output_size
+        self.trainable = trainable
 
         if trainable:
             logger.info("Start fine-tuning pre-trained model {}.".format(pretrained_model_name))
@@ -57,6 +58,16 @@ class PretrainedEncoder(nn.Module):
     def get_output_dims(self):
         return self.output_size
 
+    def set_gradient_checkpointing(self, enabled):
+        """This function turns on/off the activation checkpointing of the pre-trained model layers,
+        a fixed pre-trained model stores no activations for backward, so it is never checkpointed
+
+        Arguments:
+            enabled {bool} -- checkpoint layers or not
+        """
+
+        set_gradient_checkpointing(self.pretrained_model, enabled and self.trainable)
+
     def forward(self, seq_inputs, token_type_inputs=None):
         """forward calculates forward propagation results, get token embedding
 
@@ -48,6 +48,19 @@ class ConfigurationParer():
         self.parser.add('-ent_rel_file', '--ent_rel_file', type=str, required=False, help='entity and relation file.')
         self.parser.add('-max_sent_len', '--max_sent_len', type=int, default=200, help='max sentence length.')
         self.parser.add('-max_wordpiece_len', '--max_wordpiece_len', type=int, default=512, help='max sentence length.')
+        self.parser.add('-sparse_joint_label',
+                        '--sparse_joint_label',
+                        action='store_true',
+                        help='build joint label matrix from span maps at batch time instead of loading it.')
+        self.parser.add('-compact_storage',
+                        '--compact_storage',
+                        action='store_true',
+                        help='store dataset namespaces as contiguous typed arrays with offsets instead of python lists.')
+        self.parser.add('-dataset_cache_dir',
+                        '--dataset_cache_dir',
+                        type=str,
+                        default=None,
+                        help='directory of compiled (memory-mapped) datasets, keyed by data files and settings.')
         self.parser.add('-test', '--test', action='store_true', help='testing mode')
 
     def add_model_cfgs(self):
@@ -87,6 +100,53 @@ class ConfigurationParer():
                   type=float,
                   default=0.1,
                   help='logit dropout rate for robustness.')
+        group.add('-device_decoding',
+                  '--device_decoding',
+                  action='store_true',
+                  help='run joint decoding on the model device in batched tensor form.')
+        group.add('-biaffine_rank',
+                  '--biaffine_rank',
+                  type=int,
+                  default=0,
+                  help='score with a rank-N truncated SVD of the biaffine weights at inference, '
+                  'trading a little accuracy for speed, 0 means the full weights.')
+        group.add('-candidate_scoring_rank',
+                  '--candidate_scoring_rank',
+                  type=int,
+                  default=0,
+                  help='two-stage inference: find the spans by a rank-N truncated SVD of the biaffine weights, '
+                  'then score the span blocks and the entity pair blocks exactly, 0 means one-stage inference.')
+        group.add('-int8_inference',
+                  '--int8_inference',
+                  action='store_true',
+                  help='apply dynamic int8 quantization to the linear layers of the encoder and the head/tail mlps '
+                  'at inference (cpu only).')
+        group.add('-int8_biaffine',
+                  '--int8_biaffine',
+                  action='store_true',
+                  help='also quantize the biaffine weights to int8 with int8_inference.')
+        group.add('-score_block_size',
+                  '--score_block_size',
+                  type=int,
+                  default=0,
+                  help='score token pairs in blocks of N head tokens, in training the logits, softmax and element loss '
+                  'are computed per block (recomputed in backward) and only the normalized scores are kept, '
+                  'at inference the blocks are decoded as they are scored, so the scores are never kept, '
+                  '0 means scoring all pairs at once.')
+        group.add('-loss_block_size',
+                  '--loss_block_size',
+                  type=int,
+                  default=32,
+                  help='number of rows of one block in the implication and symmetric losses, '
+                  'bounding their temporaries by block_size * n * L scores.')
+        group.add('-gradient_checkpointing',
+                  '--gradient_checkpointing',
+                  type=str,
+                  nargs='+',
+                  choices=['encoder', 'scoring', 'losses'],
+                  default=None,
+                  help='recompute the activations of these blocks in backward instead of storing them: '
+                  'the fine-tuned encoder layers, the biaffine scoring, the element/implication/symmetric losses.')
 
     def add_optimizer_cfgs(self):
         """This function adds optimizer arguments
@@ -174,10 +234,49 @@ class ConfigurationParer():
                   type=int,
                   default=1,
                   help='Number of updates steps to accumulate before performing a backward/update pass.')
+        group.add('-bucket_batching',
+                  '--bucket_batching',
+                  action='store_true',
+                  help='group sentences of similar length into batches (shuffled buckets during training).')
+        group.add('-max_batch_cost',
+                  '--max_batch_cost',
+                  type=int,
+                  default=0,
+                  help='max batch size x max sentence length^2 of a bucketed batch, 0 means no limit.')
+        group.add('-prefetch_batches',
+                  '--prefetch_batches',
+                  type=int,
+                  default=0,
+                  help='number of batches collated and tensorized ahead of the model by a background thread, '
+                  '0 means no prefetching.')
 
         # testing configurations
         group = self.parser.add_argument_group('Testing')
         group.add('-test_batch_size', '--test_batch_size', type=int, default=100, help='batch size during testing.')
+        group.add('-test_instances',
+                  '--test_instances',
+                  type=str,
+                  nargs='+',
+                  choices=['dev', 'test'],
+                  default=['dev', 'test'],
+                  help='data splits evaluated in testing mode, only these splits are read.')
+        group.add('-write_predictions',
+                  '--write_predictions',
+                  action='store_true',
+                  help='write predictions of the evaluated splits in a background thread.')
+        group.add('-prediction_format',
+                  '--prediction_format',
+                  type=str,
+                  nargs='+',
+                  choices=['text', 'columnar'],
+                  default=['text'],
+                  help='formats of written predictions: text (dev.output, test.output) '
+                  'and/or columnar npz shards (dev.predictions, test.predictions).')
+        group.add('-streaming_eval',
+                  '--streaming_eval',
+                  action='store_true',
+                  help='keep only compact sentence outputs without dense label matrices during evaluation, '
+                  'predictions are written without Joint-Label rows.')
         group.add('-validate_every',
                   '--validate_every',
                   type=int,
@@ -191,6 +290,14 @@ class ConfigurationParer():
                   type=int,
                   default=-1,
                   help='cpu: device = -1, gpu: gpu device id(device >= 0).')
+        group.add('-precision',
+                  '--precision',
+                  type=str,
+                  choices=['fp32', 'fp16', 'bf16'],
+                  default='fp32',
+                  help='autocast precision of the encoder, biaffine scoring and losses, '
+                  'softmax and loss reductions stay in fp32, fp16 (gpu only) uses dynamic loss scaling, '
+                  'bf16 also runs on cpu (pytorch >= 1.10).')
 
         # logging configurations
         group = self.parser.add_argument_group('logging')
@@ -217,6 +324,101 @@ class ConfigurationParer():
                   default="NOTSET",
                   help='file logging output level.')
         group.add('-logging_steps', '--logging_steps', type=int, default=10, help='Logging every N update steps.')
+        group.add('-instrument',
+                  '--instrument',
+                  action='store_true',
+                  help='record wall time and peak memory of every phase (data fetch, h2d, encoder, biaffine, '
+                  'losses, backward, optimizer, decoding, evaluation, output writing), '
+                  'cuda kernels are synchronized at phase boundaries.')
+        group.add('-metrics_file',
+                  '--metrics_file',
+                  type=str,
+                  default='metrics.jsonl',
+                  help='instrumentation metrics file in save_dir, one json line per window.')
+        group.add('-metrics_steps',
+                  '--metrics_steps',
+                  type=int,
+                  default=50,
+                  help='log rolling throughput and phase breakdown every N steps.')
+        group.add('-profile_loops',
+                  '--profile_loops',
+                  type=str,
+                  nargs='+',
+                  choices=['train', 'dev', 'test'],
+                  default=None,
+                  help='profile the first run of these loops by torch.profiler, '
+                  'chrome traces and top operators tables are saved into save_dir/profile.')
+        group.add('-profile_wait',
+                  '--profile_wait',
+                  type=int,
+                  default=10,
+                  help='number of steps skipped before profiling.')
+        group.add('-profile_warmup', '--profile_warmup', type=int, default=2, help='number of profiler warmup steps.')
+        group.add('-profile_steps', '--profile_steps', type=int, default=5, help='number of profiled steps.')
+
+    def add_benchmark_cfgs(self):
+        """This function adds benchmark arguments
+        """
+
+        group = self.parser.add_argument_group('Benchmark')
+        group.add('-benchmark_batches',
+                  '--benchmark_batches',
+                  type=int,
+                  default=20,
+                  help='number of timed training batches.')
+        group.add('-benchmark_warmup_batches',
+                  '--benchmark_warmup_batches',
+                  type=int,
+                  default=2,
+                  help='number of untimed training batches before timing.')
+        group.add('-benchmark_file',
+                  '--benchmark_file',
+                  type=str,
+                  default='benchmark.jsonl',
+                  help='benchmark results file in save_dir, one json line is appended every run.')
+
+    def add_predict_cfgs(self):
+        """This function adds standalone predictor arguments
+        """
+
+        group = self.parser.add_argument_group('Predict')
+        group.add('-input_file',
+                  '--input_file',
+                  type=str,
+                  required=True,
+                  help='input file in the processed format (see `data/process.py`), '
+                  'entity and relation mentions are not needed.')
+        group.add('-output_file',
+                  '--output_file',
+                  type=str,
+                  default='predictions.json',
+                  help='prediction file in save_dir, one json line of entity and relation mentions per sentence.')
+        group.add('-runtime',
+                  '--runtime',
+                  type=str,
+                  choices=['torch', 'onnxruntime', 'torchscript'],
+                  default='torch',
+                  help='run the model by torch, or run the exported scoring graph (see `entity_relation_exporter.py`) '
+                  'by onnxruntime or torchscript on cpu.')
+
+    def add_export_cfgs(self):
+        """This function adds scoring graph export arguments
+        """
+
+        group = self.parser.add_argument_group('Export')
+        group.add('-export_formats',
+                  '--export_formats',
+                  type=str,
+                  nargs='+',
+                  choices=['onnx', 'torchscript'],
+                  default=['onnx', 'torchscript'],
+                  help='export the scoring graph to `joint_scorer.onnx` and/or `joint_scorer.pt` in save_dir.')
+        group.add('-onnx_opset_version',
+                  '--onnx_opset_version',
+                  type=int,
+                  default=None,
+                  help='ONNX opset version, 14 if the installed pytorch exports it, else 13 '
+                  '(the highest one of pytorch 1.8) by default.')
 
     def parse_args(self):
         """This function parses arguments and initializes logger
@@ -233,6 +435,8 @@ class ConfigurationParer():
         cfg.best_model_path = os.path.join(cfg.save_dir, 'best_model')
         cfg.last_model_path = os.path.join(cfg.save_dir, 'last_model')
         cfg.vocabulary_file = os.path.join(cfg.save_dir, 'vocabulary.pickle')
+        cfg.onnx_model_path = os.path.join(cfg.save_dir, 'joint_scorer.onnx')
+        cfg.torchscript_model_path = os.path.join(cfg.save_dir, 'joint_scorer.pt')
         cfg.model_checkpoints_dir = os.path.join(cfg.save_dir, 'model_ckpts')
 
         if not os.path.exists(cfg.model_checkpoints_dir):
@@ -2,6 +2,9 @@ from collections import defaultdict
 import logging
 import sys
 
+import numpy as np
+import torch
+
 logger = logging.getLogger(__name__)
 
 
@@ -69,6 +72,19 @@ def eval_file(file_path, eval_metrics):
     for sent in sents:
         evaluate(sent, counts, label2idx)
 
+    return report_all(counts)
+
+
+def report_all(counts):
+    """report_all prints evaluation results of all metrics
+
+    Args:
+        counts (dict): metric -> counters
+
+    Returns:
+        list: f1 score of each metric
+    """
+
     results = []
 
     logger.info("-" * 22 + "START" + "-" * 23)
@@ -84,6 +100,176 @@ def eval_file(file_path, eval_metrics):
     return results
 
 
+class JointEvaluator():
+    """This class evaluates the structured outputs of joint decoding (`step` outputs) batch by batch,
+    counters are the same as `eval_file` on the printed predictions, without writing and parsing the file,
+    the joint label metric is counted from the batch label tensors by `update_joint_label`
+    """
+
+    # joint labels are left empty in sentences, they are counted by `update_joint_label`
+    LABELS = [
+        'Joint-Label-True', 'Joint-Label-Pred', 'Separate-Position-True', 'Separate-Position-Pred', 'Ent-Span-Pred',
+        'Ent-True', 'Ent-Pred', 'Rel-True', 'Rel-Pred'
+    ]
+
+    def __init__(self, vocab, eval_metrics):
+        """This function initializes counters
+
+        Args:
+            vocab (Vocabulary): vocabulary
+            eval_metrics (list): eval metrics
+        """
+
+        self.vocab = vocab
+        self.label2idx = {label: idx for idx, label in enumerate(JointEvaluator.LABELS)}
+        self.counts = {metric: EvalCounts() for metric in eval_metrics}
+        ent_rel_labels = [
+            vocab.get_token_from_index(idx, 'ent_rel_id') for idx in range(vocab.get_vocab_size('ent_rel_id'))
+        ]
+        self.ent_rel_labels = np.array(ent_rel_labels, dtype=object)
+        self.none_idx = vocab.get_token_index('None', 'ent_rel_id')
+
+    def update(self, batch_outputs):
+        """update updates counters (except joint label) with the outputs of one batch
+
+        Args:
+            batch_outputs (list): prediction outputs
+        """
+
+        for sent_output in batch_outputs:
+            evaluate(self.get_sent(sent_output), self.counts, self.label2idx)
+
+    def update_joint_label(self, joint_label_matrix, joint_label_preds, joint_label_matrix_mask):
+        """update_joint_label updates joint label counters with the label tensors of one batch,
+        counts of all (true label, predicted label) pairs in the mask are gathered by one bincount
+        on the tensor device, only the (label size, label size) counts are copied to cpu
+
+        Args:
+            joint_label_matrix (tensor): true joint labels, (batch size, seq len, seq len)
+            joint_label_preds (tensor): predicted joint labels, (batch size, seq len, seq len)
+            joint_label_matrix_mask (tensor): mask, (batch size, seq len, seq len)
+        """
+
+        if 'joint-label' not in self.counts:
+            return
+
+        label_size = len(self.ent_rel_labels)
+        joint_label_matrix = torch.as_tensor(joint_label_matrix)
+        joint_label_preds = torch.as_tensor(joint_label_preds, device=joint_label_matrix.device)
+        joint_label_matrix_mask = torch.as_tensor(joint_label_matrix_mask,
+                                                  dtype=torch.bool,
+                                                  device=joint_label_matrix.device)
+
+        label_pairs = joint_label_matrix[joint_label_matrix_mask].long() * label_size + joint_label_preds[
+            joint_label_matrix_mask].long()
+        label_pair_counts = torch.bincount(label_pairs, minlength=label_size * label_size)
+        self.add_joint_label_counts(label_pair_counts.view(label_size, label_size).cpu().numpy())
+
+    def add_joint_label_counts(self, label_pair_counts):
+        """add_joint_label_counts adds the counts of (true label, predicted label) pairs
+        to joint label counters, the same as counting cell by cell in `evaluate`
+
+        Args:
+            label_pair_counts (numpy.array): pair counts, (label size, label size)
+        """
+
+        counts = self.counts['joint-label']
+        label_pair_counts = np.asarray(label_pair_counts, dtype=np.int64)
+        not_none = np.arange(len(self.ent_rel_labels)) != self.none_idx
+        true_cnts = label_pair_counts.sum(axis=1)
+        pred_cnts = label_pair_counts.sum(axis=0)
+        arc_correct_cnt = int(label_pair_counts[not_none][:, not_none].sum())
+
+        # only touch the type counters which counting cell by cell would create
+        true_cnt, pred_cnt = int(true_cnts[not_none].sum()), int(pred_cnts[not_none].sum())
+        counts.correct_cnt += true_cnt
+        counts.pred_cnt += pred_cnt
+        if true_cnt > 0:
+            counts.correct_types_cnt['Arc'] += true_cnt
+        if pred_cnt > 0:
+            counts.pred_types_cnt['Arc'] += pred_cnt
+        if arc_correct_cnt > 0:
+            counts.pred_correct_types_cnt['Arc'] += arc_correct_cnt
+
+        for label_idx in np.nonzero(not_none & ((true_cnts > 0) | (pred_cnts > 0)))[0]:
+            label = self.ent_rel_labels[label_idx]
+            if true_cnts[label_idx] > 0:
+                counts.correct_types_cnt[label] += int(true_cnts[label_idx])
+            if pred_cnts[label_idx] > 0:
+                counts.pred_types_cnt[label] += int(pred_cnts[label_idx])
+            counts.pred_correct_cnt += int(label_pair_counts[label_idx, label_idx])
+            counts.pred_correct_types_cnt[label] += int(label_pair_counts[label_idx, label_idx])
+
+    def get_sent(self, sent_output):
+        """get_sent converts the output of one sentence to the format parsed by `eval_file`
+
+        Args:
+            sent_output (dict): prediction output of one sentence
+
+        Returns:
+            list: sentence
+        """
+
+        sent = [[] for _ in range(len(self.label2idx))]
+
+        # positions are parsed as strings, an empty line gives `['']`
+        if 'separate_positions' in sent_output:
+            sent[self.label2idx['Separate-Position-True']].append(' '.join(map(
+                str, sent_output['separate_positions'])).split(' '))
+
+        if 'all_separate_position_preds' in sent_output:
+            sent[self.label2idx['Separate-Position-Pred']].append(' '.join(
+                map(str, sent_output['all_separate_position_preds'])).split(' '))
+
+        if 'all_ent_span_preds' in sent_output:
+            for span in sent_output['all_ent_span_preds']:
+                sent[self.label2idx['Ent-Span-Pred']].append(to_span(span))
+
+        if 'span2ent' in sent_output:
+            for span, ent in sent_output['span2ent'].items():
+                ent = self.vocab.get_token_from_index(ent, 'ent_rel_id')
+                sent[self.label2idx['Ent-True']].append([ent, to_span(span)])
+
+        if 'all_ent_preds' in sent_output:
+            for span, ent in sent_output['all_ent_preds'].items():
+                sent[self.label2idx['Ent-Pred']].append([ent, to_span(span)])
+
+        if 'span2rel' in sent_output:
+            for (span1, span2), rel in sent_output['span2rel'].items():
+                rel = self.vocab.get_token_from_index(rel, 'ent_rel_id')
+                if rel[-1] == '<':
+                    span1, span2 = span2, span1
+                sent[self.label2idx['Rel-True']].append([rel, to_span(span1), to_span(span2)])
+
+        if 'all_rel_preds' in sent_output:
+            for (span1, span2), rel in sent_output['all_rel_preds'].items():
+                sent[self.label2idx['Rel-Pred']].append([rel, to_span(span1), to_span(span2)])
+
+        return sent
+
+    def report(self):
+        """report prints evaluation results
+
+        Returns:
+            list: f1 score of each metric
+        """
+
+        return report_all(self.counts)
+
+
+def to_span(span):
+    """to_span converts span to tuple of python int
+
+    Args:
+        span (tuple): span
+
+    Returns:
+        tuple: span
+    """
+
+    return tuple(int(idx) for idx in span)
+
+
 def evaluate(sent, counts, label2idx):
     """evaluate calculates counters
     
@@ -0,0 +1,425 @@
+import os
+import json
+import time
+import resource
+import functools
+import logging
+from contextlib import contextmanager, nullcontext
+
+import torch
+try:
+    from torch import profiler as torch_profiler
+except ImportError:
+    torch_profiler = None
+
+logger = logging.getLogger(__name__)
+
+
+class PhaseTimer():
+    """This class accumulates the wall time of phases,
+    cuda kernels are synchronized before and after every timed call
+    """
+    def __init__(self, device=-1):
+        """This function initializes the timer
+
+        Keyword Arguments:
+            device {int} -- cpu: device = -1, gpu: gpu device id (default: {-1})
+        """
+
+        self.device = device
+        self.phases = {}
+
+    def synchronize(self):
+        if self.device > -1:
+            torch.cuda.synchronize(self.device)
+
+    @contextmanager
+    def time(self, name, items=0):
+        """This function times one call of a phase
+
+        Arguments:
+            name {str} -- phase name
+
+        Keyword Arguments:
+            items {int} -- number of processed items, e.g. sentences (default: {0})
+        """
+
+        self.synchronize()
+        start_time = time.perf_counter()
+        yield
+        self.synchronize()
+        self.add(name, time.perf_counter() - start_time, items)
+
+    def wrap(self, name, func):
+        """This function wraps a function, so that every call is timed as a phase
+
+        Arguments:
+            name {str} -- phase name
+            func {function} -- function
+
+        Returns:
+            function -- timed function
+        """
+
+        def timed_func(*args, **kwargs):
+            with self.time(name):
+                return func(*args, **kwargs)
+
+        return timed_func
+
+    def add(self, name, seconds, items=0):
+        phase = self.phases.setdefault(name, {'seconds': 0.0, 'calls': 0, 'items': 0})
+        phase['seconds'] += seconds
+        phase['calls'] += 1
+        phase['items'] += items
+
+    def get_results(self):
+        """This function gets the results of all phases
+
+        Returns:
+            dict -- phase name to seconds, calls, items and throughput
+        """
+
+        results = {}
+        for name, phase in self.phases.items():
+            results[name] = dict(phase)
+            results[name]['seconds_per_call'] = phase['seconds'] / phase['calls']
+            if phase['items'] > 0:
+                results[name]['items_per_second'] = phase['items'] / phase['seconds'] if phase['seconds'] > 0 else 0.0
+        return results
+
+
+class Instrumentation(PhaseTimer):
+    """This class records the wall time and peak memory (process RSS and cuda allocator)
+    of the phases of the train/dev/test loops, e.g. data fetch, H2D copy, encoder, biaffine, losses,
+    backward, optimizer, decoding and output writing. Every `window_steps` steps (and at `flush`),
+    the rolling sentences/sec and tokens/sec with the phase breakdown of the window are logged
+    and appended to the metrics file as one json line.
+    The first run of every loop in `profile_loops` is profiled by `torch.profiler` for a window of steps,
+    phases and sub-stages are labeled by `record_function` while profiling.
+    A disabled instrumentation only costs an empty context per phase.
+    """
+    def __init__(self,
+                 device=-1,
+                 enabled=True,
+                 metrics_file=None,
+                 window_steps=50,
+                 profile_loops=None,
+                 profile_dir=None,
+                 profile_schedule=(10, 2, 5)):
+        """This function initializes the instrumentation
+
+        Keyword Arguments:
+            device {int} -- cpu: device = -1, gpu: gpu device id (default: {-1})
+            enabled {bool} -- record phases or not (default: {True})
+            metrics_file {str} -- json lines metrics file, None means logging only (default: {None})
+            window_steps {int} -- number of steps of one rolling window (default: {50})
+            profile_loops {list} -- profiled loops: `train`, `dev` or `test` (default: {None})
+            profile_dir {str} -- directory of chrome traces and top operators tables (default: {None})
+            profile_schedule {tuple} -- skipped, warmup and profiled steps of the profiling window
+            (default: {(10, 2, 5)})
+        """
+
+        super().__init__(device)
+        self.enabled = enabled
+        self.metrics_file = metrics_file
+        self.window_steps = window_steps
+        self.profile_loops = set(profile_loops or [])
+        self.profile_dir = profile_dir
+        self.profile_schedule = profile_schedule
+        self.profiler = None
+        self.profiler_loop = None
+        self.profiler_steps = 0
+        self.profiling = False
+        self.reset_window()
+
+    def reset_window(self):
+        self.phases = {}
+        self.mode = None
+        self.steps = 0
+        self.sentences = 0
+        self.tokens = 0
+        self.window_start_time = time.perf_counter()
+
+    def record_function(self, name):
+        """This function labels a code range in the profiler trace while profiling
+
+        Arguments:
+            name {str} -- label
+
+        Returns:
+            context manager -- `record_function` while profiling, otherwise an empty context
+        """
+
+        if self.profiling:
+            return torch.autograd.profiler.record_function(name)
+        return nullcontext()
+
+    @contextmanager
+    def phase(self, name):
+        """This function records the wall time and peak memory of one call of a phase,
+        the RSS high-water mark is reset when the phase is entered (linux), where it can not be reset,
+        the RSS at the end of the phase is recorded instead
+
+        Arguments:
+            name {str} -- phase name
+        """
+
+        if not self.enabled:
+            with self.record_function(name):
+                yield
+            return
+
+        is_peak_rss_reset = reset_peak_rss()
+        if self.device > -1:
+            torch.cuda.reset_peak_memory_stats(self.device)
+        with self.time(name), self.record_function(name):
+            yield
+
+        phase = self.phases[name]
+        if is_peak_rss_reset:
+            phase['peak_rss_mb'] = max(phase.get('peak_rss_mb', 0.0), get_peak_rss_mb())
+        else:
+            phase['rss_mb'] = max(phase.get('rss_mb', 0.0), get_rss_mb())
+        if self.device > -1:
+            phase['peak_cuda_allocated_mb'] = max(phase.get('peak_cuda_allocated_mb', 0.0),
+                                                  torch.cuda.max_memory_allocated(self.device) / 2**20)
+
+    def iterate(self, name, batches):
+        """This function records fetching every batch of a batch generator as a phase
+
+        Arguments:
+            name {str} -- phase name
+            batches {generator} -- (epoch, batch) generator
+
+        Yields:
+            int -- epoch
+            dict -- batch data
+        """
+
+        batches = iter(batches)
+        while True:
+            with self.phase(name):
+                item = next(batches, None)
+            if item is None:
+                return
+            yield item
+
+    def start_loop(self, mode):
+        """This function is called before a train/dev/test loop, it emits the window of the outer loop
+        and starts profiling the first run of a loop in `profile_loops`
+
+        Arguments:
+            mode {str} -- `train`, `dev` or `test`
+        """
+
+        self.flush()
+        if mode not in self.profile_loops or self.profiler is not None:
+            return
+
+        if torch_profiler is None:
+            logger.error("profiling requires torch.profiler (pytorch >= 1.8.1).")
+            raise RuntimeError("profiling requires torch.profiler (pytorch >= 1.8.1).")
+
+        activities = [torch_profiler.ProfilerActivity.CPU]
+        if self.device > -1:
+            activities.append(torch_profiler.ProfilerActivity.CUDA)
+        wait, warmup, active = self.profile_schedule
+        self.profiler = torch_profiler.profile(activities=activities,
+                                               schedule=functools.partial(get_profile_action,
+                                                                          wait=wait,
+                                                                          warmup=warmup,
+                                                                          active=active),
+                                               on_trace_ready=self.save_profile,
+                                               record_shapes=True)
+        self.profiler.__enter__()
+        self.profiler_loop = mode
+        self.profiler_steps = 0
+        self.profiling = True
+        logger.info("Profile {} loop: skip {} steps, warmup {} steps, profile {} steps.".format(
+            mode, wait, warmup, active))
+
+    def end_loop(self, mode):
+        """This function is called after a train/dev/test loop, it emits the window
+        and stops profiling the loop
+
+        Arguments:
+            mode {str} -- `train`, `dev` or `test`
+        """
+
+        self.flush()
+        if self.profiler is not None and self.profiler_loop == mode:
+            self.stop_profiling()
+
+    def stop_profiling(self):
+        """This function stops the profiler, the profiled loop is not profiled again
+        """
+
+        self.profiler.__exit__(None, None, None)
+        self.profile_loops.discard(self.profiler_loop)
+        self.profiler = None
+        self.profiler_loop = None
+        self.profiling = False
+
+    def save_profile(self, profiler):
+        """This function saves the chrome trace and the top operators table of the profiled steps
+
+        Arguments:
+            profiler {torch.profiler.profile} -- profiler
+        """
+
+        if not os.path.exists(self.profile_dir):
+            os.makedirs(self.profile_dir)
+
+        trace_file = os.path.join(self.profile_dir, "{}_trace.json".format(self.profiler_loop))
+        profiler.export_chrome_trace(trace_file)
+
+        sort_by = 'self_cuda_time_total' if self.device > -1 else 'self_cpu_time_total'
+        table_file = os.path.join(self.profile_dir, "{}_top_ops.txt".format(self.profiler_loop))
+        with open(table_file, 'w', encoding='utf-8') as fout:
+            print(profiler.key_averages().table(sort_by=sort_by, row_limit=50), file=fout)
+
+        logger.info("Save {} profile into {} and {} successfully.".format(self.profiler_loop, trace_file, table_file))
+
+    def step(self, mode, batch_inputs):
+        """This function counts one step, and emits the window every `window_steps` steps
+
+        Arguments:
+            mode {str} -- `train`, `dev` or `test`
+            batch_inputs {dict} -- batch input data
+        """
+
+        if self.profiler is not None and self.profiler_loop == mode:
+            self.profiler.step()
+            self.profiler_steps += 1
+            # the profiling window is saved, other loops can be profiled then
+            if self.profiler_steps >= sum(self.profile_schedule):
+                self.stop_profiling()
+
+        if not self.enabled:
+            return
+
+        if self.mode is not None and self.mode != mode:
+            self.flush()
+        self.mode = mode
+        self.steps += 1
+        self.sentences += len(batch_inputs['tokens_lens'])
+        self.tokens += sum(batch_inputs['tokens_lens'])
+        if self.steps >= self.window_steps:
+            self.flush()
+
+    def flush(self):
+        """This function emits the metrics of the current window into the log and the metrics file,
+        then starts a new window
+        """
+
+        if not self.enabled:
+            return
+
+        if self.steps == 0:
+            self.reset_window()
+            return
+
+        seconds = time.perf_counter() - self.window_start_time
+        metrics = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'mode': self.mode,
+            'steps': self.steps,
+            'sentences': self.sentences,
+            'tokens': self.tokens,
+            'seconds': seconds,
+            'sentences_per_second': self.sentences / seconds,
+            'tokens_per_second': self.tokens / seconds,
+            'rss_mb': get_rss_mb(),
+            # the peak of the window is the max of the phase peaks, the peak of the process if they are not recorded
+            'peak_rss_mb': max([phase.get('peak_rss_mb', 0.0) for phase in self.phases.values()] + [0.0])
+            or get_peak_rss_mb(),
+            'phases': self.get_results()
+        }
+        if self.device > -1:
+            metrics['peak_cuda_allocated_mb'] = max(
+                [phase.get('peak_cuda_allocated_mb', 0.0) for phase in self.phases.values()] + [0.0])
+
+        logger.info("{} {} steps: {:.1f} sentences/s {:.1f} tokens/s, peak rss {:.1f} MB, {}.".format(
+            metrics['mode'], metrics['steps'], metrics['sentences_per_second'], metrics['tokens_per_second'],
+            metrics['peak_rss_mb'], ' '.join("{}: {:.3f}s".format(name, phase['seconds'])
+                                             for name, phase in self.phases.items())))
+        if self.metrics_file is not None:
+            with open(self.metrics_file, 'a', encoding='utf-8') as fout:
+                print(json.dumps(metrics), file=fout)
+
+        self.reset_window()
+
+
+def get_profile_action(step, wait, warmup, active):
+    """get_profile_action is the profiler schedule of one profiling window (no repeat)
+
+    Arguments:
+        step {int} -- step
+        wait {int} -- number of skipped steps
+        warmup {int} -- number of warmup steps
+        active {int} -- number of profiled steps
+
+    Returns:
+        torch.profiler.ProfilerAction -- profiler action
+    """
+
+    if step < wait:
+        return torch_profiler.ProfilerAction.NONE
+    if step < wait + warmup:
+        return torch_profiler.ProfilerAction.WARMUP
+    if step < wait + warmup + active - 1:
+        return torch_profiler.ProfilerAction.RECORD
+    if step == wait + warmup + active - 1:
+        return torch_profiler.ProfilerAction.RECORD_AND_SAVE
+    return torch_profiler.ProfilerAction.NONE
+
+
+def get_rss_mb():
+    """This function gets the current resident set size of the process (linux only, 0 otherwise)
+
+    Returns:
+        float -- RSS in MB
+    """
+
+    try:
+        with open('/proc/self/statm', 'r') as fin:
+            return int(fin.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def reset_peak_rss():
+    """This function resets the RSS high-water mark of the process (linux >= 4.0 only)
+
+    Returns:
+        bool -- reset or not
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as fout:
+            fout.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss_mb():
+    """This function gets the peak resident set size of the process since the last `reset_peak_rss`
+    (`VmHWM`), or since the process started if `/proc` is not available
+
+    Returns:
+        float -- peak RSS in MB
+    """
+
+    try:
+        with open('/proc/self/status', 'r') as fin:
+            for line in fin:
+                if line.startswith('VmHWM:'):
+                    # VmHWM is in KB
+                    return int(line.split()[1]) / 2**10
+    except (OSError, ValueError, IndexError):
+        pass
+
+    # ru_maxrss is in KB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
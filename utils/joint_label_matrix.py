@@ -0,0 +1,42 @@
+import numpy as np
+
+
+def build_joint_label_matrix(batch_span2ent, batch_span2rel, batch_seq_lens, none_idx, padding_idx=0):
+    """build_joint_label_matrix builds the batch joint label matrix from entity and relation span maps,
+    which is the same as the dense `jointLabelMatrix` produced by `data/process.py` (relations overwrite
+    entities), each sentence is filled by one gather over a small entity-pair label table
+
+    Args:
+        batch_span2ent (list): batch entity span -> entity label id
+        batch_span2rel (list): batch entity span pair -> relation label id
+        batch_seq_lens (list): batch sequence length
+        none_idx (int): label id of `None`
+        padding_idx (int, optional): label id of padding cells. Defaults to 0.
+
+    Returns:
+        tuple: joint label matrix (np.int64), joint label matrix mask (np.bool_)
+    """
+
+    batch_size = len(batch_seq_lens)
+    max_seq_len = max(batch_seq_lens)
+    joint_label_matrix = np.full((batch_size, max_seq_len, max_seq_len), padding_idx, dtype=np.int64)
+    joint_label_matrix_mask = np.zeros((batch_size, max_seq_len, max_seq_len), dtype=np.bool_)
+
+    for idx, (span2ent, span2rel, seq_len) in enumerate(zip(batch_span2ent, batch_span2rel, batch_seq_lens)):
+        span2idx = {span: ent_idx for ent_idx, span in enumerate(span2ent)}
+        ent_cnt = len(span2idx)
+
+        # the last row/column of the label table stands for tokens outside entities
+        label_table = np.full((ent_cnt + 1, ent_cnt + 1), none_idx, dtype=np.int64)
+        label_table[np.arange(ent_cnt), np.arange(ent_cnt)] = list(span2ent.values())
+        for (span1, span2), rel in span2rel.items():
+            label_table[span2idx[span1], span2idx[span2]] = rel
+
+        token2ent = np.full(seq_len, ent_cnt, dtype=np.int64)
+        for span, ent_idx in span2idx.items():
+            token2ent[span[0]:span[1]] = ent_idx
+
+        joint_label_matrix[idx, :seq_len, :seq_len] = label_table[token2ent[:, None], token2ent[None, :]]
+        joint_label_matrix_mask[idx, :seq_len, :seq_len] = True
+
+    return joint_label_matrix, joint_label_matrix_mask
@@ -1,8 +1,11 @@
+import inspect
 import functools
 import logging
+from contextlib import nullcontext
 
 import torch
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint as torch_checkpoint
 import math
 import numpy as np
 
@@ -314,6 +317,85 @@ def get_conv_vecs(batch_token_repr, span_list, span_batch_size, conv_layer):
     return torch.cat(span_conv_vecs, dim=0)
 
 
+def summed_area_table(score, dtype=np.float64):
+    """This function builds the summed-area table (2D prefix sums) over
+    the first two dimensions of a score block
+
+    Arguments:
+        score {numpy.array} -- score block, shape (n, m, ...)
+
+    Keyword Arguments:
+        dtype {numpy.dtype} -- accumulation dtype (default: {np.float64})
+
+    Returns:
+        numpy.array -- summed-area table, shape (n + 1, m + 1, ...),
+        `sat[i, j]` is the sum of `score[:i, :j]`
+    """
+
+    sat = np.zeros((score.shape[0] + 1, score.shape[1] + 1) + score.shape[2:], dtype=dtype)
+    np.cumsum(score, axis=0, dtype=dtype, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def block_sum(sat, row_st, row_ed, col_st, col_ed):
+    """This function looks up the sums of blocks `[row_st, row_ed) x [col_st, col_ed)`
+    from a summed-area table, index arguments are broadcast against each other
+
+    Arguments:
+        sat {numpy.array} -- summed-area table
+        row_st {numpy.array} -- block row starts
+        row_ed {numpy.array} -- block row ends
+        col_st {numpy.array} -- block column starts
+        col_ed {numpy.array} -- block column ends
+
+    Returns:
+        numpy.array -- block sums
+    """
+
+    return sat[row_ed, col_ed] - sat[row_st, col_ed] - sat[row_ed, col_st] + sat[row_st, col_st]
+
+
+def batched_summed_area_table(batch_score):
+    """This function builds the summed-area tables over the second and third dimensions
+    of a batch of score blocks on their own device, accumulated in float64
+
+    Arguments:
+        batch_score {tensor} -- batch score blocks, shape (batch_size, n, m, ...)
+
+    Returns:
+        tensor -- summed-area tables, shape (batch_size, n + 1, m + 1, ...)
+    """
+
+    batch_size, n, m = batch_score.size()[:3]
+    sat = batch_score.new_zeros((batch_size, n + 1, m + 1) + batch_score.size()[3:], dtype=torch.float64)
+    torch.cumsum(batch_score, dim=1, dtype=torch.float64, out=sat[:, 1:, 1:])
+    sat[:, 1:, 1:] = sat[:, 1:, 1:].cumsum(dim=2)
+    return sat
+
+
+def batched_block_sum(sat, row_st, row_ed, col_st, col_ed):
+    """This function looks up the sums of blocks `[row_st, row_ed) x [col_st, col_ed)`
+    from batched summed-area tables, index arguments have the batch dimension first
+    and are broadcast against each other
+
+    Arguments:
+        sat {tensor} -- summed-area tables, shape (batch_size, n + 1, m + 1, ...)
+        row_st {tensor} -- block row starts
+        row_ed {tensor} -- block row ends
+        col_st {tensor} -- block column starts
+        col_ed {tensor} -- block column ends
+
+    Returns:
+        tensor -- block sums
+    """
+
+    batch_idx = torch.arange(sat.size(0), device=sat.device).view(
+        (-1, ) + (1, ) * (max(row_st.dim(), row_ed.dim(), col_st.dim(), col_ed.dim()) - 1))
+    return (sat[batch_idx, row_ed, col_ed] - sat[batch_idx, row_st, col_ed] - sat[batch_idx, row_ed, col_st] +
+            sat[batch_idx, row_st, col_st])
+
+
 def get_n_trainable_parameters(model):
     """This function calculates the number of trainable parameters
     of the model
@@ -418,3 +500,82 @@ def clone_weights(first_module, second_module):
         first_module.bias.data = torch.nn.functional.pad(first_module.bias.data,
                                                          (0, first_module.weight.shape[0] - first_module.bias.shape[0]),
                                                          'constant', 0)
+
+
+def get_autocast(precision, device):
+    """This function returns the autocast context of the precision
+
+    Arguments:
+        precision {str} -- `fp32`, `fp16` or `bf16`
+        device {int} -- device = -1 if cpu, device >= 0 if gpu
+
+    Returns:
+        context manager -- autocast context, an empty context for `fp32`
+    """
+
+    if precision == 'fp32':
+        return nullcontext()
+
+    dtype = torch.float16 if precision == 'fp16' else torch.bfloat16
+    # device-generic autocast (cpu and bf16) is available since pytorch 1.10
+    if hasattr(torch, 'autocast'):
+        return torch.autocast('cuda' if device > -1 else 'cpu', dtype=dtype)
+    if precision == 'fp16' and device > -1:
+        return torch.cuda.amp.autocast()
+
+    message = "{} autocast on {} is not supported by pytorch {}.".format(precision, 'gpu' if device > -1 else 'cpu',
+                                                                         torch.__version__)
+    logger.error(message)
+    raise RuntimeError(message)
+
+
+def set_gradient_checkpointing(pretrained_model, enabled):
+    """This function turns on/off the activation checkpointing of the layers of a `transformers` model,
+    the activations of every layer are recomputed in backward instead of being stored
+
+    Arguments:
+        pretrained_model {PreTrainedModel} -- `transformers` model
+        enabled {bool} -- checkpoint layers or not
+    """
+
+    # transformers >= 4.11 replaces the config flag with methods
+    if hasattr(pretrained_model, 'gradient_checkpointing_enable'):
+        if enabled:
+            pretrained_model.gradient_checkpointing_enable()
+        else:
+            pretrained_model.gradient_checkpointing_disable()
+    else:
+        pretrained_model.config.gradient_checkpointing = enabled
+
+
+def checkpoint(function, *args):
+    """This function runs a checkpointed block, its activations are recomputed in backward instead of being stored
+
+    Arguments:
+        function {function} -- block
+        args {tensor} -- block inputs
+
+    Returns:
+        tensor -- block outputs
+    """
+
+    # pytorch >= 2.4 warns if `use_reentrant` is not passed, the reentrant variant is the one of pytorch 1.8
+    if 'use_reentrant' in inspect.signature(torch_checkpoint).parameters:
+        return torch_checkpoint(function, *args, use_reentrant=True)
+    return torch_checkpoint(function, *args)
+
+
+def quantize_linear_int8(module):
+    """This function applies dynamic int8 quantization to all linear layers of the module in place,
+    the weights are quantized once with a scale per output channel, the inputs are quantized on the fly,
+    for cpu inference only
+
+    Arguments:
+        module {nn.Module} -- module
+
+    Returns:
+        nn.Module -- quantized module
+    """
+
+    qconfig_spec = {torch.nn.Linear: torch.quantization.per_channel_dynamic_qconfig}
+    return torch.quantization.quantize_dynamic(module, qconfig_spec, dtype=torch.qint8, inplace=True)
@@ -1,3 +1,16 @@
+import os
+import json
+import queue
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COLUMNAR_PREDICTION_VERSION = 1
+
+
 def print_predictions(outputs, file_path, vocab, sequence_label_domain=None):
     """print_predictions prints prediction results
     
@@ -104,66 +117,364 @@ def print_predictions_for_joint_decoding(outputs, file_path, vocab):
 
     with open(file_path, 'w') as fout:
         for sent_output in outputs:
-            seq_len = sent_output['seq_len']
-            assert 'tokens' in sent_output
-            tokens = [vocab.get_token_from_index(token, 'tokens') for token in sent_output['tokens'][:seq_len]]
-            print("Token\t{}".format(' '.join(tokens)), file=fout)
+            print_sent_prediction_for_joint_decoding(sent_output, fout, vocab)
 
-            if 'joint_label_matrix' in sent_output:
-                for row in sent_output['joint_label_matrix'][:seq_len]:
-                    print("Joint-Label-True\t{}".format(' '.join(
-                        [vocab.get_token_from_index(item, 'ent_rel_id') for item in row[:seq_len]])),
-                          file=fout)
 
-            if 'joint_label_preds' in sent_output:
-                for row in sent_output['joint_label_preds'][:seq_len]:
-                    print("Joint-Label-Pred\t{}".format(' '.join(
-                        [vocab.get_token_from_index(item, 'ent_rel_id') for item in row[:seq_len]])),
-                          file=fout)
+def print_sent_prediction_for_joint_decoding(sent_output, fout, vocab):
+    """print_sent_prediction_for_joint_decoding prints prediction results of one sentence
 
-            if 'separate_positions' in sent_output:
-                print("Separate-Position-True\t{}".format(' '.join(map(str, sent_output['separate_positions']))),
-                      file=fout)
+    Args:
+        sent_output (dict): prediction output of one sentence
+        fout (file): output file
+        vocab (Vocabulary): vocabulary
+    """
 
-            if 'all_separate_position_preds' in sent_output:
-                print("Separate-Position-Pred\t{}".format(' '.join(map(str,
-                                                                       sent_output['all_separate_position_preds']))),
-                      file=fout)
+    seq_len = sent_output['seq_len']
+    assert 'tokens' in sent_output
+    tokens = [vocab.get_token_from_index(token, 'tokens') for token in sent_output['tokens'][:seq_len]]
+    print("Token\t{}".format(' '.join(tokens)), file=fout)
 
-            if 'all_ent_span_preds' in sent_output:
-                for span in sent_output['all_ent_span_preds']:
-                    print("Ent-Span-Pred\t{}".format(span), file=fout)
+    if 'joint_label_matrix' in sent_output:
+        for row in sent_output['joint_label_matrix'][:seq_len]:
+            print("Joint-Label-True\t{}".format(' '.join(
+                [vocab.get_token_from_index(item, 'ent_rel_id') for item in row[:seq_len]])),
+                  file=fout)
 
-            if 'span2ent' in sent_output:
-                for span, ent in sent_output['span2ent'].items():
-                    ent = vocab.get_token_from_index(ent, 'ent_rel_id')
-                    assert ent != 'None', "true relation can not be `None`."
+    if 'joint_label_preds' in sent_output:
+        for row in sent_output['joint_label_preds'][:seq_len]:
+            print("Joint-Label-Pred\t{}".format(' '.join(
+                [vocab.get_token_from_index(item, 'ent_rel_id') for item in row[:seq_len]])),
+                  file=fout)
 
-                    print("Ent-True\t{}\t{}\t{}".format(ent, span, ' '.join(tokens[span[0]:span[1]])), file=fout)
+    if 'separate_positions' in sent_output:
+        print("Separate-Position-True\t{}".format(' '.join(map(str, sent_output['separate_positions']))),
+              file=fout)
 
-            if 'all_ent_preds' in sent_output:
-                for span, ent in sent_output['all_ent_preds'].items():
-                    # ent = vocab.get_token_from_index(ent, 'span2ent')
+    if 'all_separate_position_preds' in sent_output:
+        print("Separate-Position-Pred\t{}".format(' '.join(map(str,
+                                                               sent_output['all_separate_position_preds']))),
+              file=fout)
 
-                    print("Ent-Pred\t{}\t{}\t{}".format(ent, span, ' '.join(tokens[span[0]:span[1]])), file=fout)
+    if 'all_ent_span_preds' in sent_output:
+        for span in sent_output['all_ent_span_preds']:
+            print("Ent-Span-Pred\t{}".format(span), file=fout)
 
-            if 'span2rel' in sent_output:
-                for (span1, span2), rel in sent_output['span2rel'].items():
-                    rel = vocab.get_token_from_index(rel, 'ent_rel_id')
-                    assert rel != 'None', "true relation can not be `None`."
+    if 'span2ent' in sent_output:
+        for span, ent in sent_output['span2ent'].items():
+            ent = vocab.get_token_from_index(ent, 'ent_rel_id')
+            assert ent != 'None', "true relation can not be `None`."
 
-                    if rel[-1] == '<':
-                        span1, span2 = span2, span1
-                    print("Rel-True\t{}\t{}\t{}\t{}\t{}".format(rel, span1, span2, ' '.join(tokens[span1[0]:span1[1]]),
-                                                                ' '.join(tokens[span2[0]:span2[1]])),
-                          file=fout)
+            print("Ent-True\t{}\t{}\t{}".format(ent, span, ' '.join(tokens[span[0]:span[1]])), file=fout)
 
-            if 'all_rel_preds' in sent_output:
-                for (span1, span2), rel in sent_output['all_rel_preds'].items():
-                    # rel = vocab.get_token_from_index(rel, 'span2rel')
+    if 'all_ent_preds' in sent_output:
+        for span, ent in sent_output['all_ent_preds'].items():
+            # ent = vocab.get_token_from_index(ent, 'span2ent')
 
-                    print("Rel-Pred\t{}\t{}\t{}\t{}\t{}".format(rel, span1, span2, ' '.join(tokens[span1[0]:span1[1]]),
-                                                                ' '.join(tokens[span2[0]:span2[1]])),
-                          file=fout)
+            print("Ent-Pred\t{}\t{}\t{}".format(ent, span, ' '.join(tokens[span[0]:span[1]])), file=fout)
 
-            print(file=fout)
+    if 'span2rel' in sent_output:
+        for (span1, span2), rel in sent_output['span2rel'].items():
+            rel = vocab.get_token_from_index(rel, 'ent_rel_id')
+            assert rel != 'None', "true relation can not be `None`."
+
+            if rel[-1] == '<':
+                span1, span2 = span2, span1
+            print("Rel-True\t{}\t{}\t{}\t{}\t{}".format(rel, span1, span2, ' '.join(tokens[span1[0]:span1[1]]),
+                                                        ' '.join(tokens[span2[0]:span2[1]])),
+                  file=fout)
+
+    if 'all_rel_preds' in sent_output:
+        for (span1, span2), rel in sent_output['all_rel_preds'].items():
+            # rel = vocab.get_token_from_index(rel, 'span2rel')
+
+            print("Rel-Pred\t{}\t{}\t{}\t{}\t{}".format(rel, span1, span2, ' '.join(tokens[span1[0]:span1[1]]),
+                                                        ' '.join(tokens[span2[0]:span2[1]])),
+                  file=fout)
+
+    print(file=fout)
+
+
+class PredictionWriter():
+    """This class prints prediction results of joint decoding into a file in a background thread,
+    batches are queued (bounded) by `write` and printed in order
+    """
+    def __init__(self,
+                 file_path,
+                 vocab,
+                 max_queue_size=16,
+                 print_sent_prediction=print_sent_prediction_for_joint_decoding):
+        """This function opens the output file and starts the background thread
+
+        Arguments:
+            file_path {str} -- output file path
+            vocab {Vocabulary} -- vocabulary
+
+        Keyword Arguments:
+            max_queue_size {int} -- max number of queued batches (default: {16})
+            print_sent_prediction {function} -- function printing one sentence
+            (default: {print_sent_prediction_for_joint_decoding})
+        """
+
+        self.fout = open(file_path, 'w')
+        self.vocab = vocab
+        self.print_sent_prediction = print_sent_prediction
+        self.start(max_queue_size)
+
+    def start(self, max_queue_size):
+        """This function starts the background thread
+
+        Arguments:
+            max_queue_size {int} -- max number of queued batches
+        """
+
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, batch_outputs):
+        """This function queues the prediction outputs of one batch
+
+        Arguments:
+            batch_outputs {list} -- prediction outputs
+        """
+
+        self.queue.put(batch_outputs)
+
+    def run(self):
+        """This function runs in the background thread until `close`
+        """
+
+        while True:
+            batch_outputs = self.queue.get()
+            if batch_outputs is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.write_batch(batch_outputs)
+            except Exception as e:
+                logger.error("Printing predictions failed: {}.".format(e))
+                self.error = e
+
+    def write_batch(self, batch_outputs):
+        """This function prints the prediction outputs of one batch, called in the background thread
+
+        Arguments:
+            batch_outputs {list} -- prediction outputs
+        """
+
+        for sent_output in batch_outputs:
+            self.print_sent_prediction(sent_output, self.fout, self.vocab)
+
+    def finish(self):
+        """This function closes the output after all batches are printed
+        """
+
+        self.fout.close()
+
+    def close(self):
+        """This function waits for the queued batches to be printed and closes the output
+        """
+
+        self.queue.put(None)
+        self.thread.join()
+        self.finish()
+        if self.error is not None:
+            raise self.error
+
+
+class ColumnarPredictionWriter(PredictionWriter):
+    """This class writes prediction results of joint decoding into a directory of `.npz` shards
+    in a background thread, each shard keeps the flat columns of up to `shard_size` sentences:
+    `sent_ids` (sample index in the dataset instance), `seq_lens`, and for both `pred` and `true`:
+    `{prefix}_sep_offsets`, `{prefix}_sep_positions`,
+    `{prefix}_ent_offsets`, `{prefix}_ent_st`, `{prefix}_ent_ed`, `{prefix}_ent_label`,
+    `{prefix}_rel_offsets`, `{prefix}_rel_st1`, `{prefix}_rel_ed1`, `{prefix}_rel_st2`, `{prefix}_rel_ed2`,
+    `{prefix}_rel_label`, plus `pred_ent_score` and `pred_rel_score` (NaN if the decoder gives no score).
+    Offsets index the entities (relations, separate positions) of every sentence in the shard,
+    labels are `ent_rel_id` indices (relation direction is kept in the label, as in `span2rel`),
+    and `meta.json` keeps the label names and the shard list
+    """
+
+    SPAN_COLUMNS = {'sep': ['positions'], 'ent': ['st', 'ed', 'label'], 'rel': ['st1', 'ed1', 'st2', 'ed2', 'label']}
+
+    def __init__(self, output_dir, vocab, shard_size=100000, max_queue_size=16):
+        """This function creates the output directory and starts the background thread
+
+        Arguments:
+            output_dir {str} -- output directory
+            vocab {Vocabulary} -- vocabulary
+
+        Keyword Arguments:
+            shard_size {int} -- max number of sentences in one shard (default: {100000})
+            max_queue_size {int} -- max number of queued batches (default: {16})
+        """
+
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        self.output_dir = output_dir
+        self.vocab = vocab
+        self.shard_size = shard_size
+        self.shards = []
+        self.reset_columns()
+        self.start(max_queue_size)
+
+    def reset_columns(self):
+        """This function clears the buffered columns of the current shard
+        """
+
+        self.columns = {'sent_ids': [], 'seq_lens': [], 'pred_ent_score': [], 'pred_rel_score': []}
+        for prefix in ['pred', 'true']:
+            for kind, names in self.SPAN_COLUMNS.items():
+                self.columns['{}_{}_offsets'.format(prefix, kind)] = [0]
+                for name in names:
+                    self.columns['{}_{}_{}'.format(prefix, kind, name)] = []
+
+    def write_batch(self, batch_outputs):
+        """This function appends the prediction outputs of one batch to the buffered columns,
+        called in the background thread
+
+        Arguments:
+            batch_outputs {list} -- prediction outputs
+        """
+
+        for sent_output in batch_outputs:
+            self.columns['sent_ids'].append(sent_output['sample_id'])
+            self.columns['seq_lens'].append(sent_output['seq_len'])
+
+            ent_scores = sent_output.get('all_ent_scores', {})
+            rel_scores = sent_output.get('all_rel_scores', {})
+            for span, ent in sent_output['all_ent_preds'].items():
+                self.columns['pred_ent_score'].append(ent_scores.get(span, np.nan))
+            for spans, rel in sent_output['all_rel_preds'].items():
+                self.columns['pred_rel_score'].append(rel_scores.get(spans, np.nan))
+
+            self.append_spans('pred', sent_output['all_separate_position_preds'], {
+                span: self.vocab.get_token_index(ent, 'ent_rel_id')
+                for span, ent in sent_output['all_ent_preds'].items()
+            }, {spans: self.vocab.get_token_index(rel, 'ent_rel_id')
+                for spans, rel in sent_output['all_rel_preds'].items()})
+            self.append_spans('true', sent_output['separate_positions'], sent_output['span2ent'],
+                              sent_output['span2rel'])
+
+            if len(self.columns['sent_ids']) >= self.shard_size:
+                self.save_shard()
+
+    def append_spans(self, prefix, separate_positions, span2ent, span2rel):
+        """This function appends the separate positions, entities and relations of one sentence
+
+        Arguments:
+            prefix {str} -- `pred` or `true`
+            separate_positions {list} -- separate positions
+            span2ent {dict} -- entity span to label index
+            span2rel {dict} -- relation span pair to label index
+        """
+
+        columns = self.columns
+        columns[prefix + '_sep_positions'].extend(separate_positions)
+        for (st, ed), ent in span2ent.items():
+            columns[prefix + '_ent_st'].append(st)
+            columns[prefix + '_ent_ed'].append(ed)
+            columns[prefix + '_ent_label'].append(ent)
+        for ((st1, ed1), (st2, ed2)), rel in span2rel.items():
+            columns[prefix + '_rel_st1'].append(st1)
+            columns[prefix + '_rel_ed1'].append(ed1)
+            columns[prefix + '_rel_st2'].append(st2)
+            columns[prefix + '_rel_ed2'].append(ed2)
+            columns[prefix + '_rel_label'].append(rel)
+
+        columns[prefix + '_sep_offsets'].append(len(columns[prefix + '_sep_positions']))
+        columns[prefix + '_ent_offsets'].append(len(columns[prefix + '_ent_st']))
+        columns[prefix + '_rel_offsets'].append(len(columns[prefix + '_rel_st1']))
+
+    def save_shard(self):
+        """This function saves the buffered columns as one shard
+        """
+
+        if len(self.columns['sent_ids']) == 0:
+            return
+
+        arrays = {}
+        for name, column in self.columns.items():
+            if name.endswith('_score'):
+                arrays[name] = np.array(column, dtype=np.float32)
+            elif name.endswith('_offsets') or name == 'sent_ids':
+                arrays[name] = np.array(column, dtype=np.int64)
+            else:
+                arrays[name] = np.array(column, dtype=np.int32)
+
+        file_name = "part-{:05d}.npz".format(len(self.shards))
+        np.savez(os.path.join(self.output_dir, file_name), **arrays)
+        self.shards.append({'file': file_name, 'num_sents': len(self.columns['sent_ids'])})
+        self.reset_columns()
+
+    def finish(self):
+        """This function saves the last shard and the meta file
+        """
+
+        self.save_shard()
+        meta = {
+            'version': COLUMNAR_PREDICTION_VERSION,
+            'labels': [
+                self.vocab.get_token_from_index(idx, 'ent_rel_id')
+                for idx in range(self.vocab.get_vocab_size('ent_rel_id'))
+            ],
+            'num_sents': sum(shard['num_sents'] for shard in self.shards),
+            'shards': self.shards
+        }
+        with open(os.path.join(self.output_dir, 'meta.json'), 'w', encoding='utf-8') as fout:
+            json.dump(meta, fout)
+        logger.info("Save {} predictions into {} successfully.".format(meta['num_sents'], self.output_dir))
+
+    def close(self):
+        """This function waits for the queued batches to be written and saves the last shard
+        """
+
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        self.finish()
+
+
+def load_columnar_predictions(output_dir):
+    """This function loads the prediction shards written by `ColumnarPredictionWriter`
+    into concatenated columns, offsets are rebased onto the concatenated arrays
+
+    Arguments:
+        output_dir {str} -- output directory
+
+    Returns:
+        dict -- columns, and `labels` (label names of `ent_rel_id` indices)
+    """
+
+    with open(os.path.join(output_dir, 'meta.json'), 'r', encoding='utf-8') as fin:
+        meta = json.load(fin)
+
+    if meta['version'] != COLUMNAR_PREDICTION_VERSION:
+        logger.error("prediction file {} version {} is not supported.".format(output_dir, meta['version']))
+        raise RuntimeError("prediction file {} version {} is not supported.".format(output_dir, meta['version']))
+
+    shards = []
+    for shard in meta['shards']:
+        with np.load(os.path.join(output_dir, shard['file'])) as arrays:
+            shards.append({name: arrays[name] for name in arrays.files})
+
+    predictions = {'labels': meta['labels']}
+    if len(shards) == 0:
+        return predictions
+
+    for name in shards[0]:
+        if name.endswith('_offsets'):
+            # drop the leading zero of every following shard and shift by the preceding shards
+            prefix, kind, _ = name.split('_')
+            values_name = '{}_{}_{}'.format(prefix, kind, ColumnarPredictionWriter.SPAN_COLUMNS[kind][0])
+            bases = np.cumsum([0] + [len(shard[values_name]) for shard in shards[:-1]])
+            predictions[name] = np.concatenate([shards[0][name]] +
+                                               [shard[name][1:] + base for shard, base in zip(shards[1:], bases[1:])])
+        else:
+            predictions[name] = np.concatenate([shard[name] for shard in shards])
+
+    return predictions